@@ -0,0 +1,382 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+from datetime import datetime
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from calc import (
+    RelatorioQualidade,
+    combinar_icms,
+    icms_por_mes,
+    padronizar_colunas,
+    parse_datas_series,
+    preparar_com_qualidade,
+    realizado_por_mes,
+)
+from sqlite_util import conectar
+
+# ============================================================
+# Agregados mensais com impressão digital por yyyymm (ingestão delta)
+# ============================================================
+CAMINHO_PADRAO = "agregados.sqlite"
+
+# Colunas (padronizadas) que identificam o conteúdo de uma nota para a impressão digital
+COLUNAS_CHAVE: Tuple[str, ...] = (
+    "chave_xml", "item", "numero_nf", "data_emissao",
+    "tipo_nota", "classificacao", "natureza_operacao", "valor_total",
+)
+
+_MASCARA_64 = (1 << 64) - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agregados (
+    empresa       TEXT    NOT NULL,
+    yyyymm        INTEGER NOT NULL,
+    fingerprint   TEXT    NOT NULL,
+    n_notas       INTEGER NOT NULL,
+    FAT           REAL    NOT NULL,
+    COMPRAS       REAL    NOT NULL,
+    LAT           REAL    NOT NULL,
+    atualizado_em TEXT    NOT NULL,
+    PRIMARY KEY (empresa, yyyymm)
+)
+"""
+
+# Hash de cada nota armazenada (int64 com o mesmo padrão de bits do uint64 de
+# hash_notas): permite descartar notas de um delta que já estão no armazenamento
+_SCHEMA_NOTAS = """
+CREATE TABLE IF NOT EXISTS notas (
+    empresa TEXT    NOT NULL,
+    yyyymm  INTEGER NOT NULL,
+    hash    INTEGER NOT NULL
+)
+"""
+_INDICE_NOTAS = "CREATE INDEX IF NOT EXISTS ix_notas_empresa_mes ON notas (empresa, yyyymm)"
+
+
+def hash_notas(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Para cada linha de notas, retorna (yyyymm, hash uint64 das colunas-chave).
+    Só converte data e colunas-chave (sem parse de BRL nem normalização textual),
+    então é bem mais barato que prepare_dataframe. Linhas sem data válida têm yyyymm = 0.
+    """
+    df = padronizar_colunas(df)
+    datas = parse_datas_series(df["data_emissao"] if "data_emissao" in df.columns else pd.Series(np.nan, index=df.index))
+    yyyymm = (datas.dt.year * 100 + datas.dt.month).fillna(0).astype(np.int64).to_numpy()
+    chaves = pd.DataFrame({c: (df[c] if c in df.columns else "") for c in COLUNAS_CHAVE}, index=df.index).astype(str)
+    hashes = pd.util.hash_pandas_object(chaves, index=False).to_numpy(dtype=np.uint64)
+    return yyyymm, hashes
+
+
+def fingerprints_por_mes(yyyymm: np.ndarray, hashes: np.ndarray) -> Dict[int, Tuple[int, int]]:
+    """
+    Impressão digital por mês: soma dos hashes das linhas (mod 2^64) + nº de linhas.
+    A soma independe da ordem das linhas e é aditiva: fp(arquivo + delta) = fp(arquivo) + fp(delta).
+    """
+    if yyyymm.size == 0:
+        return {}
+    ordem = np.argsort(yyyymm, kind="stable")
+    ymm_ord = yyyymm[ordem]
+    inicio = np.flatnonzero(np.r_[True, ymm_ord[1:] != ymm_ord[:-1]])
+    with np.errstate(over="ignore"):
+        somas = np.add.reduceat(hashes[ordem], inicio)  # uint64: estoura em módulo 2^64
+    contagens = np.diff(np.r_[inicio, ymm_ord.size])
+    return {
+        int(ymm_ord[i]): (int(fp), int(n))
+        for i, fp, n in zip(inicio, somas, contagens)
+        if ymm_ord[i] != 0
+    }
+
+
+def _agregar(
+    df: pd.DataFrame,
+    preparado: Optional[pd.DataFrame],
+    linhas: np.ndarray,
+    meses: List[int],
+) -> Dict[int, Dict[str, float]]:
+    """
+    realizado_por_mes das linhas selecionadas (máscara posicional), reaproveitando 'preparado' se houver.
+    'preparado' alinhado a df usa a mesma máscara; mais curto, é só das linhas dos meses a agregar.
+    """
+    if preparado is not None:
+        if len(preparado) != len(df):
+            return realizado_por_mes(preparado, meses=meses, preparado=True)
+        return realizado_por_mes(preparado[linhas], meses=meses, preparado=True)
+    return realizado_por_mes(df[linhas], meses=meses)
+
+
+class AgregadoStore:
+    """
+    Guarda FAT/COMPRAS/LAT por empresa e yyyymm junto da impressão digital do mês.
+    - atualizar(): recebe uma nova versão completa do arquivo e só reprocessa
+      (normaliza + agrega) os meses cuja impressão digital mudou.
+    - anexar_delta(): soma notas novas aos meses afetados sem reler o restante.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_PADRAO) -> None:
+        self.caminho = caminho
+        with conectar(self.caminho) as con:
+            con.execute(_SCHEMA)
+            con.execute(_SCHEMA_NOTAS)
+            con.execute(_INDICE_NOTAS)
+
+    def fingerprints(self, empresa: str) -> Dict[int, Tuple[int, int]]:
+        with conectar(self.caminho) as con:
+            rows = con.execute(
+                "SELECT yyyymm, fingerprint, n_notas FROM agregados WHERE empresa=?", (empresa,)
+            ).fetchall()
+        return {int(m): (int(fp, 16), int(n)) for m, fp, n in rows}
+
+    def _gravar(self, con: sqlite3.Connection, empresa: str, yyyymm: int, fp: Tuple[int, int], valores: Dict[str, float]) -> None:
+        con.execute(
+            "INSERT OR REPLACE INTO agregados (empresa, yyyymm, fingerprint, n_notas, FAT, COMPRAS, LAT, atualizado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                empresa, int(yyyymm), f"{fp[0] & _MASCARA_64:016x}", int(fp[1]),
+                float(valores["FAT"]), float(valores["COMPRAS"]), float(valores["LAT"]),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+    def _gravar_hashes(self, con: sqlite3.Connection, empresa: str, yyyymm: int, hashes: np.ndarray) -> None:
+        con.execute("DELETE FROM notas WHERE empresa=? AND yyyymm=?", (empresa, int(yyyymm)))
+        con.executemany(
+            "INSERT INTO notas (empresa, yyyymm, hash) VALUES (?, ?, ?)",
+            ((empresa, int(yyyymm), int(h)) for h in hashes.view(np.int64)),
+        )
+
+    def _contagem_hashes(self, empresa: str) -> Dict[int, int]:
+        with conectar(self.caminho) as con:
+            rows = con.execute("SELECT yyyymm, COUNT(*) FROM notas WHERE empresa=? GROUP BY yyyymm", (empresa,)).fetchall()
+        return {int(m): int(n) for m, n in rows}
+
+    def hashes(self, empresa: str, meses: Sequence[int]) -> np.ndarray:
+        """Hashes (uint64) das notas armazenadas da empresa nos meses pedidos."""
+        months = [int(m) for m in meses]
+        if not months:
+            return np.zeros(0, dtype=np.uint64)
+        with conectar(self.caminho) as con:
+            rows = con.execute(
+                f"SELECT hash FROM notas WHERE empresa=? AND yyyymm IN ({','.join('?' * len(months))})",
+                (empresa, *months),
+            ).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)).view(np.uint64)
+
+    def notas_novas(self, empresa: str, delta: pd.DataFrame) -> np.ndarray:
+        """
+        Máscara das linhas de 'delta' ainda não armazenadas: descarta notas já gravadas
+        (mesmo hash de hash_notas) e repetições dentro do próprio delta.
+        """
+        yyyymm, hashes = hash_notas(delta)
+        guardados = self.hashes(empresa, np.unique(yyyymm[yyyymm != 0]).tolist())
+        repetida = pd.Series(hashes).duplicated().to_numpy()
+        return ~np.isin(hashes, guardados) & ~repetida
+
+    def atualizar(
+        self,
+        empresa: str,
+        df: pd.DataFrame,
+        preparado: Optional[pd.DataFrame] = None,
+        notas_hash: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> List[int]:
+        """
+        Sincroniza com uma nova versão completa das notas. Retorna os meses reprocessados.
+        Meses removidos do arquivo são apagados; meses inalterados não são tocados.
+        'preparado' = prepare_dataframe já calculado pelo chamador, de df inteiro (mesmas
+        linhas, mesma ordem) ou só das linhas dos meses que mudaram: esses meses são
+        agregados dele, sem normalizar de novo. 'notas_hash' = hash_notas(df), se já calculado.
+        """
+        yyyymm, hashes = notas_hash if notas_hash is not None else hash_notas(df)
+        novos = fingerprints_por_mes(yyyymm, hashes)
+        atuais = self.fingerprints(empresa)
+        mudaram = sorted(m for m in set(novos) | set(atuais) if novos.get(m) != atuais.get(m))
+        # Meses gravados antes da tabela de hashes: só regrava os hashes (sem reagregar)
+        contagem = self._contagem_hashes(empresa)
+        sem_hashes = [m for m in novos if m not in mudaram and contagem.get(m, 0) != novos[m][1]]
+        if not mudaram and not sem_hashes:
+            return []
+
+        presentes = [m for m in mudaram if m in novos]
+        valores = _agregar(df, preparado, np.isin(yyyymm, presentes), presentes) if presentes else {}
+        with conectar(self.caminho) as con:
+            for m in mudaram:
+                if m in novos:
+                    self._gravar(con, empresa, m, novos[m], valores[m])
+                else:
+                    con.execute("DELETE FROM agregados WHERE empresa=? AND yyyymm=?", (empresa, m))
+                    con.execute("DELETE FROM notas WHERE empresa=? AND yyyymm=?", (empresa, m))
+            for m in presentes + sem_hashes:
+                self._gravar_hashes(con, empresa, m, hashes[yyyymm == m])
+        return mudaram
+
+    def anexar_delta(self, empresa: str, delta: pd.DataFrame, preparado: Optional[pd.DataFrame] = None) -> List[int]:
+        """
+        Soma notas novas (delta) aos meses afetados. Retorna os meses atualizados.
+        Notas já armazenadas (ou repetidas no delta) são ignoradas: reenviar o mesmo
+        lote, ou um lote que se sobrepõe à planilha base, não conta a nota duas vezes.
+        'preparado' tem o mesmo papel que em atualizar().
+        """
+        novas = self.notas_novas(empresa, delta)
+        yyyymm, hashes = hash_notas(delta)
+        yyyymm = np.where(novas, yyyymm, 0)   # linhas descartadas ficam fora de qualquer mês
+        fps_delta = fingerprints_por_mes(yyyymm, hashes)
+        if not fps_delta:
+            return []
+        meses = sorted(fps_delta)
+        valores_delta = _agregar(delta, preparado, yyyymm != 0, meses)
+        atuais = self.fingerprints(empresa)
+        base = self.realizado(empresa, meses)
+        with conectar(self.caminho) as con:
+            for m in meses:
+                fp_old, n_old = atuais.get(m, (0, 0))
+                fp_d, n_d = fps_delta[m]
+                somado = {k: base[m][k] + valores_delta[m][k] for k in ("FAT", "COMPRAS", "LAT")}
+                self._gravar(con, empresa, m, ((fp_old + fp_d) & _MASCARA_64, n_old + n_d), somado)
+                con.executemany(
+                    "INSERT INTO notas (empresa, yyyymm, hash) VALUES (?, ?, ?)",
+                    ((empresa, m, int(h)) for h in hashes[yyyymm == m].view(np.int64)),
+                )
+        return meses
+
+    def realizado(self, empresa: str, meses: Optional[Sequence[int]] = None, ano: int = 2025) -> Dict[int, Dict[str, float]]:
+        """Mesmo formato de realizado_por_mes, lido do armazenamento (meses ausentes = 0)."""
+        months = [int(m) for m in meses] if meses is not None else [ano * 100 + m for m in range(1, 13)]
+        with conectar(self.caminho) as con:
+            rows = con.execute(
+                f"SELECT yyyymm, FAT, COMPRAS, LAT FROM agregados WHERE empresa=? AND yyyymm IN ({','.join('?' * len(months))})",
+                (empresa, *months),
+            ).fetchall()
+        out = {m: {"FAT": 0.0, "COMPRAS": 0.0, "LAT": 0.0} for m in months}
+        for m, fat, compras, lat in rows:
+            out[int(m)] = {"FAT": float(fat), "COMPRAS": float(compras), "LAT": float(lat)}
+        return out
+
+    def mes_vigente(self, empresa: str) -> int:
+        """Maior yyyymm da empresa com FAT > 0 (0 se não houver nenhum)."""
+        with conectar(self.caminho) as con:
+            row = con.execute("SELECT MAX(yyyymm) FROM agregados WHERE empresa=? AND FAT > 0", (empresa,)).fetchone()
+        return int(row[0]) if row and row[0] is not None else 0
+
+    def empresas(self) -> List[str]:
+        """Empresas com algum mês armazenado, em ordem alfabética."""
+        with conectar(self.caminho) as con:
+            rows = con.execute("SELECT DISTINCT empresa FROM agregados ORDER BY empresa").fetchall()
+        return [r[0] for r in rows]
+
+    def meses_por_empresa(self, empresas: Optional[Sequence[str]] = None) -> Dict[str, List[int]]:
+        """{empresa: [yyyymm armazenados]} numa única consulta (padrão: todas as empresas)."""
+        with conectar(self.caminho) as con:
+            rows = con.execute("SELECT empresa, yyyymm FROM agregados ORDER BY empresa, yyyymm").fetchall()
+        out: Dict[str, List[int]] = {e: [] for e in empresas} if empresas is not None else {}
+        for e, m in rows:
+            if empresas is None or e in out:
+                out.setdefault(e, []).append(int(m))
+        return out
+
+    def matriz(self, meses: Sequence[int], empresas: Optional[Sequence[str]] = None) -> Tuple[List[str], Dict[str, np.ndarray]]:
+        """
+        FAT/COMPRAS/LAT de várias empresas numa única consulta, como matrizes
+        (n_empresas, n_meses) alinhadas a 'meses' (ausentes = 0).
+        Sem 'empresas', usa todas as do armazenamento.
+        """
+        months = [int(m) for m in meses]
+        nomes = list(empresas) if empresas is not None else self.empresas()
+        out = {c: np.zeros((len(nomes), len(months)), dtype=float) for c in ("FAT", "COMPRAS", "LAT")}
+        if not nomes or not months:
+            return nomes, out
+        with conectar(self.caminho) as con:
+            rows = con.execute(
+                f"SELECT empresa, yyyymm, FAT, COMPRAS, LAT FROM agregados "
+                f"WHERE empresa IN ({','.join('?' * len(nomes))}) AND yyyymm IN ({','.join('?' * len(months))})",
+                (*nomes, *months),
+            ).fetchall()
+        if rows:
+            pos_emp = {e: i for i, e in enumerate(nomes)}
+            pos_mes = {m: j for j, m in enumerate(months)}
+            i = np.fromiter((pos_emp[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+            j = np.fromiter((pos_mes[int(r[1])] for r in rows), dtype=np.int64, count=len(rows))
+            valores = np.array([r[2:] for r in rows], dtype=float)
+            for k, c in enumerate(("FAT", "COMPRAS", "LAT")):
+                out[c][i, j] = valores[:, k]
+        return nomes, out
+
+
+# ============================================================
+# Ingestão de uma versão do arquivo (agregados + qualidade + ICMS)
+# ============================================================
+@dataclass
+class Ingestao:
+    """
+    Estado derivado de uma versão das notas de uma empresa.
+    fingerprints/hashes descrevem a versão ingerida (hashes[i] = nota da linha i,
+    a mesma numeração das amostras de 'qualidade').
+    """
+    qualidade: RelatorioQualidade
+    icms: pd.DataFrame
+    fingerprints: Dict[int, Tuple[int, int]]
+    hashes: np.ndarray
+    meses_reprocessados: List[int]
+
+
+def _nova_posicao(hashes_antigos: np.ndarray, linhas: np.ndarray, hashes_novos: np.ndarray) -> np.ndarray:
+    """Linha, na nova versão, da primeira nota com o mesmo hash de cada linha antiga (-1 se sumiu)."""
+    primeira = pd.Series(np.arange(hashes_novos.size), index=hashes_novos)
+    primeira = primeira[~primeira.index.duplicated()]
+    pos = primeira.reindex(hashes_antigos[np.asarray(linhas, dtype=np.int64)]).to_numpy()
+    return np.where(np.isnan(pos), -1, pos).astype(np.int64)
+
+
+def ingerir(store: AgregadoStore, empresa: str, df: pd.DataFrame, anterior: Optional[Ingestao] = None) -> Ingestao:
+    """
+    Ingestão de uma versão completa das notas. Só as linhas dos meses cuja impressão
+    digital difere da versão anterior (ou do armazenamento) são normalizadas,
+    validadas e reagregadas; os demais meses reaproveitam qualidade e ICMS de
+    'anterior'. Sem 'anterior' (primeira carga da sessão), normaliza tudo.
+    Linhas sem data (mês 0) são sempre revalidadas: não entram em nenhuma impressão digital.
+    """
+    yyyymm, hashes = hash_notas(df)
+    novos = fingerprints_por_mes(yyyymm, hashes)
+    if anterior is None:
+        refazer = sorted(novos)
+    else:
+        atuais = store.fingerprints(empresa)
+        meses = set(novos) | set(anterior.fingerprints) | set(atuais)
+        refazer = sorted(m for m in meses if not (novos.get(m) == anterior.fingerprints.get(m) == atuais.get(m)))
+
+    linhas = np.isin(yyyymm, [0, *refazer])
+    preparado, qualidade = preparar_com_qualidade(df[linhas])
+    store.atualizar(empresa, df, preparado=preparado, notas_hash=(yyyymm, hashes))
+    icms = icms_por_mes(preparado, preparado=True)
+    if anterior is not None:
+        mantidas = _nova_posicao(anterior.hashes, anterior.qualidade.amostras["linha"].to_numpy(), hashes)
+        qualidade = anterior.qualidade.substituir_meses(qualidade, [0, *refazer], len(df), mantidas)
+        icms = combinar_icms(anterior.icms[~anterior.icms["yyyymm"].isin([0, *refazer])], icms)
+    return Ingestao(qualidade, icms, novos, hashes, refazer)
+
+
+def anexar(store: AgregadoStore, empresa: str, ingestao: Ingestao, delta: pd.DataFrame) -> Tuple[Ingestao, pd.DataFrame]:
+    """
+    Anexa um lote de notas (delta) à ingestão corrente. Só as notas ainda não
+    armazenadas entram; retorna (ingestão atualizada, notas efetivamente anexadas).
+    """
+    novas = delta[store.notas_novas(empresa, delta)].reset_index(drop=True)
+    if novas.empty:
+        return ingestao, novas
+    preparado, qualidade = preparar_com_qualidade(novas)
+    meses = store.anexar_delta(empresa, novas, preparado=preparado)
+    yyyymm, hashes = hash_notas(novas)
+    fps = dict(ingestao.fingerprints)
+    for m, (fp, n) in fingerprints_por_mes(yyyymm, hashes).items():
+        fp_old, n_old = fps.get(m, (0, 0))
+        fps[m] = ((fp_old + fp) & _MASCARA_64, n_old + n)
+    return Ingestao(
+        ingestao.qualidade.combinar(qualidade),
+        combinar_icms(ingestao.icms, icms_por_mes(preparado, preparado=True)),
+        fps,
+        np.concatenate([ingestao.hashes, hashes]),
+        meses,
+    ), novas
@@ -0,0 +1,382 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from contextlib import asynccontextmanager
+
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from calc import ICMS_ALIQUOTA_PADRAO, MARGENS, horizonte_meses, matriz_cenarios
+from plano import avaliar_planos, compor_lat_efetivo, matriz_planos
+from plano_store import PlanoStore
+from agregados_store import AgregadoStore
+
+# ============================================================
+# API HTTP local (Starlette) sobre o motor de cálculo
+# ============================================================
+# Mantém em memória o realizado de cada empresa (lido uma vez de
+# agregados.sqlite ou de uma planilha carregada) e expõe:
+#   GET  /saude                         -> status e empresas em cache
+#   POST /empresas/{empresa}/notas      -> (re)carrega planilha {"caminho": ...}
+#   GET  /realizado?empresa=&inicio=&meses=
+#   POST /planos/avaliar                -> N planos de uma vez (avaliar_planos)
+#   POST /cenarios/lote                 -> grade planos × meses × margens
+# Respostas em JSON colunar ({coluna: [valores]}) ou Arrow IPC
+# (?formato=arrow ou Accept: application/vnd.apache.arrow.stream).
+# O cálculo roda no threadpool para não bloquear o event loop.
+MIME_ARROW = "application/vnd.apache.arrow.stream"
+
+
+class ErroRequisicao(ValueError):
+    """Erro de entrada do cliente (vira HTTP 400)."""
+
+
+class NaoEncontrado(LookupError):
+    """Empresa ou plano salvo inexistente (vira HTTP 404). Outros KeyError seguem como 500."""
+
+
+# ============================================================
+# Estado quente (caches por empresa)
+# ============================================================
+class EstadoApi:
+    def __init__(self, agregados: AgregadoStore, planos: Optional[PlanoStore] = None) -> None:
+        self.agregados = agregados
+        self.planos = planos
+        self._realizado: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def empresas(self) -> List[str]:
+        return sorted(set(self._realizado) | set(self.agregados.empresas()))
+
+    def carregar_notas(self, empresa: str, caminho: str) -> List[int]:
+        """Lê a planilha, sincroniza agregados (só meses alterados) e renova o cache da empresa."""
+        ext = os.path.splitext(caminho)[1].lower()
+        if ext == ".xls":
+            raise ErroRequisicao("Formato .xls (Excel 97-2003) não suportado: salve a planilha como .xlsx.")
+        leitores = {
+            ".xlsx": lambda: pd.read_excel(caminho, engine="openpyxl"),
+            ".csv": lambda: pd.read_csv(caminho, dtype=str),
+            ".parquet": lambda: pd.read_parquet(caminho),
+        }
+        if ext not in leitores:
+            raise ErroRequisicao(f"Formato não suportado: {ext or caminho!r} (use .xlsx, .csv ou .parquet).")
+        try:
+            df = leitores[ext]()
+        except (ValueError, OSError) as exc:
+            # Planilha do cliente corrompida/ilegível é erro de entrada, não do servidor
+            raise ErroRequisicao(f"Não foi possível ler {caminho!r}: {exc}") from None
+        mudaram = self.agregados.atualizar(empresa, df)
+        with self._lock:
+            self._realizado.pop(empresa, None)
+        self.realizado_empresa(empresa)
+        return mudaram
+
+    def realizado_empresa(self, empresa: str) -> pd.DataFrame:
+        """Todos os meses armazenados da empresa (index yyyymm; FAT/COMPRAS/LAT), em cache."""
+        with self._lock:
+            df = self._realizado.get(empresa)
+        if df is None:
+            meses = self.agregados.fingerprints(empresa)
+            if not meses:
+                raise NaoEncontrado(f"Empresa sem dados: {empresa!r}.")
+            ordem = sorted(meses)
+            _, mat = self.agregados.matriz(ordem, [empresa])
+            df = pd.DataFrame({c: mat[c][0] for c in ("FAT", "COMPRAS", "LAT")}, index=pd.Index(ordem, name="yyyymm"))
+            with self._lock:
+                self._realizado[empresa] = df
+        return df
+
+    def realizado(self, empresa: str, meses: Sequence[int]) -> pd.DataFrame:
+        """Realizado alinhado a 'meses' (ausentes = 0)."""
+        return self.realizado_empresa(empresa).reindex([int(m) for m in meses], fill_value=0.0)
+
+
+# ============================================================
+# Serialização (JSON colunar / Arrow)
+# ============================================================
+def _quer_arrow(request: Request) -> bool:
+    return request.query_params.get("formato") == "arrow" or MIME_ARROW in request.headers.get("accept", "")
+
+
+def responder(request: Request, df: pd.DataFrame) -> Response:
+    if _quer_arrow(request):
+        try:
+            import pyarrow as pa
+        except ImportError:  # pragma: no cover - depende do ambiente
+            return JSONResponse({"erro": "Formato Arrow requer o pacote pyarrow."}, status_code=406)
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, tabela.schema) as w:
+            w.write_table(tabela)
+        return Response(sink.getvalue().to_pybytes(), media_type=MIME_ARROW)
+    colunas = {
+        str(c): [None if isinstance(v, float) and np.isnan(v) else v for v in df[c].tolist()]
+        for c in df.columns
+    }
+    return JSONResponse(colunas)
+
+
+# ============================================================
+# Entradas
+# ============================================================
+async def _json(request: Request) -> dict:
+    try:
+        corpo = await request.json()
+    except ValueError:
+        raise ErroRequisicao("Corpo da requisição deve ser JSON.") from None
+    if not isinstance(corpo, dict):
+        raise ErroRequisicao("Corpo da requisição deve ser um objeto JSON.")
+    return corpo
+
+
+def _numero(valor: object, campo: str, tipo: type = float):
+    """Converte um valor do cliente; entrada inválida vira ErroRequisicao (400), não 500."""
+    if isinstance(valor, (list, dict)):
+        raise ErroRequisicao(f"'{campo}' deve ser numérico, recebido {valor!r}.")
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError, OverflowError):
+        raise ErroRequisicao(f"'{campo}' deve ser numérico, recebido {valor!r}.") from None
+
+
+def _lista(valor: object, campo: str, tipo: type = float) -> list:
+    if not isinstance(valor, list):
+        raise ErroRequisicao(f"'{campo}' deve ser uma lista.")
+    return [_numero(v, campo, tipo) for v in valor]
+
+
+def _yyyymm(valor: object, campo: str) -> int:
+    ymm = _numero(valor, campo, int)
+    if not 1 <= ymm % 100 <= 12:
+        raise ErroRequisicao(f"'{campo}' deve estar no formato yyyymm (mês 01 a 12), recebido {valor!r}.")
+    return ymm
+
+
+def _meses(corpo: dict) -> List[int]:
+    if "meses" in corpo:
+        if not isinstance(corpo["meses"], list):
+            raise ErroRequisicao("'meses' deve ser uma lista.")
+        meses = [_yyyymm(m, "meses") for m in corpo["meses"]]
+    elif "inicio" in corpo:
+        meses = horizonte_meses(_yyyymm(corpo["inicio"], "inicio"), _numero(corpo.get("n_meses", 12), "n_meses", int))
+    else:
+        raise ErroRequisicao("Informe 'meses' (lista de yyyymm) ou 'inicio' (+ 'n_meses').")
+    if not meses:
+        raise ErroRequisicao("Lista de meses vazia.")
+    return meses
+
+
+def _margens(corpo: dict) -> List[float]:
+    margens = _lista(corpo.get("margens", MARGENS), "margens")
+    if not margens or any(r <= 0 for r in margens):
+        raise ErroRequisicao("'margens' deve conter apenas valores > 0.")
+    return margens
+
+
+def _aliquota_icms(corpo: dict) -> float:
+    aliquota = _numero(corpo.get("aliquota_icms", ICMS_ALIQUOTA_PADRAO), "aliquota_icms")
+    if not 0.0 <= aliquota < 1.0:
+        raise ErroRequisicao("'aliquota_icms' deve ser uma fração entre 0 e 1.")
+    return aliquota
+
+
+def _planos(estado: EstadoApi, corpo: dict, meses: List[int]) -> Tuple[List[str], np.ndarray]:
+    """
+    'planos': lista de {"nome", "lat": [LAT por mês]} ou {"nome", "salvo": nome, "versao"?}
+    (planos salvos exigem 'empresa'; meses fora do plano salvo entram como 0).
+    """
+    itens = corpo.get("planos")
+    if not isinstance(itens, list) or not itens:
+        raise ErroRequisicao("'planos' deve ser uma lista não vazia.")
+    nomes: List[str] = []
+    dicts: List[Dict[int, float]] = []
+    for i, p in enumerate(itens):
+        if not isinstance(p, dict):
+            raise ErroRequisicao(f"Plano {i}: deve ser um objeto com 'lat' ou 'salvo'.")
+        if "lat" in p:
+            lat = _lista(p["lat"], f"planos[{i}].lat")
+            if len(lat) != len(meses):
+                raise ErroRequisicao(f"Plano {i}: 'lat' tem {len(lat)} valores para {len(meses)} meses.")
+            dicts.append(dict(zip(meses, lat)))
+        elif "salvo" in p:
+            if estado.planos is None or "empresa" not in corpo:
+                raise ErroRequisicao("Planos salvos exigem 'empresa' e um PlanoStore configurado.")
+            versao = p.get("versao")
+            if versao is not None:
+                versao = _numero(versao, f"planos[{i}].versao", int)
+            try:
+                dicts.append(estado.planos.carregar(str(corpo["empresa"]), str(p["salvo"]), versao))
+            except KeyError as exc:
+                raise NaoEncontrado(exc.args[0] if exc.args else str(p["salvo"])) from None
+        else:
+            raise ErroRequisicao(f"Plano {i}: informe 'lat' ou 'salvo'.")
+        nomes.append(str(p.get("nome", p.get("salvo", f"plano_{i + 1}"))))
+    return nomes, matriz_planos(dicts, meses)
+
+
+def _compor_com_realizado(estado: EstadoApi, corpo: dict, meses: List[int], lat: np.ndarray) -> Tuple[np.ndarray, pd.DataFrame, Optional[int]]:
+    """Com 'empresa', aplica a regra do app: realizado antes do vigente, soma no vigente (se simulado)."""
+    if "empresa" not in corpo:
+        return lat, pd.DataFrame(0.0, index=meses, columns=["FAT", "COMPRAS", "LAT"]), None
+    real = estado.realizado(str(corpo["empresa"]), meses)
+    vigente = corpo.get("vigente")
+    if vigente is None:
+        com_fat = real.index[real["FAT"] > 0]
+        vigente = int(com_fat.max()) if len(com_fat) else meses[0]
+    vigente = _yyyymm(vigente, "vigente")
+    lat_ef = compor_lat_efetivo(lat, real["LAT"].to_numpy(), meses, vigente, bool(corpo.get("sim_vigente", False)))
+    return lat_ef, real, vigente
+
+
+# ============================================================
+# Endpoints
+# ============================================================
+async def saude(request: Request) -> Response:
+    estado: EstadoApi = request.app.state.estado
+    empresas = await run_in_threadpool(estado.empresas)
+    return JSONResponse({"status": "ok", "empresas": empresas})
+
+
+async def carregar_notas(request: Request) -> Response:
+    estado: EstadoApi = request.app.state.estado
+    corpo = await _json(request)
+    caminho = corpo.get("caminho")
+    if not caminho or not os.path.isfile(caminho):
+        raise ErroRequisicao(f"Arquivo não encontrado: {caminho!r}.")
+    empresa = request.path_params["empresa"]
+    mudaram = await run_in_threadpool(estado.carregar_notas, empresa, caminho)
+    return JSONResponse({"empresa": empresa, "meses_reprocessados": mudaram})
+
+
+async def realizado(request: Request) -> Response:
+    estado: EstadoApi = request.app.state.estado
+    q = request.query_params
+    if "empresa" not in q:
+        raise ErroRequisicao("Parâmetro 'empresa' é obrigatório.")
+    if "inicio" in q:
+        meses = horizonte_meses(_yyyymm(q["inicio"], "inicio"), _numero(q.get("meses", 12), "meses", int))
+        df = await run_in_threadpool(estado.realizado, q["empresa"], meses)
+    else:
+        df = await run_in_threadpool(estado.realizado_empresa, q["empresa"])
+    return responder(request, df.reset_index())
+
+
+async def avaliar(request: Request) -> Response:
+    estado: EstadoApi = request.app.state.estado
+    corpo = await _json(request)
+    meses, margens = _meses(corpo), _margens(corpo)
+    aliquota_icms = _aliquota_icms(corpo)
+
+    def calcular() -> pd.DataFrame:
+        nomes, lat = _planos(estado, corpo, meses)
+        lat_ef, _, _ = _compor_com_realizado(estado, corpo, meses, lat)
+        return avaliar_planos(nomes, meses, lat_ef, margens, aliquota_icms=aliquota_icms)
+
+    return responder(request, await run_in_threadpool(calcular))
+
+
+async def cenarios_lote(request: Request) -> Response:
+    """Grade completa planos × meses × margens numa única chamada de matriz_cenarios."""
+    estado: EstadoApi = request.app.state.estado
+    corpo = await _json(request)
+    meses, margens = _meses(corpo), _margens(corpo)
+    aliquota_icms = _aliquota_icms(corpo)
+
+    def calcular() -> pd.DataFrame:
+        nomes, lat = _planos(estado, corpo, meses)
+        lat_ef, real, vigente = _compor_com_realizado(estado, corpo, meses, lat)
+        n = len(nomes)
+        # Planos empilhados como linhas (n * n_meses): a grade é elementwise por mês
+        grade = matriz_cenarios(
+            np.tile(meses, n),
+            lat_ef.ravel(),
+            margens,
+            fat_real=np.tile(real["FAT"].to_numpy(), n),
+            compras_real=np.tile(real["COMPRAS"].to_numpy(), n),
+            vigente_yyyymm=vigente,
+            aliquota_icms=aliquota_icms,
+        )
+        k = grade.margens.size
+        return pd.DataFrame({
+            "plano": np.repeat(nomes, len(meses) * k),
+            "yyyymm": np.repeat(grade.meses, k),
+            "margem": np.tile(grade.margens, n * len(meses)),
+            "LAT": np.repeat(grade.LAT, k),
+            "PIS": np.repeat(grade.PIS, k),
+            "COFINS": np.repeat(grade.COFINS, k),
+            **{c: getattr(grade, c).ravel() for c in ("FAT", "COMPRAS", "ICMS", "FAT_EMITIR", "COMPRA_EMITIR")},
+        })
+
+    return responder(request, await run_in_threadpool(calcular))
+
+
+async def _erro_requisicao(request: Request, exc: Exception) -> Response:
+    return JSONResponse({"erro": str(exc)}, status_code=400)
+
+
+async def _nao_encontrado(request: Request, exc: Exception) -> Response:
+    return JSONResponse({"erro": str(exc)}, status_code=404)
+
+
+def criar_app(
+    agregados: Optional[AgregadoStore] = None,
+    planos: Optional[PlanoStore] = None,
+    notas: Optional[Dict[str, str]] = None,
+) -> Starlette:
+    """
+    Monta a aplicação. 'notas' = {empresa: caminho da planilha} carregadas na
+    inicialização (só meses alterados são reprocessados).
+    """
+    estado = EstadoApi(agregados or AgregadoStore(), planos if planos is not None else PlanoStore())
+
+    @asynccontextmanager
+    async def ciclo_de_vida(app: Starlette):
+        for empresa, caminho in (notas or {}).items():
+            await run_in_threadpool(estado.carregar_notas, empresa, caminho)
+        yield
+
+    app = Starlette(
+        routes=[
+            Route("/saude", saude, methods=["GET"]),
+            Route("/empresas/{empresa}/notas", carregar_notas, methods=["POST"]),
+            Route("/realizado", realizado, methods=["GET"]),
+            Route("/planos/avaliar", avaliar, methods=["POST"]),
+            Route("/cenarios/lote", cenarios_lote, methods=["POST"]),
+        ],
+        exception_handlers={ErroRequisicao: _erro_requisicao, NaoEncontrado: _nao_encontrado},
+        lifespan=ciclo_de_vida,
+    )
+    app.state.estado = estado
+    return app
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="API local do simulador de faturamento.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--agregados", default="agregados.sqlite")
+    parser.add_argument("--planos", default="planos.sqlite")
+    parser.add_argument("--notas", action="append", default=[], metavar="EMPRESA=ARQUIVO",
+                        help="Planilha a carregar na inicialização (pode repetir).")
+    args = parser.parse_args(argv)
+
+    notas = dict(item.split("=", 1) for item in args.notas)
+    import uvicorn
+
+    uvicorn.run(
+        criar_app(AgregadoStore(args.agregados), PlanoStore(args.planos), notas),
+        host=args.host,
+        port=args.porta,
+    )
+
+
+if __name__ == "__main__":
+    main()
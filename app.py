@@ -1,16 +1,35 @@
+import hashlib
 import streamlit as st
 import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
 from io import BytesIO
+from dataclasses import replace
 from datetime import datetime
+from pathlib import Path
+from urllib.request import urlopen
 
 from calc import (
-    realizado_por_mes,      # DataFrame OU dict por yyyymm -> {FAT, COMPRAS, LAT}
-    irpj_csll_trimestre,    # cálculo trimestral (usa dict {yyyymm: LAT})
+    irpj_csll_vetorizado,   # cálculo trimestral vetorizado (arrays yyyymm/LAT)
+    horizonte_meses,
+    solver_trimestres,      # folga do adicional e metas de LL em forma fechada
+    grade_margens,
+    chave_margem,
+    aliquota_efetiva_icms,
     MARGENS,
+    ALIQUOTA_PIS,
+    ALIQUOTA_COFINS,
 )
-from ui_helpers import brl, pis_cofins, yyyymm_to_label
+from ui_helpers import brl, brl_series, estilo_brl, yyyymm_to_label
+from plano import PlanoIncremental, avaliar_planos, compor_lat_efetivo, matriz_planos
+from plano_store import PlanoStore
+from agregados_store import AgregadoStore, anexar, ingerir
+from diario import AcompanhamentoDiario, comparar_com_cenario
+from previsao import MIN_MESES_SAZONAL, MIN_MESES_TENDENCIA, prever_carteira
+from regimes import CAMPOS_RESULTADO, REGIMES, avaliar_regimes, tabela_regimes
 
-st.set_page_config(page_title="Simulação de Faturamento 2025", layout="wide")
+st.set_page_config(page_title="Simulação de Faturamento", layout="wide")
 
 # =========================
 # CSS (layout corporativo, AA)
@@ -62,71 +81,120 @@ inject_css()
 # =========================
 MESES_PT = {1:"Jan",2:"Fev",3:"Mar",4:"Abr",5:"Mai",6:"Jun",7:"Jul",8:"Ago",9:"Set",10:"Out",11:"Nov",12:"Dez"}
 
-@st.cache_data(ttl=300)
-def load_data() -> pd.DataFrame:
-    url = "https://raw.githubusercontent.com/eduardoveiculos/SIMULA-AO-DE-FATURAMENTO/main/resultado_eduardo_veiculos.xlsx"
+EMPRESA_BASE = "eduardo_veiculos"   # empresa dona da planilha publicada em URL_BASE
+URL_BASE = "https://raw.githubusercontent.com/eduardoveiculos/SIMULA-AO-DE-FATURAMENTO/main/resultado_eduardo_veiculos.xlsx"
+ARQUIVO_BASE = "resultado_eduardo_veiculos.xlsx"
+
+@st.cache_data(ttl=300, show_spinner=False)
+def baixar_base() -> bytes:
+    """Bytes da planilha base (GitHub; cópia local como reserva), rebaixados a cada 5 min."""
     try:
-        return pd.read_excel(url, engine="openpyxl")
+        with urlopen(URL_BASE, timeout=30) as resp:
+            return resp.read()
     except Exception:
         try:
-            return pd.read_excel("resultado_eduardo_veiculos.xlsx", engine="openpyxl")
-        except Exception:
-            return pd.DataFrame()
+            return Path(ARQUIVO_BASE).read_bytes()
+        except OSError:
+            return b""
+
+def versao_conteudo(conteudo: bytes) -> str:
+    return hashlib.sha1(conteudo).hexdigest()
+
+@st.cache_resource(max_entries=2)
+def ler_planilha(versao: str, _conteudo: bytes) -> pd.DataFrame:
+    """
+    Planilha lida uma vez por versão (hash do conteúdo). cache_resource devolve o
+    mesmo objeto entre reruns (sem cópia): não alterar o DataFrame retornado.
+    """
+    return pd.read_excel(BytesIO(_conteudo), engine="openpyxl")
+
+def load_data() -> tuple[pd.DataFrame, str]:
+    """
+    Planilha base + versão. A versão é o hash do conteúdo: rebaixar o mesmo
+    arquivo não muda a versão e não dispara nova leitura nem ingestão.
+    """
+    conteudo = baixar_base()
+    versao = versao_conteudo(conteudo)
+    try:
+        return ler_planilha(versao, conteudo), versao
+    except Exception:
+        return pd.DataFrame(), versao
 
-def to_excel_bytes(df: pd.DataFrame) -> bytes:
+def to_excel_bytes(df: pd.DataFrame, extras: dict[str, pd.DataFrame] | None = None) -> bytes:
     buf = BytesIO()
     with pd.ExcelWriter(buf, engine="openpyxl") as w:
         df.to_excel(w, index=False)
+        for nome, extra in (extras or {}).items():
+            extra.to_excel(w, sheet_name=nome, index=False)
     return buf.getvalue()
 
-def ensure_realizado_df(r, ano: int = 2025) -> pd.DataFrame:
+@st.cache_resource
+def get_plano_store() -> PlanoStore:
+    return PlanoStore()
+
+@st.cache_resource
+def get_agregado_store() -> AgregadoStore:
+    return AgregadoStore()
+
+def ensure_realizado_df(r, meses: list[int]) -> pd.DataFrame:
     """
     Normaliza o retorno de realizado_por_mes para um DataFrame com:
-    index = 1..12 (mês), colunas: FAT, COMPRAS, LAT, yyyymm.
+    index = yyyymm (todos os meses do horizonte), colunas: FAT, COMPRAS, LAT, yyyymm.
     Aceita tanto DataFrame quanto dict {yyyymm -> {FAT,COMPRAS,LAT}}.
     """
     if isinstance(r, pd.DataFrame):
         df = r.copy()
-        for col in ["FAT", "COMPRAS", "LAT"]:
-            if col not in df.columns:
-                df[col] = 0.0
         if "yyyymm" in df.columns:
             df["yyyymm"] = pd.to_numeric(df["yyyymm"], errors="coerce").fillna(0).astype(int)
-            df["mes"] = df["yyyymm"] % 100
-            df = df.set_index("mes").sort_index()
-        elif "mes" in df.columns:
-            df = df.set_index("mes").sort_index()
-            if "yyyymm" not in df.columns:
-                df["yyyymm"] = [ano * 100 + m for m in df.index]
-        else:
-            if "yyyymm" not in df.columns:
-                df["yyyymm"] = [ano * 100 + m for m in df.index]
-        return df[["FAT", "COMPRAS", "LAT", "yyyymm"]]
+            df = df.set_index("yyyymm")
     else:
         df = pd.DataFrame.from_dict(r, orient="index")
-        df = df.rename_axis("key").reset_index()
-        df["key_num"] = pd.to_numeric(df["key"], errors="coerce")
-        if (df["key_num"] >= 1000).any():
-            df["yyyymm"] = df["key_num"].astype("Int64")
-            df["mes"] = (df["yyyymm"] % 100).astype(int)
-        else:
-            df["mes"] = df["key_num"].fillna(0).astype(int)
-            df["yyyymm"] = ano * 100 + df["mes"]
-        for col in ["FAT", "COMPRAS", "LAT"]:
-            if col not in df.columns:
-                df[col] = 0.0
-        out = df.set_index("mes").sort_index()[["FAT", "COMPRAS", "LAT", "yyyymm"]]
-        for col in ["FAT", "COMPRAS", "LAT"]:
-            out[col] = pd.to_numeric(out[col], errors="coerce").fillna(0.0).astype(float)
-        out["yyyymm"] = out["yyyymm"].astype(int)
-        return out
+        df.index = pd.to_numeric(df.index, errors="coerce")
+    for col in ["FAT", "COMPRAS", "LAT"]:
+        if col not in df.columns:
+            df[col] = 0.0
+    out = df.reindex(meses)[["FAT", "COMPRAS", "LAT"]]
+    for col in ["FAT", "COMPRAS", "LAT"]:
+        out[col] = pd.to_numeric(out[col], errors="coerce").fillna(0.0).astype(float)
+    out["yyyymm"] = out.index.astype(int)
+    return out
 
 # =========================
 # Sidebar minimalista
 # =========================
 with st.sidebar:
     st.header("📊 Simulação")
-    ano = st.selectbox("Ano", [2025], index=0, disabled=True)
+    n_meses = st.selectbox(
+        "Horizonte (meses)",
+        [12, 24, 36],
+        index=0,
+        help="Horizonte rolante a partir do trimestre do mês vigente (atravessa a virada do ano).",
+    )
+    # Empresa escolhida entre as já armazenadas; uma empresa nova só entra por ação explícita
+    empresas_novas = st.session_state.setdefault("empresas_novas", [])
+    if "__empresa_nova__" in st.session_state:
+        st.session_state["empresa"] = st.session_state.pop("__empresa_nova__")
+    opcoes_empresa = sorted({EMPRESA_BASE, *get_agregado_store().empresas(), *empresas_novas})
+    empresa = st.selectbox(
+        "Empresa",
+        opcoes_empresa,
+        index=opcoes_empresa.index(EMPRESA_BASE),
+        key="empresa",
+        help="Notas, agregados e planos salvos desta empresa.",
+    )
+    with st.expander("🏢 Nova empresa"):
+        nome_empresa = st.text_input("Nome", key="nome_empresa_nova").strip()
+        if st.button("Criar empresa", disabled=not nome_empresa or nome_empresa in opcoes_empresa):
+            empresas_novas.append(nome_empresa)
+            st.session_state["__empresa_nova__"] = nome_empresa
+            st.rerun()
+    passo_margem = st.selectbox(
+        "Resolução das margens",
+        [0.005, 0.01, 0.05],
+        index=0,
+        format_func=lambda p: f"{p*100:g}%",
+        help="Passo da grade de margens (5% a 30%) usada no mapa de cenários.",
+    )
     sim_vigente = st.checkbox(
         "✏️ Simular mês vigente",
         value=True,
@@ -140,69 +208,224 @@ with st.sidebar:
     if c2.button("🗑️ Zerar simulação", type="secondary", help="Zera apenas os meses editáveis"):
         st.session_state["__zerar__"] = True
         st.rerun()
+    if st.button("🔮 Preencher com previsão", help="Preenche os meses editáveis com a previsão sazonal/tendência do LAT"):
+        st.session_state["__prever__"] = True
+        st.rerun()
 
 # =========================
 # Dados base + realizado + vigente (robusto a DF/dict)
 # =========================
-df_raw = load_data()
+# A planilha publicada é só da EMPRESA_BASE; as demais usam a planilha enviada nesta
+# sessão (guardada por empresa, para sobreviver à troca de empresa na barra lateral).
+df_raw, versao_base = load_data() if empresa == EMPRESA_BASE else (pd.DataFrame(), "")
 if df_raw.empty:
-    st.warning("🔍 Não foi possível carregar os dados automaticamente.")
-    upl = st.file_uploader("📁 Envie o arquivo resultado_eduardo_veiculos.xlsx", type="xlsx")
+    bases_enviadas = st.session_state.setdefault("bases_enviadas", {})
+    if empresa == EMPRESA_BASE:
+        st.warning("🔍 Não foi possível carregar os dados automaticamente.")
+    upl = st.file_uploader(f"📁 Envie a planilha de notas de {empresa}", type="xlsx", key=f"base_{empresa}")
     if upl:
-        df_raw = pd.read_excel(upl, engine="openpyxl")
-    else:
+        versao_upl = versao_conteudo(upl.getvalue())
+        bases_enviadas[empresa] = (ler_planilha(versao_upl, upl.getvalue()), versao_upl)
+    if empresa not in bases_enviadas:
         st.stop()
+    df_raw, versao_base = bases_enviadas[empresa]
 
-rpm_raw = realizado_por_mes(df_raw)            # DataFrame OU dict
-realizado_df = ensure_realizado_df(rpm_raw)    # DataFrame normalizado
+# Notas anexadas (delta) nesta sessão entram somadas aos meses afetados da empresa
+with st.sidebar:
+    upl_delta = st.file_uploader(
+        "➕ Anexar notas (delta)",
+        type="xlsx",
+        key=f"delta_{empresa}",
+        help="Notas novas (ex.: emitidas hoje). Só os meses afetados são reprocessados.",
+    )
+agg_store = get_agregado_store()
+notas_delta = st.session_state.setdefault("notas_delta", {}).setdefault(empresa, {})
+
+# Ingestão por empresa, guardada por versão (conteúdo da planilha base, deltas): reruns
+# sem arquivo novo não relêem as notas; uma base nova só normaliza os meses cuja
+# impressão digital mudou, e um delta processa só as notas ainda não armazenadas.
+ingestoes = st.session_state.setdefault("ingestoes", {})
+estado = ingestoes.get(empresa)
+chave_ingestao = (versao_base, tuple(notas_delta))
+if estado is None or estado["chave"] != chave_ingestao:
+    df_notas = pd.concat([df_raw, *notas_delta.values()], ignore_index=True) if notas_delta else df_raw
+    anterior = estado["ingestao"] if estado else None
+    estado = {"chave": chave_ingestao, "ingestao": ingerir(agg_store, empresa, df_notas, anterior)}
+if upl_delta is not None and upl_delta.file_id not in notas_delta:
+    df_lido = pd.read_excel(upl_delta, engine="openpyxl")
+    ingestao, df_delta = anexar(agg_store, empresa, estado["ingestao"], df_lido)
+    notas_delta[upl_delta.file_id] = df_delta
+    estado = {"chave": (versao_base, tuple(notas_delta)), "ingestao": ingestao}
+    if df_delta.empty:
+        st.sidebar.info(f"As {len(df_lido)} notas do arquivo já estavam armazenadas.")
+    else:
+        repetidas = len(df_lido) - len(df_delta)
+        st.sidebar.success(
+            f"{len(df_delta)} notas anexadas ({', '.join(yyyymm_to_label(m) for m in ingestao.meses_reprocessados)})"
+            + (f"; {repetidas} já armazenadas foram ignoradas." if repetidas else ".")
+        )
+ingestoes[empresa] = estado
+qualidade = estado["ingestao"].qualidade
+icms_tab = estado["ingestao"].icms
+
+# mês vigente = MAIOR yyyymm com FAT > 0 nas notas da empresa (sem notas: mês corrente).
+# O horizonte rola a partir do início do trimestre vigente, para o IRPJ/CSLL do
+# trimestre em curso somar os meses já realizados.
+hoje = datetime.today()
+vigente_yyyymm = agg_store.mes_vigente(empresa) or hoje.year * 100 + hoje.month
+horizonte = horizonte_meses(vigente_yyyymm - (vigente_yyyymm % 100 - 1) % 3, n_meses)
+periodo_label = f"{yyyymm_to_label(horizonte[0])}–{yyyymm_to_label(horizonte[-1])}"
+periodo_arquivo = f"{horizonte[0]}_{horizonte[-1]}"
+
+rpm_raw = agg_store.realizado(empresa, horizonte)          # DataFrame OU dict
+realizado_df = ensure_realizado_df(rpm_raw, horizonte)    # DataFrame normalizado (index yyyymm)
+
+with st.expander(
+    "🩺 Qualidade dos dados" + ("" if qualidade.ok else f" — {int(qualidade.totais()['linhas'].sum())} ocorrências"),
+    expanded=False,
+):
+    if qualidade.ok:
+        st.success(f"Nenhum problema encontrado nas {qualidade.total_linhas} notas.")
+    else:
+        st.caption("Linhas com valor/data não interpretáveis entram como 0 ou ficam fora de qualquer mês.")
+        st.dataframe(qualidade.totais(), use_container_width=True, hide_index=True)
+        por_mes = qualidade.resumo.assign(Mês=qualidade.resumo["yyyymm"].map(lambda m: yyyymm_to_label(m) if m else "Sem data"))
+        st.dataframe(
+            por_mes.pivot_table(index="Mês", columns="problema", values="linhas", aggfunc="sum", fill_value=0, sort=False),
+            use_container_width=True,
+        )
+        st.markdown("**Amostras**")
+        st.dataframe(qualidade.amostras, use_container_width=True, hide_index=True)
+    if qualidade.colunas_nao_mapeadas:
+        st.caption("Colunas não mapeadas: " + ", ".join(map(str, qualidade.colunas_nao_mapeadas)))
 
-# mês vigente = MAIOR yyyymm com FAT > 0
-vigente_yyyymm = int(realizado_df.loc[realizado_df["FAT"] > 0, "yyyymm"].max()) if not realizado_df.empty else 0
-mes_vig_num = (vigente_yyyymm % 100) if vigente_yyyymm else 0
-if mes_vig_num == 0:
-    mes_vig_num = datetime.today().month
-    vigente_yyyymm = 2025 * 100 + mes_vig_num
+# ICMS realizado por nota; a alíquota efetiva dos últimos 12 meses projeta os futuros
+_meses_icms = sorted(m for m in icms_tab["yyyymm"].unique() if m <= vigente_yyyymm)[-12:]
+aliquota_icms = aliquota_efetiva_icms(icms_tab, _meses_icms)
+rotulo_icms = f"ICMS ({round(aliquota_icms * 100, 2):g}%)".replace(".", ",")
 
-def val_real(mes: int, col: str) -> float:
+def val_real(ymm: int, col: str) -> float:
     try:
-        return float(realizado_df.at[mes, col]) if mes in realizado_df.index else 0.0
+        return float(realizado_df.at[ymm, col]) if ymm in realizado_df.index else 0.0
     except Exception:
         return 0.0
 
+def mes_travado(ymm: int) -> bool:
+    return (ymm < vigente_yyyymm) or (ymm == vigente_yyyymm and not sim_vigente)
+
+with st.expander(f"🧾 ICMS das notas — alíquota efetiva {round(aliquota_icms * 100, 2):g}%".replace(".", ","), expanded=False):
+    if icms_tab.empty or icms_tab["NOTAS_COM_ICMS"].sum() == 0:
+        st.caption("A planilha não traz ICMS por nota (valor/alíquota): projeções usam ICMS de 5% do FAT.")
+    else:
+        st.caption(
+            f"ICMS ÷ FAT das notas de saída com ICMS informado em {len(_meses_icms)} meses até "
+            f"{yyyymm_to_label(vigente_yyyymm)}; essa alíquota projeta o ICMS dos meses simulados."
+        )
+        icms_cst = icms_tab.pivot_table(index="yyyymm", columns="cst_icms", values="ICMS_VALOR", aggfunc="sum", fill_value=0.0)
+        icms_cst.index = [yyyymm_to_label(m) for m in icms_cst.index]
+        icms_cst.columns = [f"CST {c}" if c else "Sem CST" for c in icms_cst.columns]
+        st.dataframe(estilo_brl(icms_cst, icms_cst.columns), use_container_width=True)
+        por_cst = icms_tab.groupby("cst_icms", as_index=False)[["NOTAS", "FAT", "ICMS_BASE", "ICMS_VALOR"]].sum()
+        st.dataframe(
+            estilo_brl(por_cst, ["FAT", "ICMS_BASE", "ICMS_VALOR"]),
+            use_container_width=True, hide_index=True,
+        )
+
+# =========================
+# Previsão do LAT/FAT a partir do histórico realizado (sazonal + tendência)
+# =========================
+# Só do vigente em diante (o passado é realizado). Guardada pela impressão digital do
+# armazenamento + horizonte: reruns sem nota nova nem mudança de horizonte não reajustam.
+_meses_previsao = [ymm for ymm in horizonte if ymm >= vigente_yyyymm]
+_chave_previsao = (empresa, vigente_yyyymm, tuple(_meses_previsao), tuple(sorted(agg_store.fingerprints(empresa).items())))
+if st.session_state.get("previsoes_chave") != _chave_previsao:
+    st.session_state["previsoes"] = {
+        campo: prever_carteira(agg_store, vigente_yyyymm, _meses_previsao, campo, empresas=[empresa])
+        for campo in ("LAT", "FAT")
+    }
+    st.session_state["previsoes_chave"] = _chave_previsao
+previsoes = st.session_state["previsoes"]
+lat_previsto = previsoes["LAT"].por_mes(empresa)
+
 # =========================
 # Estado do planejamento (LAT simulado por mês)
 # =========================
 if "lat_plan" not in st.session_state:
-    st.session_state["lat_plan"] = {2025*100+m: 0.0 for m in range(1, 13)}
+    st.session_state["lat_plan"] = {}
+for ymm in horizonte:
+    st.session_state["lat_plan"].setdefault(ymm, 0.0)
+
+# A previsão só entra no plano pelo botão "🔮 Preencher com previsão"
+if st.session_state.pop("__prever__", False) and previsoes["LAT"].n_observados[0] > 0:
+    for ymm in horizonte:
+        if not mes_travado(ymm):
+            # No vigente o simulado soma ao parcial realizado: preenche só o que falta.
+            # Previsão negativa (tendência de queda) não vira LAT simulado negativo.
+            v = lat_previsto[ymm] - (val_real(ymm, "LAT") if ymm == vigente_yyyymm else 0.0)
+            v = round(max(v, 0.0), 2)
+            st.session_state["lat_plan"][ymm] = v
+            st.session_state[f"lat_input_{ymm}"] = v
 
 if st.session_state.pop("__zerar__", False):
-    for m in range(1, 13):
-        editavel = (m > mes_vig_num) or (m == mes_vig_num and sim_vigente)
-        if editavel:
-            st.session_state["lat_plan"][2025*100+m] = 0.0
+    for ymm in horizonte:
+        if not mes_travado(ymm):
+            st.session_state["lat_plan"][ymm] = 0.0
+
+# =========================
+# Planos salvos (SQLite local, versionados por empresa; cada plano guarda os seus meses)
+# =========================
+plano_store = get_plano_store()
+
+_carregar = st.session_state.pop("__carregar_plano__", None)
+if _carregar:
+    valores = plano_store.carregar(empresa, _carregar["nome"], _carregar["versao"])
+    for ymm in horizonte:
+        if ymm in valores and not mes_travado(ymm):
+            st.session_state["lat_plan"][ymm] = valores[ymm]
+            st.session_state[f"lat_input_{ymm}"] = valores[ymm]
+    st.toast(f"Plano “{_carregar['nome']}” v{_carregar['versao']} carregado.")
+
+# Só os planos que cobrem algum mês do horizonte (os meses fora dele não entram)
+planos_salvos = plano_store.listar(empresa, horizonte)
+with st.sidebar:
+    st.divider()
+    st.subheader("💾 Planos")
+    nome_plano = st.text_input("Nome do plano", value="", placeholder="ex.: conservador")
+    if st.button("Salvar versão", disabled=not nome_plano.strip()):
+        versao = plano_store.salvar(empresa, nome_plano, {ymm: st.session_state["lat_plan"][ymm] for ymm in horizonte})
+        st.success(f"“{nome_plano.strip()}” salvo como v{versao}.")
+        planos_salvos = plano_store.listar(empresa, horizonte)
+    if planos_salvos:
+        escolhido = st.selectbox(
+            "Carregar plano",
+            planos_salvos,
+            format_func=lambda p: (
+                f"{p['nome']} v{p['versao']} ({yyyymm_to_label(p['inicio'])}–{yyyymm_to_label(p['fim'])}, {p['criado_em'][:10]})"
+            ),
+        )
+        if st.button("Carregar"):
+            st.session_state["__carregar_plano__"] = {"nome": escolhido["nome"], "versao": escolhido["versao"]}
+            st.rerun()
 
 # =========================
 # KPIs YTD (somente realizado)
 # =========================
 if not realizado_df.empty:
-    ytd_fat = float(realizado_df.loc[1:mes_vig_num, "FAT"].sum())
-    ytd_compras = float(realizado_df.loc[1:mes_vig_num, "COMPRAS"].sum())
-    ytd_lat = float(realizado_df.loc[1:mes_vig_num, "LAT"].sum())
-    pis_ytd = cof_ytd = icms_ytd = 0.0
-    lat_dict_ytd = {}
-    for m in range(1, mes_vig_num+1):
-        l = val_real(m, "LAT")
-        f = val_real(m, "FAT")
-        p, c = pis_cofins(l)
-        pis_ytd += p
-        cof_ytd += c
-        icms_ytd += 0.05 * f
-        lat_dict_ytd[2025*100+m] = l
-    irpj_ytd = csll_ytd = 0.0
-    for ymm, (ir, cs) in irpj_csll_trimestre(lat_dict_ytd).items():
-        if ymm % 100 <= mes_vig_num:
-            irpj_ytd += ir
-            csll_ytd += cs
+    # O horizonte começa no trimestre vigente: o YTD lê jan..vigente direto do armazenamento
+    _meses_ytd = horizonte_meses(vigente_yyyymm // 100 * 100 + 1, vigente_yyyymm % 100)
+    ytd = ensure_realizado_df(agg_store.realizado(empresa, _meses_ytd), _meses_ytd)
+    ytd_fat = float(ytd["FAT"].sum())
+    ytd_compras = float(ytd["COMPRAS"].sum())
+    ytd_lat = float(ytd["LAT"].sum())
+    lat_pos = ytd["LAT"].clip(lower=0.0)
+    pis_ytd = float(ALIQUOTA_PIS * lat_pos.sum())
+    cof_ytd = float(ALIQUOTA_COFINS * lat_pos.sum())
+    # ICMS das notas quando informado; notas sem ICMS entram pela alíquota efetiva
+    icms_ytd_tab = icms_tab[icms_tab["yyyymm"].isin(ytd["yyyymm"])]
+    icms_ytd = float(icms_ytd_tab["ICMS_VALOR"].sum() + aliquota_icms * (ytd_fat - icms_ytd_tab["FAT_COM_ICMS"].sum()))
+    irpj_arr, csll_arr = irpj_csll_vetorizado(ytd["yyyymm"].to_numpy(), ytd["LAT"].to_numpy())
+    irpj_ytd = float(irpj_arr.sum())
+    csll_ytd = float(csll_arr.sum())
     ll_ytd = ytd_lat - (pis_ytd + cof_ytd + icms_ytd + irpj_ytd + csll_ytd)
 
     html_kpis = (
@@ -220,21 +443,20 @@ if not realizado_df.empty:
 # Planejamento LAT – editor por mês (aceita negativos)
 # =========================
 st.markdown(
-    '<div class="section"><h3>📝 Planejamento LAT 2025</h3>'
+    f'<div class="section"><h3>📝 Planejamento LAT {periodo_label}</h3>'
     '<div class="sub">Meses anteriores ao vigente ficam travados; o vigente soma o simulado ao realizado quando “Simular mês vigente” estiver ativo.</div></div>',
     unsafe_allow_html=True
 )
 
-if "mes_selecionado" not in st.session_state:
-    st.session_state["mes_selecionado"] = mes_vig_num or 1
+if st.session_state.get("mes_selecionado") not in horizonte:
+    st.session_state["mes_selecionado"] = vigente_yyyymm if vigente_yyyymm in horizonte else horizonte[0]
 
-for m in range(1, 13):
-    ymm = 2025*100 + m
-    is_locked = (m < mes_vig_num) or (m == mes_vig_num and not sim_vigente)
-    lat_real_m = val_real(m, "LAT")
+for i, ymm in enumerate(horizonte):
+    is_locked = mes_travado(ymm)
+    lat_real_m = val_real(ymm, "LAT")
     default_val = float(st.session_state["lat_plan"].get(ymm, 0.0))
 
-    with st.expander(f"{MESES_PT[m]}/2025", expanded=(m == st.session_state["mes_selecionado"])):
+    with st.expander(yyyymm_to_label(ymm), expanded=(ymm == st.session_state["mes_selecionado"])):
         st.markdown('<div class="panel">', unsafe_allow_html=True)
         if is_locked:
             st.markdown('<h4>LAT (Realizado)</h4>', unsafe_allow_html=True)
@@ -254,15 +476,13 @@ for m in range(1, 13):
             colA, colB = st.columns(2)
             if colA.button("Copiar para os próximos", key=f"copy_next_{ymm}"):
                 base = float(st.session_state["lat_plan"][ymm])
-                for k in range(m+1, 13):
-                    ymm2 = 2025*100 + k
-                    is_locked2 = (k < mes_vig_num) or (k == mes_vig_num and not sim_vigente)
-                    if not is_locked2:
+                for ymm2 in horizonte[i+1:]:
+                    if not mes_travado(ymm2):
                         st.session_state["lat_plan"][ymm2] = base
                         st.session_state[f"lat_input_{ymm2}"] = base
                 st.success("Valores copiados para os próximos meses editáveis.")
             if colB.button("Usar LAT Real (se houver)", key=f"use_real_{ymm}"):
-                if m == mes_vig_num and sim_vigente:
+                if ymm == vigente_yyyymm and sim_vigente:
                     st.info(f"LAT realizado {brl(lat_real_m)} será somado ao simulado na simulação.")
                 else:
                     st.session_state["lat_plan"][ymm] = lat_real_m
@@ -271,16 +491,42 @@ for m in range(1, 13):
 
 # Propagação global (a partir do mês selecionado)
 if st.session_state.pop("__propagar__", False):
-    m = st.session_state["mes_selecionado"]
-    base = float(st.session_state["lat_plan"][2025*100 + m])
-    for k in range(m+1, 13):
-        ymm2 = 2025*100 + k
-        is_locked2 = (k < mes_vig_num) or (k == mes_vig_num and not sim_vigente)
-        if not is_locked2:
+    sel = st.session_state["mes_selecionado"]
+    base = float(st.session_state["lat_plan"][sel])
+    for ymm2 in horizonte[horizonte.index(sel)+1:]:
+        if not mes_travado(ymm2):
             st.session_state["lat_plan"][ymm2] = base
             st.session_state[f"lat_input_{ymm2}"] = base
     st.success("Valores propagados para os meses futuros editáveis.")
 
+# =========================
+# Modelo incremental (reaproveita derivados de meses não editados)
+# =========================
+_plano_assinatura = (
+    tuple(horizonte),
+    vigente_yyyymm,
+    bool(sim_vigente),
+    tuple(realizado_df[["FAT", "COMPRAS", "LAT"]].round(2).to_numpy().ravel().tolist()),   # grade() usa FAT/COMPRAS do vigente
+    round(aliquota_icms, 6),
+)
+if st.session_state.get("__plano_assinatura__") != _plano_assinatura:
+    st.session_state["plano_modelo"] = PlanoIncremental(
+        realizado={int(r.yyyymm): {"FAT": r.FAT, "COMPRAS": r.COMPRAS, "LAT": r.LAT} for r in realizado_df.itertuples()},
+        vigente_yyyymm=vigente_yyyymm,
+        sim_vigente=sim_vigente,
+        meses=horizonte,
+        aliquota_icms=aliquota_icms,
+    )
+    st.session_state["__plano_assinatura__"] = _plano_assinatura
+plano_modelo: PlanoIncremental = st.session_state["plano_modelo"]
+plano_modelo.atualizar_plano({ymm: st.session_state["lat_plan"][ymm] for ymm in horizonte})
+
+# =========================
+# Grade de cenários (meses × margens) — uma única operação de arrays por rerun,
+# montada pelo modelo (mesmo LAT/ICMS dos derivados das exportações)
+# =========================
+grade_cenarios = plano_modelo.grade(grade_margens(passo=passo_margem))
+
 # =========================
 # Simulação por Mês (somente vigente + futuros)
 # =========================
@@ -292,34 +538,30 @@ st.markdown(
 
 mes_selecionado = st.segmented_control(
     "Mês para simular:",
-    options=list(range(1, 13)),
+    options=horizonte,
     default=st.session_state["mes_selecionado"],
-    format_func=lambda x: MESES_PT[x],
-    key="selector_mes",
+    format_func=yyyymm_to_label,
+    key=f"selector_mes_{periodo_arquivo}",
 )
 if mes_selecionado is None:
     mes_selecionado = st.session_state["mes_selecionado"]
 st.session_state["mes_selecionado"] = mes_selecionado
 
 # Determina LAT_total
-lat_sim = float(st.session_state["lat_plan"][2025*100 + mes_selecionado])
 lat_real_sel = val_real(mes_selecionado, "LAT")
 fat_real_sel = val_real(mes_selecionado, "FAT")
 compras_real_sel = val_real(mes_selecionado, "COMPRAS")
 
-is_past = mes_selecionado < mes_vig_num
-is_vig = mes_selecionado == mes_vig_num
-is_future = mes_selecionado > mes_vig_num
+is_past = mes_selecionado < vigente_yyyymm
+is_vig = mes_selecionado == vigente_yyyymm
+is_future = mes_selecionado > vigente_yyyymm
 
 if is_past:
     st.info("Mês anterior ao vigente: apenas realizado (sem cenários).")
-    lat_total = lat_real_sel
-elif is_vig:
-    lat_total = lat_real_sel + (lat_sim if sim_vigente else 0.0)
-else:
-    lat_total = lat_sim  # futuro
+lat_total = plano_modelo.lat_total(mes_selecionado)
+
 
-with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem", expanded=not is_past):
+with st.expander(f"🎲 {yyyymm_to_label(mes_selecionado)} - Cenários por margem", expanded=not is_past):
     if is_past:
         html_real = (
             '<div class="metric-grid">'
@@ -338,25 +580,10 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
             key="margem_referencia",
         ) or 0.20
 
-        # Totais e "a emitir" por margem r
-        cenarios = {}
-        for r in MARGENS:
-            fat_total = (lat_total / r) if r > 0 else 0.0
-            compras_total = fat_total - lat_total
-            if is_vig:
-                fat_emitir = max(0.0, fat_total - fat_real_sel)
-                compras_emitir = max(0.0, compras_total - compras_real_sel)
-            else:
-                fat_emitir = max(0.0, fat_total)
-                compras_emitir = max(0.0, compras_total)
-            cenarios[int(r*100)] = {
-                "FAT_TOTAL": fat_total,
-                "COMPRA_TOTAL": compras_total,
-                "FAT_EMITIR": fat_emitir,
-                "COMPRA_EMITIR": compras_emitir,
-            }
-
-        ref = cenarios[int(margem_ref*100)]
+        # Totais e "a emitir" por margem r — linha do mês na grade de cenários
+        cenarios = grade_cenarios.cenarios_mes(mes_selecionado, MARGENS)
+
+        ref = cenarios[chave_margem(margem_ref)]
         real_fat_html = (
             f'<div class="muted">Realizado: {brl(fat_real_sel)}</div>' if is_vig else ''
         )
@@ -369,12 +596,12 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
             else ''
         )
         html_ref = (
-            '<div class="section"><h3>Cenário ' + str(int(margem_ref*100)) + '% (Referência)</h3></div>'
+            f'<div class="section"><h3>Cenário {chave_margem(margem_ref):g}% (Referência)</h3></div>'
             '<div class="metric-grid">'
-            f'<div class="card"><h4>Faturamento (total do mês)</h4><p class="value">{brl(ref["FAT_TOTAL"])}</p>'
+            f'<div class="card"><h4>Faturamento (total do mês)</h4><p class="value">{brl(ref["FAT"])}</p>'
             f'{real_fat_html}'
             f'<div class="muted">A emitir: {brl(ref["FAT_EMITIR"])}</div></div>'
-            f'<div class="card"><h4>Compras (total do mês)</h4><p class="value">{brl(ref["COMPRA_TOTAL"])}</p>'
+            f'<div class="card"><h4>Compras (total do mês)</h4><p class="value">{brl(ref["COMPRAS"])}</p>'
             f'{real_comp_html}'
             f'<div class="muted">A emitir: {brl(ref["COMPRA_EMITIR"])}</div></div>'
             f'<div class="card"><h4>LAT do mês</h4><p class="value">{brl(lat_total)}</p>'
@@ -384,7 +611,8 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
         st.markdown(html_ref, unsafe_allow_html=True)
 
         # PIS/COFINS (base LAT do mês)
-        pis_mes, cofins_mes = pis_cofins(lat_total)
+        i_sel = horizonte.index(mes_selecionado)
+        pis_mes, cofins_mes = float(grade_cenarios.PIS[i_sel]), float(grade_cenarios.COFINS[i_sel])
         html_trib = (
             '<div class="section"><h3>Tributos Mensais (Base LAT)</h3></div>'
             '<div class="metric-grid">'
@@ -395,18 +623,8 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
         st.markdown(html_trib, unsafe_allow_html=True)
 
         # IRPJ/CSLL apenas em Mar/Jun/Set/Dez
-        if mes_selecionado in [3, 6, 9, 12]:
-            lat_anual = {}
-            for m in range(1, 13):
-                ymm = 2025*100 + m
-                if m < mes_vig_num:
-                    lat_anual[ymm] = val_real(m, "LAT")
-                elif m == mes_vig_num:
-                    lat_anual[ymm] = val_real(m, "LAT") + (st.session_state["lat_plan"][ymm] if sim_vigente else 0.0)
-                else:
-                    lat_anual[ymm] = st.session_state["lat_plan"][ymm]
-            trib = irpj_csll_trimestre(lat_anual)
-            irpj_mes, csll_mes = trib.get(2025*100 + mes_selecionado, (0.0, 0.0))
+        if mes_selecionado % 100 in [3, 6, 9, 12]:
+            irpj_mes, csll_mes = plano_modelo.irpj_csll(mes_selecionado)
             html_ir = (
                 '<div class="metric-grid">'
                 f'<div class="card warn"><h4>IRPJ (Trimestre)</h4><p class="value">{brl(irpj_mes)}</p>'
@@ -422,9 +640,9 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
             c = cenarios[margem_pct]
             classe_css = "ok" if margem_pct >= 20 else "warn" if margem_pct >= 10 else "bad"
             cards.append(
-                f'<div class="card {classe_css}"><h4>Margem {margem_pct}%</h4>'
-                f'<p class="value">{brl(c["FAT_TOTAL"])}</p>'
-                f'<div class="muted">Compras (total): {brl(c["COMPRA_TOTAL"])}</div>'
+                f'<div class="card {classe_css}"><h4>Margem {margem_pct:g}%</h4>'
+                f'<p class="value">{brl(c["FAT"])}</p>'
+                f'<div class="muted">Compras (total): {brl(c["COMPRAS"])}</div>'
                 f'<div class="muted">A emitir (Saída): {brl(c["FAT_EMITIR"])}</div>'
                 f'<div class="muted">A emitir (Entrada): {brl(c["COMPRA_EMITIR"])}</div>'
                 f'</div>'
@@ -432,76 +650,328 @@ with st.expander(f"🎲 {MESES_PT[mes_selecionado]} 2025 - Cenários por margem"
         st.markdown('<div class="kpi-grid">' + ''.join(cards) + '</div>', unsafe_allow_html=True)
 
 # =========================
-# Exportações (margem 20% como referência visual)
+# Ritmo diário do mês vigente (incremental) e projeção de fechamento
 # =========================
-st.markdown("---")
+# Reconstruído só quando muda a origem (empresa, mês vigente, conteúdo da planilha
+# base); lotes anexados pela barra lateral entram incrementalmente, uma vez cada.
+acomp = st.session_state.get("acomp_diario")
+_acomp_origem = (empresa, vigente_yyyymm, versao_base)
+if acomp is None or st.session_state.get("acomp_origem") != _acomp_origem:
+    acomp = AcompanhamentoDiario.de_notas(df_raw, vigente_yyyymm)
+    st.session_state["acomp_origem"] = _acomp_origem
+for _id, _df in notas_delta.items():
+    acomp.adicionar(_df, lote=_id)
+st.session_state["acomp_diario"] = acomp
+# Notas do mês armazenadas em outra sessão (deltas antigos) não estão nos arquivos desta
+_acomp_parcial = acomp.fingerprint != agg_store.fingerprints(empresa).get(vigente_yyyymm, (0, 0))
+
+with st.expander(f"📅 Ritmo diário — {yyyymm_to_label(vigente_yyyymm)}", expanded=False):
+    if _acomp_parcial:
+        st.caption("O armazenamento tem notas deste mês que não vieram da planilha nem dos deltas desta sessão; o ritmo considera só estes.")
+    if acomp.ultimo_dia == 0:
+        st.caption("Nenhuma nota no mês vigente.")
+    else:
+        hoje = datetime.today()
+        dia_padrao = hoje.day if hoje.year * 100 + hoje.month == vigente_yyyymm else acomp.ultimo_dia
+        rd1, rd2, rd3 = st.columns(3)
+        with rd1:
+            ate_dia = st.number_input("Ritmo até o dia", 1, acomp.n_dias, int(max(dia_padrao, 1)), key="ritmo_ate_dia")
+        with rd2:
+            uteis = st.checkbox("Contar só dias úteis", value=False, key="ritmo_uteis")
+        with rd3:
+            margem_ritmo = st.selectbox(
+                "Cenário", MARGENS, index=MARGENS.index(st.session_state.get("margem_referencia") or 0.20),
+                format_func=lambda r: f"{r*100:g}%", key="ritmo_margem",
+            )
+        proj = acomp.projecao(int(ate_dia), uteis)
+        comp = comparar_com_cenario(proj, plano_modelo.lat_total(vigente_yyyymm), margem_ritmo)
+        st.markdown(
+            '<div class="metric-grid">'
+            f'<div class="card"><h4>FAT projetado</h4><p class="value">{brl(proj["FAT"])}</p>'
+            f'<div class="muted">Cenário {margem_ritmo*100:g}%: {brl(comp["FAT_CENARIO"])} ({brl(comp["DIF_FAT"])})</div></div>'
+            f'<div class="card"><h4>Compras projetadas</h4><p class="value">{brl(proj["COMPRAS"])}</p>'
+            f'<div class="muted">Cenário: {brl(comp["COMPRAS_CENARIO"])} ({brl(comp["DIF_COMPRAS"])})</div></div>'
+            f'<div class="card"><h4>LAT projetado</h4><p class="value">{brl(proj["LAT"])}</p>'
+            f'<div class="muted">Plano: {brl(comp["LAT_PLANO"])} ({brl(comp["DIF_LAT"])})</div></div>'
+            '</div>',
+            unsafe_allow_html=True,
+        )
+        st.caption(
+            f"{proj['FRACAO']*100:.0f}% do mês decorrido. Margem projetada: "
+            + ("—" if np.isnan(comp["MARGEM_PROJETADA"]) else f"{comp['MARGEM_PROJETADA']*100:.1f}%")
+            + ". Projeção = acumulado ÷ fração decorrida."
+        )
+        serie_dia = acomp.serie()
+        fig_dia = go.Figure()
+        for campo in ("FAT", "COMPRAS", "LAT"):
+            fig_dia.add_scatter(x=serie_dia.index[: int(ate_dia)], y=serie_dia[f"{campo}_ACUM"].iloc[: int(ate_dia)], name=f"{campo} acumulado")
+            fig_dia.add_scatter(
+                x=[int(ate_dia), acomp.n_dias], y=[proj[f"{campo}_ATE_AGORA"], proj[campo]],
+                line=dict(dash="dot"), name=f"{campo} projetado",
+            )
+        fig_dia.update_layout(height=340, margin=dict(l=10, r=10, t=10, b=10), xaxis_title="Dia", yaxis_tickformat=",.0f")
+        st.plotly_chart(fig_dia, use_container_width=True)
 
-rows = []
-lat_dict_anual = {}
-for m in range(1, 13):
-    ymm = 2025*100 + m
-    lat_r = val_real(m, "LAT")
-    if m < mes_vig_num:
-        lat_tot = lat_r
-    elif m == mes_vig_num:
-        lat_tot = lat_r + (st.session_state["lat_plan"][ymm] if sim_vigente else 0.0)
+# =========================
+# Limites e metas por trimestre (solver analítico, sem tentativa e erro)
+# =========================
+with st.expander("🧮 Limites e metas por trimestre", expanded=False):
+    alvo_ll = st.number_input(
+        "Meta de Lucro Líquido por trimestre (R$)",
+        min_value=0.0,
+        step=1000.0,
+        format="%.2f",
+        value=0.0,
+        help="Deixe 0 para ver apenas a folga até o adicional de IRPJ.",
+        key="alvo_ll_tri",
+    )
+    df_solver = solver_trimestres(
+        horizonte,
+        [plano_modelo.lat_total(ymm) for ymm in horizonte],
+        [not mes_travado(ymm) for ymm in horizonte],
+        MARGENS,
+        alvo_ll=alvo_ll if alvo_ll > 0 else None,
+        aliquota_icms=aliquota_icms,
+    )
+    if df_solver.empty:
+        st.caption("Nenhum trimestre com meses editáveis no horizonte.")
     else:
-        lat_tot = st.session_state["lat_plan"][ymm]
-    lat_dict_anual[ymm] = lat_tot
-    if lat_tot != 0:
-        fat = lat_tot / 0.20
-        compras = fat - lat_tot
-        icms = 0.05 * fat
+        # Pivot na chave numérica (AAAA*10 + T): ordem cronológica mesmo cruzando o ano;
+        # o rótulo "T1/2026" só entra na exibição
+        def _rotular(tab: pd.DataFrame) -> pd.DataFrame:
+            return tab.rename(index=lambda t: f"T{t % 10}/{t // 10}").rename_axis("Trimestre")
+
+        def _por_margem(campo: str, prefixo: str) -> pd.DataFrame:
+            tab = df_solver.pivot(index="trimestre", columns="margem", values=campo)
+            return tab.rename(columns=lambda r: f"{prefixo} {r*100:g}%").rename_axis(columns=None)
+
+        folga = df_solver.drop_duplicates("trimestre").set_index("trimestre")[["LAT_TRI", "FOLGA_LAT"]]
+        folga = folga.join(_por_margem("FAT_MAX_SEM_ADICIONAL", "FAT máx."))
+        folga = folga.rename(columns={"LAT_TRI": "LAT do trimestre", "FOLGA_LAT": "Folga LAT até adicional"})
+        st.markdown("**Folga até o adicional de IRPJ (base trimestral de R$ 60.000)**")
+        st.dataframe(_rotular(folga).apply(brl_series), use_container_width=True)
+        if alvo_ll > 0:
+            metas = _por_margem("LAT_ADICIONAL", "LAT adicional")
+            metas = metas.join(_por_margem("FAT_EMITIR", "FAT a emitir"))
+            metas = metas.join(_por_margem("COMPRA_EMITIR", "Compras a emitir"))
+            st.markdown(f"**Para Lucro Líquido de {brl(alvo_ll)} no trimestre**")
+            st.dataframe(_rotular(metas).apply(brl_series), use_container_width=True)
+            st.caption(f"“—” indica margem que não atinge a meta. Premissa: margem uniforme no trimestre ({rotulo_icms} do FAT).")
+
+# =========================
+# Mapa de cenários (meses × margens)
+# =========================
+CAMPOS_GRADE = {
+    "FAT_EMITIR": "Faturamento a emitir",
+    "COMPRA_EMITIR": "Compras a emitir",
+    "FAT": "Faturamento (total do mês)",
+    "COMPRAS": "Compras (total do mês)",
+    "ICMS": rotulo_icms,
+}
+with st.expander("🗺️ Mapa de cenários (mês × margem)", expanded=False):
+    campo_grade = st.segmented_control(
+        "Métrica:",
+        options=list(CAMPOS_GRADE),
+        default="FAT_EMITIR",
+        format_func=CAMPOS_GRADE.get,
+        key="campo_grade",
+    ) or "FAT_EMITIR"
+    tab_grade = grade_cenarios.tabela(campo_grade)
+    tab_grade.index = [yyyymm_to_label(ymm) for ymm in tab_grade.index]
+    fig = px.imshow(
+        tab_grade,
+        aspect="auto",
+        color_continuous_scale="Blues",
+        labels={"x": "Margem (%)", "y": "Mês", "color": "R$"},
+    )
+    fig.update_layout(height=max(320, 22 * len(tab_grade)), margin=dict(l=0, r=0, t=10, b=0))
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption("Meses anteriores ao vigente aparecem vazios nas métricas “a emitir”. PIS/COFINS independem da margem.")
+
+# =========================
+# Previsão (sazonal + tendência, com banda de 95%)
+# =========================
+with st.expander("🔮 Previsão a partir do histórico", expanded=False):
+    campo_prev = st.segmented_control("Série", ["LAT", "FAT"], default="LAT", key="previsao_campo") or "LAT"
+    prev = previsoes[campo_prev]
+    n_obs = int(prev.n_observados[0])
+    if n_obs == 0:
+        st.caption("Sem histórico realizado anterior ao mês vigente para ajustar a previsão.")
     else:
-        fat = compras = icms = 0.0
-    pis, cof = pis_cofins(lat_tot)
-    rows.append({
-        "Mês": MESES_PT[m],
-        "LAT": lat_tot,
-        "Faturamento (20%)": fat,
-        "Compras (20%)": compras,
-        "ICMS (5%)": icms,
-        "PIS": pis,
-        "COFINS": cof,
-    })
-
-df_consol = pd.DataFrame(rows)
-tot = df_consol.sum(numeric_only=True)
-tot["Mês"] = "TOTAL"
-df_consol = pd.concat([df_consol, tot.to_frame().T], ignore_index=True)
+        # Realizado (meses do horizonte antes do vigente) seguido da previsão do vigente em diante
+        tab_prev = prev.tabela(empresa)
+        rotulos = [yyyymm_to_label(m) for m in tab_prev["yyyymm"]]
+        passado = [ymm for ymm in horizonte if ymm < vigente_yyyymm]
+        fig_prev = go.Figure([
+            go.Scatter(x=[yyyymm_to_label(m) for m in passado], y=realizado_df.loc[passado, campo_prev],
+                       mode="lines+markers", name="Realizado"),
+            go.Scatter(x=rotulos, y=tab_prev["superior"], line=dict(width=0), showlegend=False, hoverinfo="skip"),
+            go.Scatter(x=rotulos, y=tab_prev["inferior"], line=dict(width=0), fill="tonexty",
+                       fillcolor="rgba(37,99,235,0.15)", name="Banda 95%"),
+            go.Scatter(x=rotulos, y=tab_prev["previsto"], line=dict(dash="dash"), name="Previsto"),
+        ])
+        fig_prev.update_layout(height=360, margin=dict(l=10, r=10, t=10, b=10), yaxis_tickformat=",.0f")
+        st.plotly_chart(fig_prev, use_container_width=True)
+        modelo = "tendência + sazonalidade" if n_obs >= MIN_MESES_SAZONAL else ("tendência amortecida" if n_obs >= MIN_MESES_TENDENCIA else "média")
+        st.caption(
+            f"Ajuste sobre {n_obs} meses realizados ({modelo}). "
+            "“🔮 Preencher com previsão” (barra lateral) copia o LAT previsto para os meses editáveis."
+        )
+
+# =========================
+# Exportações (margem 20% como referência visual)
+# =========================
+st.markdown("---")
+
+# Tributos + cenário 20% de todo o horizonte, montados dos derivados em cache do modelo
+df_horizonte = plano_modelo.tabela()
+df_consol = pd.DataFrame({
+    "Mês": [yyyymm_to_label(ymm) for ymm in df_horizonte["yyyymm"]],
+    "LAT": df_horizonte["LAT"],
+    "Faturamento (20%)": df_horizonte["FAT"],
+    "Compras (20%)": df_horizonte["COMPRAS"],
+    rotulo_icms: df_horizonte["ICMS"],
+    "PIS": df_horizonte["PIS"],
+    "COFINS": df_horizonte["COFINS"],
+    "IRPJ": df_horizonte["IRPJ"],
+    "CSLL": df_horizonte["CSLL"],
+})
+# Linha TOTAL dos totais correntes do modelo (mantidos por delta a cada edição)
+tot = plano_modelo.totais()
+df_consol = pd.concat([df_consol, pd.DataFrame([{
+    "Mês": "TOTAL",
+    "LAT": tot["LAT"],
+    "Faturamento (20%)": tot["FAT"],
+    "Compras (20%)": tot["COMPRAS"],
+    rotulo_icms: tot["ICMS"],
+    "PIS": tot["PIS"],
+    "COFINS": tot["COFINS"],
+    "IRPJ": tot["IRPJ"],
+    "CSLL": tot["CSLL"],
+}])], ignore_index=True)
 
 c1, c2 = st.columns(2)
 with c1:
-    r = 0.20
-    lat_t_mes = lat_dict_anual.get(2025*100 + st.session_state["mes_selecionado"], 0.0)
-    fat_t_mes = lat_t_mes / r if r > 0 else 0.0
-    comp_t_mes = fat_t_mes - lat_t_mes
-    pis_m, cof_m = pis_cofins(lat_t_mes)
+    sel_ymm = st.session_state["mes_selecionado"]
+    linha_mes = df_horizonte.loc[df_horizonte["yyyymm"] == sel_ymm].iloc[0]
     df_mes = pd.DataFrame([{
-        "Mês": MESES_PT[st.session_state["mes_selecionado"]],
-        "LAT": lat_t_mes,
-        "FAT (20%)": fat_t_mes,
-        "Compras (20%)": comp_t_mes,
-        "PIS": pis_m,
-        "COFINS": cof_m,
+        "Mês": yyyymm_to_label(sel_ymm),
+        "LAT": linha_mes["LAT"],
+        "FAT (20%)": linha_mes["FAT"],
+        "Compras (20%)": linha_mes["COMPRAS"],
+        "PIS": linha_mes["PIS"],
+        "COFINS": linha_mes["COFINS"],
     }])
     st.download_button(
-        f"📄 Baixar {MESES_PT[st.session_state['mes_selecionado']]} CSV",
+        f"📄 Baixar {yyyymm_to_label(sel_ymm)} CSV",
         df_mes.to_csv(index=False).encode("utf-8"),
-        file_name=f"simulacao_{MESES_PT[st.session_state['mes_selecionado']].lower()}_2025.csv",
+        file_name=f"simulacao_{MESES_PT[sel_ymm % 100].lower()}_{sel_ymm // 100}.csv",
         mime="text/csv",
     )
 
 with c2:
     st.download_button(
-        "📊 Baixar Consolidado Anual XLSX",
-        to_excel_bytes(df_consol),
-        file_name="simulacao_anual_2025.xlsx",
+        "📊 Baixar Consolidado XLSX",
+        to_excel_bytes(df_consol, {"ICMS por CST": icms_tab, "Qualidade": qualidade.totais(), "Qualidade (amostras)": qualidade.amostras}),
+        file_name=f"simulacao_{periodo_arquivo}.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
-with st.expander("👁️ Preview Consolidado Anual", expanded=False):
+with st.expander(f"👁️ Preview Consolidado {periodo_label}", expanded=False):
     prev = df_consol.copy()
-    for col in ["LAT", "Faturamento (20%)", "Compras (20%)", "ICMS (5%)", "PIS", "COFINS"]:
-        prev[col] = prev[col].apply(lambda x: brl(x))
+    cols_brl = ["LAT", "Faturamento (20%)", "Compras (20%)", rotulo_icms, "PIS", "COFINS", "IRPJ", "CSLL"]
+    prev[cols_brl] = prev[cols_brl].apply(brl_series)
     st.dataframe(prev, use_container_width=True, hide_index=True)
+
+# =========================
+# Comparação de planos salvos (avaliação vetorizada)
+# =========================
+with st.expander("⚖️ Comparar planos salvos", expanded=False):
+    if not planos_salvos:
+        st.caption("Salve ao menos um plano na barra lateral para comparar.")
+    else:
+        selecionados = st.multiselect(
+            "Planos",
+            planos_salvos,
+            default=planos_salvos[: min(3, len(planos_salvos))],
+            format_func=lambda p: f"{p['nome']} v{p['versao']}",
+        )
+        incluir_atual = st.checkbox("Incluir plano atual (não salvo)", value=True)
+        nomes = [f"{p['nome']} v{p['versao']}" for p in selecionados]
+        planos = [plano_store.carregar(empresa, p["nome"], p["versao"]) for p in selecionados]
+        if incluir_atual:
+            nomes.append("Atual")
+            planos.append({ymm: st.session_state["lat_plan"][ymm] for ymm in horizonte})
+        if planos:
+            lat_mat = compor_lat_efetivo(
+                matriz_planos(planos, horizonte),
+                realizado_df["LAT"].to_numpy(),
+                horizonte,
+                vigente_yyyymm,
+                sim_vigente,
+            )
+            df_comp = avaliar_planos(nomes, horizonte, lat_mat, MARGENS, aliquota_icms=aliquota_icms)
+            # Mantém os valores numéricos (ordenáveis); só a exibição vira R$ 1.234,56
+            st.dataframe(
+                estilo_brl(df_comp, df_comp.columns[1:]),
+                use_container_width=True,
+                hide_index=True,
+            )
+            st.download_button(
+                "📊 Baixar Comparação XLSX",
+                to_excel_bytes(df_comp),
+                file_name=f"comparacao_planos_{empresa}_{periodo_arquivo}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+
+# =========================
+# Comparação de regimes tributários (lote: regimes × empresas × meses)
+# =========================
+with st.expander("🏛️ Comparar regimes tributários", expanded=False):
+    st.caption(
+        "Lucro Presumido como calculado no app × Lucro Real trimestral (IRPJ/CSLL sobre LAT − despesas; "
+        "PIS/COFINS não cumulativos sobre LAT). Meses futuros usam FAT = LAT / margem."
+    )
+    rc1, rc2 = st.columns(2)
+    with rc1:
+        despesas_mes = st.number_input(
+            "Despesas operacionais mensais (R$)", min_value=0.0, value=0.0, step=1000.0, key="regime_despesas"
+        )
+    with rc2:
+        margem_regime = st.selectbox(
+            "Margem dos meses simulados", MARGENS, index=MARGENS.index(0.20),
+            format_func=lambda r: f"{r*100:g}%", key="regime_margem",
+        )
+
+    # Empresa atual: realizado + plano (mesma composição do modelo incremental)
+    lat_real_arr = realizado_df["LAT"].to_numpy()
+    ate_vigente = np.asarray(horizonte) <= vigente_yyyymm
+    lat_ef = np.array([plano_modelo.lat_total(ymm) for ymm in horizonte])
+    lat_real_ef = np.where(ate_vigente, lat_real_arr, 0.0)
+    fat_ef = np.where(ate_vigente, realizado_df["FAT"].to_numpy(), 0.0) + (lat_ef - lat_real_ef) / margem_regime
+    regimes_empresa = [replace(r, icms=aliquota_icms) for r in REGIMES.values()]
+    res_atual = avaliar_regimes(horizonte, lat_ef, fat_ef, despesas_mes, regimes_empresa, empresas=[empresa])
+    tot_atual = res_atual.totais()
+    st.markdown(f"**{empresa} — {periodo_label}**")
+    st.dataframe(
+        estilo_brl(tot_atual.drop(columns="empresa"), ["LAT", *CAMPOS_RESULTADO, "excesso_vs_melhor"]),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    # Toda a carteira: realizado armazenado em agregados.sqlite (uma consulta + uma passada)
+    nomes_emp, mat = agg_store.matriz(horizonte)
+    if len(nomes_emp) > 1:
+        res_todas = avaliar_regimes(horizonte, mat["LAT"], mat["FAT"], empresas=nomes_emp)
+        rank = res_todas.ranking()
+        st.markdown(f"**Carteira ({len(nomes_emp)} empresas, somente realizado)**")
+        st.dataframe(
+            estilo_brl(rank, ["carga", "LL", "economia"]),
+            use_container_width=True, hide_index=True,
+        )
+        st.download_button(
+            "📊 Baixar Regimes XLSX",
+            to_excel_bytes(rank, {"Detalhe": res_todas.totais(), "Parâmetros": tabela_regimes(REGIMES.values())}),
+            file_name=f"regimes_{periodo_arquivo}.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
@@ -0,0 +1,313 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Union
+
+import os
+
+import pandas as pd
+
+from calc import (
+    COL_MAP,
+    TIPO_SAIDA,
+    TIPO_ENTRADA,
+    CLASSIF_REVENDA,
+    NATUREZA_DEVOLUCAO,
+    FORMATOS_DATA,
+    realizado_por_mes,
+)
+
+# ============================================================
+# Backends de consulta (pandas em memória / DuckDB / Polars lazy)
+# ============================================================
+# Mesmas regras de prepare_dataframe + realizado_por_mes, executadas como
+# consulta lazy e multi-thread diretamente sobre Parquet/CSV (ou DataFrame).
+# DuckDB e Polars são opcionais: importados só quando o backend é criado.
+
+Fonte = Union[pd.DataFrame, str, "os.PathLike[str]"]
+
+# Padrão usado por parse_brl no fallback (primeiro número do texto)
+_REGEX_NUMERO = r"-?\d+(?:[.,]\d+)?"
+
+
+def _meses_ou_ano(meses: Optional[Sequence[int]], ano: int) -> List[int]:
+    return [int(m) for m in meses] if meses is not None else [ano * 100 + m for m in range(1, 13)]
+
+
+def _mapa_colunas(colunas: Sequence[str]) -> Dict[str, str]:
+    """Nome padronizado -> nome original (mesma regra case-insensitive de prepare_dataframe)."""
+    cols_lower = {c.lower(): c for c in colunas}
+    out: Dict[str, str] = {}
+    for k_lower, std_name in COL_MAP.items():
+        if k_lower in cols_lower:
+            out[std_name] = cols_lower[k_lower]
+    return out
+
+
+def _dict_saida(df: pd.DataFrame, months: List[int]) -> Dict[int, Dict[str, float]]:
+    """DataFrame (yyyymm, FAT, COMPRAS) -> dict no formato de realizado_por_mes."""
+    agg = df.set_index("yyyymm")[["FAT", "COMPRAS"]].reindex(months, fill_value=0.0).fillna(0.0)
+    return {
+        m: {"FAT": float(agg.at[m, "FAT"]), "COMPRAS": float(agg.at[m, "COMPRAS"]),
+            "LAT": float(agg.at[m, "FAT"] - agg.at[m, "COMPRAS"])}
+        for m in months
+    }
+
+
+def _extensao(caminho: str) -> str:
+    ext = os.path.splitext(str(caminho))[1].lower()
+    if ext not in (".parquet", ".csv"):
+        raise ValueError(f"Formato não suportado pelo backend lazy: {ext!r} (use .parquet ou .csv)")
+    return ext
+
+
+# ---------------------------
+# pandas (referência)
+# ---------------------------
+class BackendPandas:
+    """Caminho de referência: lê a fonte inteira em memória e usa calc.realizado_por_mes."""
+
+    nome = "pandas"
+
+    def ler(self, fonte: Fonte) -> pd.DataFrame:
+        if isinstance(fonte, pd.DataFrame):
+            return fonte
+        caminho = str(fonte)
+        ext = os.path.splitext(caminho)[1].lower()
+        if ext == ".parquet":
+            return pd.read_parquet(caminho)
+        if ext == ".csv":
+            return pd.read_csv(caminho)
+        return pd.read_excel(caminho, engine="openpyxl")
+
+    def realizado_por_mes(self, fonte: Fonte, ano: int = 2025, meses: Optional[Sequence[int]] = None) -> Dict[int, Dict[str, float]]:
+        return realizado_por_mes(self.ler(fonte), ano=ano, meses=list(meses) if meses is not None else None)
+
+
+# ---------------------------
+# DuckDB (SQL lazy, multi-thread)
+# ---------------------------
+class BackendDuckDB:
+    """Executa normalização + agregação como uma única consulta DuckDB."""
+
+    nome = "duckdb"
+
+    def __init__(self, threads: Optional[int] = None) -> None:
+        try:
+            import duckdb
+        except ImportError as exc:  # pragma: no cover - depende do ambiente
+            raise ImportError("Backend 'duckdb' requer o pacote duckdb (pip install duckdb).") from exc
+        self._con = duckdb.connect()
+        if threads:
+            self._con.execute(f"SET threads TO {int(threads)}")
+
+    def _relacao(self, fonte: Fonte) -> str:
+        if isinstance(fonte, pd.DataFrame):
+            self._con.register("notas_df", fonte)
+            return "notas_df"
+        caminho = str(fonte).replace("'", "''")
+        if _extensao(caminho) == ".parquet":
+            return f"read_parquet('{caminho}')"
+        # Tudo como texto: datas dd/mm/aaaa não são reinterpretadas pelo sniffer
+        return f"read_csv('{caminho}', header=true, all_varchar=true)"
+
+    @staticmethod
+    def _q(col: str) -> str:
+        return '"' + col.replace('"', '""') + '"'
+
+    def _sql_texto(self, col: Optional[str]) -> str:
+        # normalize_str: remove acentos, MAIÚSCULAS, strip
+        if col is None:
+            return "''"
+        return f"coalesce(upper(trim(strip_accents(CAST({self._q(col)} AS VARCHAR)))), '')"
+
+    def _sql_valor(self, col: Optional[str], tipo: str) -> str:
+        # parse_brl: numérico passa direto (NaN -> 0); texto BR com fallback por regex; falha -> 0
+        if col is None:
+            return "0.0"
+        c = self._q(col)
+        if any(t in tipo.upper() for t in ("INT", "DOUBLE", "FLOAT", "DECIMAL", "REAL")):
+            return f"CASE WHEN {c} IS NULL OR isnan(CAST({c} AS DOUBLE)) THEN 0.0 ELSE CAST({c} AS DOUBLE) END"
+        s = f"replace(replace(replace(CAST({c} AS VARCHAR), 'R$', ''), ' ', ''), chr(160), '')"
+        # Com vírgula, parse_brl converte o texto para o formato com ponto antes de tentar
+        # (e o fallback por regex opera sobre o texto já convertido)
+        texto = f"CASE WHEN strpos({s}, ',') > 0 THEN replace(replace({s}, '.', ''), ',', '.') ELSE {s} END"
+        direto = f"TRY_CAST({texto} AS DOUBLE)"
+        frag = f"NULLIF(regexp_extract({texto}, '{_REGEX_NUMERO}'), '')"
+        fallback = f"TRY_CAST(replace(replace({frag}, '.', ''), ',', '.') AS DOUBLE)"
+        return (
+            f"CASE WHEN {c} IS NULL OR {s} = '' OR upper({s}) = 'NAN' THEN 0.0 "
+            f"ELSE COALESCE({direto}, {fallback}, 0.0) END"
+        )
+
+    def _sql_data(self, col: Optional[str], tipo: str) -> str:
+        if col is None:
+            return "CAST(NULL AS TIMESTAMP)"
+        c = self._q(col)
+        if "TIMESTAMP" in tipo.upper() or "DATE" in tipo.upper():
+            return f"CAST({c} AS TIMESTAMP)"
+        formatos = ", ".join(f"'{f}'" for f in FORMATOS_DATA)
+        return f"try_strptime(trim(CAST({c} AS VARCHAR)), [{formatos}])"
+
+    def preparar_sql(self, fonte: Fonte) -> str:
+        """SQL (lazy) com as colunas normalizadas: data, yyyymm, tipo_nota, classificacao, natureza_operacao, valor_total."""
+        rel = self._relacao(fonte)
+        desc = self._con.execute(f"DESCRIBE SELECT * FROM {rel}").fetchall()
+        tipos = {row[0]: str(row[1]) for row in desc}
+        mapa = _mapa_colunas(list(tipos))
+
+        def col(nome: str) -> Optional[str]:
+            return mapa.get(nome)
+
+        data_sql = self._sql_data(col("data_emissao"), tipos.get(col("data_emissao") or "", ""))
+        return (
+            "SELECT data, CAST(year(data) * 100 + month(data) AS BIGINT) AS yyyymm, "
+            "tipo_nota, classificacao, natureza_operacao, valor_total FROM ("
+            f"SELECT {data_sql} AS data, "
+            f"{self._sql_texto(col('tipo_nota'))} AS tipo_nota, "
+            f"{self._sql_texto(col('classificacao'))} AS classificacao, "
+            f"{self._sql_texto(col('natureza_operacao'))} AS natureza_operacao, "
+            f"{self._sql_valor(col('valor_total'), tipos.get(col('valor_total') or '', ''))} AS valor_total "
+            f"FROM {rel})"
+        )
+
+    def realizado_por_mes(self, fonte: Fonte, ano: int = 2025, meses: Optional[Sequence[int]] = None) -> Dict[int, Dict[str, float]]:
+        months = _meses_ou_ano(meses, ano)
+        if not months:
+            return {}   # "IN ()" é erro de sintaxe no DuckDB; nada a agregar
+        lista = ", ".join(str(m) for m in months)
+        sql = (
+            "SELECT yyyymm, "
+            f"SUM(CASE WHEN tipo_nota = '{TIPO_SAIDA}' AND strpos(natureza_operacao, '{NATUREZA_DEVOLUCAO}') = 0 "
+            "THEN valor_total ELSE 0 END) AS FAT, "
+            f"SUM(CASE WHEN tipo_nota = '{TIPO_ENTRADA}' AND classificacao = '{CLASSIF_REVENDA}' THEN valor_total ELSE 0 END) "
+            f"- SUM(CASE WHEN strpos(natureza_operacao, '{NATUREZA_DEVOLUCAO}') > 0 THEN valor_total ELSE 0 END) AS COMPRAS "
+            f"FROM ({self.preparar_sql(fonte)}) WHERE yyyymm IN ({lista}) GROUP BY yyyymm"
+        )
+        return _dict_saida(self._con.execute(sql).df(), months)
+
+
+# ---------------------------
+# Polars (LazyFrame, multi-thread)
+# ---------------------------
+class BackendPolars:
+    """Executa normalização + agregação como um LazyFrame Polars (scan_parquet/scan_csv)."""
+
+    nome = "polars"
+
+    def __init__(self) -> None:
+        try:
+            import polars
+        except ImportError as exc:  # pragma: no cover - depende do ambiente
+            raise ImportError("Backend 'polars' requer o pacote polars (pip install polars).") from exc
+        self.pl = polars
+
+    def _lazy(self, fonte: Fonte):
+        pl = self.pl
+        if isinstance(fonte, pd.DataFrame):
+            return pl.from_pandas(fonte).lazy()
+        caminho = str(fonte)
+        if _extensao(caminho) == ".parquet":
+            return pl.scan_parquet(caminho)
+        # Tudo como texto (como no DuckDB): a normalização decide datas e valores
+        return pl.scan_csv(caminho, infer_schema=False)
+
+    def _texto(self, col: Optional[str]):
+        pl = self.pl
+        if col is None:
+            return pl.lit("")
+        return (
+            pl.col(col).cast(pl.Utf8).fill_null("")
+            .str.normalize("NFKD").str.replace_all(r"[^\x00-\x7F]", "")
+            .str.to_uppercase().str.strip_chars()
+        )
+
+    def _valor(self, col: Optional[str], dtype):
+        pl = self.pl
+        if col is None:
+            return pl.lit(0.0)
+        if dtype.is_numeric():
+            v = pl.col(col).cast(pl.Float64)
+            return pl.when(v.is_null() | v.is_nan()).then(0.0).otherwise(v)
+        s = (
+            pl.col(col).cast(pl.Utf8).str.replace_all("R$", "", literal=True)
+            .str.replace_all(" ", "", literal=True).str.replace_all("\u00a0", "", literal=True)
+        )
+        # Mesmo texto intermediário de parse_brl (vírgula -> formato com ponto) para o cast e o fallback
+        br = s.str.replace_all(".", "", literal=True).str.replace_all(",", ".", literal=True)
+        texto = pl.when(s.str.contains(",", literal=True)).then(br).otherwise(s)
+        direto = texto.cast(pl.Float64, strict=False)
+        frag = texto.str.extract(_REGEX_NUMERO, 0)
+        fallback = frag.str.replace_all(".", "", literal=True).str.replace_all(",", ".", literal=True).cast(pl.Float64, strict=False)
+        vazio = s.is_null() | (s == "") | (s.str.to_uppercase() == "NAN")
+        return pl.when(vazio).then(0.0).otherwise(pl.coalesce(direto, fallback, pl.lit(0.0)))
+
+    def _data(self, col: Optional[str], dtype):
+        pl = self.pl
+        if col is None:
+            return pl.lit(None, dtype=pl.Datetime)
+        if dtype.is_temporal():
+            return pl.col(col).cast(pl.Datetime)
+        s = pl.col(col).cast(pl.Utf8).str.strip_chars()
+        return pl.coalesce([s.str.strptime(pl.Datetime, f, strict=False) for f in FORMATOS_DATA])
+
+    def preparar(self, fonte: Fonte):
+        """LazyFrame com as colunas normalizadas: data, yyyymm, tipo_nota, classificacao, natureza_operacao, valor_total."""
+        pl = self.pl
+        lf = self._lazy(fonte)
+        schema = lf.collect_schema()
+        mapa = _mapa_colunas(list(schema.names()))
+
+        def col(nome: str) -> Optional[str]:
+            return mapa.get(nome)
+
+        def dtype(nome: str):
+            c = col(nome)
+            return schema[c] if c is not None else pl.Utf8
+
+        return lf.select(
+            self._data(col("data_emissao"), dtype("data_emissao")).alias("data"),
+            self._texto(col("tipo_nota")).alias("tipo_nota"),
+            self._texto(col("classificacao")).alias("classificacao"),
+            self._texto(col("natureza_operacao")).alias("natureza_operacao"),
+            self._valor(col("valor_total"), dtype("valor_total")).alias("valor_total"),
+        ).with_columns(
+            (pl.col("data").dt.year().cast(pl.Int64) * 100 + pl.col("data").dt.month().cast(pl.Int64)).alias("yyyymm")
+        )
+
+    def realizado_por_mes(self, fonte: Fonte, ano: int = 2025, meses: Optional[Sequence[int]] = None) -> Dict[int, Dict[str, float]]:
+        pl = self.pl
+        months = _meses_ou_ano(meses, ano)
+        devol = pl.col("natureza_operacao").str.contains(NATUREZA_DEVOLUCAO, literal=True)
+        valor = pl.col("valor_total")
+        agg = (
+            self.preparar(fonte)
+            .filter(pl.col("yyyymm").is_in(months))
+            .group_by("yyyymm")
+            .agg(
+                pl.when((pl.col("tipo_nota") == TIPO_SAIDA) & ~devol).then(valor).otherwise(0.0).sum().alias("FAT"),
+                (
+                    pl.when((pl.col("tipo_nota") == TIPO_ENTRADA) & (pl.col("classificacao") == CLASSIF_REVENDA)).then(valor).otherwise(0.0)
+                    - pl.when(devol).then(valor).otherwise(0.0)
+                ).sum().alias("COMPRAS"),
+            )
+            .collect()
+        )
+        return _dict_saida(agg.to_pandas(), months)
+
+
+# ============================================================
+# Registro
+# ============================================================
+BACKENDS = {
+    "pandas": BackendPandas,
+    "duckdb": BackendDuckDB,
+    "polars": BackendPolars,
+}
+
+
+def get_backend(nome: str = "pandas"):
+    """Instancia o backend pelo nome ('pandas', 'duckdb' ou 'polars')."""
+    try:
+        cls = BACKENDS[nome]
+    except KeyError:
+        raise ValueError(f"Backend desconhecido: {nome!r}. Opções: {', '.join(BACKENDS)}") from None
+    return cls()
@@ -1,111 +1,243 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional
-from datetime import datetime
+from typing import Dict, List, Tuple, Optional, Sequence
+from dataclasses import dataclass
 
 import pandas as pd
 import numpy as np
-import unicodedata
-import math
-import re
+import calendar
 
 # ============================================================
-# Constantes (puras)
+# Núcleo puro (reexportado de nucleo.py, sem pandas/numpy)
 # ============================================================
-# Margens padrão utilizadas em cenários (5% a 30%)
-MARGENS: List[float] = [0.05, 0.10, 0.15, 0.20, 0.25, 0.30]
-
-# Mapeamento de nomes de colunas comuns -> nomes padronizados
-COL_MAP: Dict[str, str] = {
-    "cfop": "cfop",
-    "data emissão": "data_emissao",
-    "data emissao": "data_emissao",
-    "data": "data_emissao",
-    "emitente cnpj/cpf": "emitente",
-    "destinatário cnpj/cpf": "destinatario",
-    "destinatario cnpj/cpf": "destinatario",
-    "chassi": "chassi",
-    "placa": "placa",
-    "produto": "produto",
-    "valor total": "valor_total",
-    "valor_total": "valor_total",
-    "renavam": "renavam",
-    "km": "km",
-    "ano modelo": "ano_modelo",
-    "ano fabricação": "ano_fabricacao",
-    "cor": "cor",
-    "icms alíquota": "icms_aliquota",
-    "icms aliquota": "icms_aliquota",
-    "icms valor": "icms_valor",
-    "icms base": "icms_base",
-    "cst icms": "cst_icms",
-    "redução bc": "reducao_bc",
-    "reducao bc": "reducao_bc",
-    "modalidade bc": "modalidade_bc",
-    "natureza operação": "natureza_operacao",
-    "natureza operacao": "natureza_operacao",
-    "chave xml": "chave_xml",
-    "xml path": "xml_path",
-    "item": "item",
-    "número nf": "numero_nf",
-    "numero nf": "numero_nf",
-    "tipo nota": "tipo_nota",
-    "classificação": "classificacao",
-    "classificacao": "classificacao",
-    "combustível": "combustivel",
-    "combustivel": "combustivel",
-    "motor": "motor",
-    "modelo": "modelo",
-    "potência": "potencia",
-    "potencia": "potencia",
-}
+from nucleo import (
+    MARGENS,
+    COL_MAP,
+    TIPO_SAIDA,
+    TIPO_ENTRADA,
+    CLASSIF_REVENDA,
+    NATUREZA_DEVOLUCAO,
+    ICMS_ALIQUOTA_PADRAO,
+    PRESUNCAO_LUCRO,
+    ALIQUOTA_IRPJ,
+    ALIQUOTA_ADICIONAL_IRPJ,
+    LIMITE_ADICIONAL_TRI,
+    ALIQUOTA_CSLL,
+    ALIQUOTA_PIS,
+    ALIQUOTA_COFINS,
+    parse_brl,
+    normalize_str,
+    irpj_csll_trimestre,
+    pis_cofins,
+    cenarios_fat_compra,
+    chave_margem,
+    horizonte_meses,
+    meses_simulaveis,
+)
+
+# ============================================================
+# Normalização vetorizada (pandas)
+# ============================================================
+# Formatos de data aceitos em texto (dia primeiro; ISO com ou sem hora). A mesma
+# lista alimenta os backends DuckDB/Polars, então todos leem as mesmas datas.
+FORMATOS_DATA: Tuple[str, ...] = (
+    "%d/%m/%Y", "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+)
+
+
+def padronizar_colunas(df: pd.DataFrame) -> pd.DataFrame:
+    """Renomeia colunas conhecidas (case-insensitive, via COL_MAP) para os nomes padronizados."""
+    cols_lower = {c.lower(): c for c in df.columns}
+    rename_map: Dict[str, str] = {}
+    for k_lower, std_name in COL_MAP.items():
+        if k_lower in cols_lower:
+            rename_map[cols_lower[k_lower]] = std_name
+    return df.rename(columns=rename_map)
+
+
+def normalize_str_series(serie: pd.Series) -> pd.Series:
+    """Versão vetorizada de normalize_str para uma coluna inteira."""
+    vazio = serie.isna()
+    s = serie.astype(str).where(~vazio, "")
+    s = s.str.normalize("NFKD").str.encode("ascii", errors="ignore").str.decode("ascii")
+    return s.str.upper().str.strip()
+
+
+def parse_brl_series(serie: pd.Series) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Versão vetorizada de parse_brl para uma coluna inteira.
+    Retorna (valores, vazio, invalido):
+      - valores: float, mesmas regras de parse_brl (inclusive o fallback por regex)
+      - vazio: célula None/NaN/'' (vira 0.0)
+      - invalido: texto que não pôde ser interpretado (vira 0.0)
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = serie.astype(float)
+        vazio = valores.isna()
+        return valores.fillna(0.0), vazio, pd.Series(False, index=serie.index)
+
+    # Números (e textos que já são um número simples, ex. "12") numa só conversão
+    # vetorizada; o restante segue as regras de texto de parse_brl
+    valores = pd.to_numeric(serie, errors="coerce")
+    numerico = valores.notna()
+
+    texto = serie.where(~numerico & serie.notna()).astype("string").str.strip()
+    vazio = serie.isna() | texto.eq("").fillna(False) | texto.str.upper().eq("NAN").fillna(False)
+
+    s = texto.str.replace("R$", "", regex=False).str.replace(" ", "", regex=False).str.replace("\u00a0", "", regex=False)
+    com_virgula = s.str.contains(",", regex=False).fillna(False)
+    s = s.where(~com_virgula, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    direto = pd.to_numeric(s, errors="coerce")
+    frag = s.str.extract(r"(-?\d+(?:[.,]\d+)?)", expand=False)
+    fallback = pd.to_numeric(frag.str.replace(".", "", regex=False).str.replace(",", ".", regex=False), errors="coerce")
+
+    texto_ok = ~numerico & ~vazio
+    valores = valores.where(numerico, direto.fillna(fallback).astype(float))
+    invalido = texto_ok & valores.isna()
+    return valores.where(~vazio, 0.0).fillna(0.0).astype(float), vazio.astype(bool), invalido.astype(bool)
+
+
+def parse_datas_series(serie: pd.Series) -> pd.Series:
+    """
+    Datas de emissão -> datetime64 (NaT quando não interpretável).
+    Texto é lido formato a formato (FORMATOS_DATA), cada um só nas linhas ainda
+    sem data: uma coluna com formatos misturados não perde as linhas que fogem
+    do formato da primeira (como acontece com a inferência do pandas).
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    texto = serie.astype("string").str.strip()
+    datas = pd.Series(pd.NaT, index=serie.index, dtype="datetime64[ns]")
+    for formato in FORMATOS_DATA:
+        resto = datas.isna() & texto.notna()
+        if not resto.any():
+            break
+        datas[resto] = pd.to_datetime(texto[resto], format=formato, errors="coerce")
+    return datas
+
 
 # ============================================================
-# Utilidades de parsing/normalização (puras)
+# Qualidade dos dados (coletada na mesma passada da normalização)
 # ============================================================
-def parse_brl(valor: object) -> float:
-    """
-    Parse seguro de BRL:
-    - Aceita float/int diretamente
-    - Remove 'R$' e espaços
-    - Remove pontos de milhar e converte vírgula para ponto quando ambos existem
-    - Fallback com regex se necessário
-    """
-    if valor is None:
-        return 0.0
-    if isinstance(valor, (int, float)):
-        v = float(valor)
-        return 0.0 if math.isnan(v) else v
-
-    s = str(valor).strip()
-    if s == "" or s.upper() == "NAN":
-        return 0.0
-
-    s = s.replace("R$", "").replace(" ", "").replace("\u00a0", "")
-    try:
-        if "," in s:
-            # Formato BR: '.' milhar, ',' decimal
-            s = s.replace(".", "").replace(",", ".")
-            return float(s)
-        # Caso só ponto (.) como decimal
-        return float(s)
-    except Exception:
-        m = re.search(r"-?\d+(?:[.,]\d+)?", s)
-        if not m:
-            return 0.0
-        frag = m.group(0).replace(".", "").replace(",", ".")
-        try:
-            return float(frag)
-        except Exception:
-            return 0.0
-
-
-def normalize_str(text: object) -> str:
-    """Remove acentos, converte para MAIÚSCULAS e strip. Retorna '' para NaN/None."""
-    if text is None or (isinstance(text, float) and math.isnan(text)):
-        return ""
-    s = str(text)
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    return s.upper().strip()
+PROBLEMAS_QUALIDADE: Dict[str, str] = {
+    "valor_vazio": "Valor vazio (considerado 0)",
+    "valor_invalido": "Valor não interpretável (considerado 0)",
+    "valor_negativo": "Valor negativo",
+    "data_invalida": "Data vazia ou inválida (fora de qualquer mês)",
+    "tipo_nota_desconhecido": "Tipo de nota diferente de SAIDA/ENTRADA",
+    "fora_das_regras": "Nota fora de FAT, COMPRAS e devoluções",
+}
+
+
+def _concatenar(partes: List[pd.DataFrame]) -> pd.DataFrame:
+    """pd.concat ignorando partes vazias (que viriam com dtype object e contaminariam as colunas)."""
+    cheias = [p for p in partes if not p.empty]
+    return pd.concat(cheias, ignore_index=True) if cheias else partes[0].iloc[0:0]
+
+
+@dataclass
+class RelatorioQualidade:
+    """
+    Resultado da validação de prepare_dataframe.
+      resumo: problema, coluna, yyyymm (0 = sem data), linhas
+      amostras: problema, linha (índice original), yyyymm, coluna, valor_original
+      colunas_nao_mapeadas: colunas de entrada que não constam em COL_MAP
+    """
+    total_linhas: int
+    resumo: pd.DataFrame
+    amostras: pd.DataFrame
+    colunas_nao_mapeadas: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return self.resumo.empty
+
+    def totais(self) -> pd.DataFrame:
+        """Linhas afetadas por problema/coluna (somando os meses)."""
+        if self.resumo.empty:
+            return pd.DataFrame(columns=["problema", "descricao", "coluna", "linhas"])
+        out = self.resumo.groupby(["problema", "coluna"], as_index=False, sort=False)["linhas"].sum()
+        out.insert(1, "descricao", out["problema"].map(PROBLEMAS_QUALIDADE))
+        return out
+
+    def combinar(self, outro: "RelatorioQualidade") -> "RelatorioQualidade":
+        """
+        Relatório de self + outro (notas anexadas depois, ex.: delta), sem revalidar
+        self. As linhas das amostras de 'outro' são deslocadas por total_linhas,
+        como em pd.concat([...], ignore_index=True).
+        """
+        resumo = _concatenar([self.resumo, outro.resumo])
+        if not resumo.empty:
+            resumo = resumo.groupby(["problema", "coluna", "yyyymm"], as_index=False, sort=False)["linhas"].sum()
+        amostras = _concatenar([self.amostras, outro.amostras.assign(linha=outro.amostras["linha"] + self.total_linhas)])
+        nao_mapeadas = self.colunas_nao_mapeadas + [c for c in outro.colunas_nao_mapeadas if c not in self.colunas_nao_mapeadas]
+        return RelatorioQualidade(self.total_linhas + outro.total_linhas, resumo, amostras, nao_mapeadas)
+
+    def substituir_meses(
+        self,
+        novo: "RelatorioQualidade",
+        meses: Sequence[int],
+        total_linhas: int,
+        linhas_mantidas: Optional[np.ndarray] = None,
+        n_amostras: int = 5,
+    ) -> "RelatorioQualidade":
+        """
+        Relatório de uma nova versão do arquivo em que só 'meses' foram revalidados
+        (em 'novo'); os demais meses vêm de self. 'linhas_mantidas' = nova linha de
+        cada amostra de self (mesma ordem; -1 = nota que não existe mais).
+        As amostras seguem limitadas a n_amostras por problema/coluna.
+        """
+        refeitos = [int(m) for m in meses]
+        resumo = _concatenar([self.resumo[~self.resumo["yyyymm"].isin(refeitos)], novo.resumo])
+        antigas = self.amostras.assign(linha=linhas_mantidas) if linhas_mantidas is not None else self.amostras
+        antigas = antigas[~antigas["yyyymm"].isin(refeitos) & (antigas["linha"] >= 0)]
+        amostras = _concatenar([antigas, novo.amostras])
+        if not amostras.empty:
+            amostras = amostras.sort_values(["problema", "linha"], kind="stable", ignore_index=True)
+            amostras = amostras.groupby(["problema", "coluna"], sort=False).head(n_amostras).reset_index(drop=True)
+        return RelatorioQualidade(int(total_linhas), resumo, amostras, novo.colunas_nao_mapeadas or self.colunas_nao_mapeadas)
+
+
+def _relatorio_qualidade(
+    df: pd.DataFrame,
+    original: pd.DataFrame,
+    problemas: Dict[Tuple[str, str], pd.Series],
+    colunas_nao_mapeadas: List[str],
+    n_amostras: int,
+) -> RelatorioQualidade:
+    # Contagem por mês: meses fatorados uma vez; cada máscara vira um bincount
+    codigos, meses = pd.factorize(df["yyyymm"].fillna(0).astype(np.int64), sort=True)
+    linhas = []
+    for (p, c), m in problemas.items():
+        contagem = np.bincount(codigos, weights=m.to_numpy(dtype=bool), minlength=len(meses))
+        for ymm, n in zip(meses[contagem > 0], contagem[contagem > 0]):
+            linhas.append((p, c, int(ymm), int(n)))
+    resumo = pd.DataFrame(linhas, columns=["problema", "coluna", "yyyymm", "linhas"])
+
+    # Posições (não rótulos): índices com rótulos repetidos não duplicam nem quebram as amostras
+    amostras = []
+    for (p, c), m in problemas.items():
+        pos = np.flatnonzero(m.to_numpy(dtype=bool))[:n_amostras]
+        if len(pos) == 0:
+            continue
+        col_original = c if c in original.columns else None
+        amostras.append(pd.DataFrame({
+            "problema": p,
+            "linha": df.index[pos],
+            "yyyymm": df["yyyymm"].iloc[pos].fillna(0).to_numpy(dtype=np.int64),
+            "coluna": c,
+            "valor_original": original[col_original].iloc[pos].astype(str).to_numpy() if col_original else "",
+        }))
+    amostras_df = (
+        pd.concat(amostras, ignore_index=True) if amostras
+        else pd.DataFrame(columns=["problema", "linha", "yyyymm", "coluna", "valor_original"])
+    )
+    return RelatorioQualidade(len(df), resumo, amostras_df, colunas_nao_mapeadas)
+
+
+def preparar_com_qualidade(df: pd.DataFrame, n_amostras: int = 5) -> Tuple[pd.DataFrame, RelatorioQualidade]:
+    """prepare_dataframe + relatório de qualidade, na mesma passada vetorizada."""
+    return _preparar(df, qualidade=True, n_amostras=n_amostras)
 
 
 def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
@@ -116,18 +248,24 @@ def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     - Cria chave 'yyyymm' = AAAAMM (int)
     - Normaliza 'tipo_nota', 'classificacao', 'natureza_operacao'
     - Faz parse seguro de 'valor_total' (BRL -> float)
+    Para também obter o relatório de qualidade, use preparar_com_qualidade.
     """
+    return _preparar(df, qualidade=False)[0]
+
+
+def _preparar(df: pd.DataFrame, qualidade: bool, n_amostras: int = 5) -> Tuple[pd.DataFrame, Optional[RelatorioQualidade]]:
     if df is None or df.empty:
         # Retorna DF com as colunas mínimas
-        return pd.DataFrame(columns=["data", "yyyymm", "tipo_nota", "classificacao", "natureza_operacao", "valor_total"])
+        vazio = pd.DataFrame(columns=["data", "yyyymm", "tipo_nota", "classificacao", "natureza_operacao", "valor_total"])
+        vazio_rel = RelatorioQualidade(0, pd.DataFrame(columns=["problema", "coluna", "yyyymm", "linhas"]),
+                                       pd.DataFrame(columns=["problema", "linha", "yyyymm", "coluna", "valor_original"]), [])
+        return vazio, (vazio_rel if qualidade else None)
 
     # Renomear colunas conforme mapa (case-insensitive)
-    cols_lower = {c.lower(): c for c in df.columns}
-    rename_map: Dict[str, str] = {}
-    for k_lower, std_name in COL_MAP.items():
-        if k_lower in cols_lower:
-            rename_map[cols_lower[k_lower]] = std_name
-    df = df.rename(columns=rename_map)
+    original = df
+    df = padronizar_colunas(df)
+    conhecidas = set(COL_MAP.values())
+    nao_mapeadas = [c for c in df.columns if c not in conhecidas]
 
     # Garantir colunas essenciais
     for col in ["valor_total", "data_emissao", "tipo_nota", "classificacao", "natureza_operacao"]:
@@ -135,70 +273,88 @@ def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
             df[col] = np.nan
 
     # Criar 'data' e 'yyyymm'
-    data_series = pd.to_datetime(df["data_emissao"], errors="coerce", dayfirst=True)
-    df["data"] = data_series
+    df["data"] = parse_datas_series(df["data_emissao"])
     df["yyyymm"] = (df["data"].dt.year * 100 + df["data"].dt.month).astype("Int64")
 
     # Normalizações textuais
-    df["tipo_nota"] = df["tipo_nota"].apply(normalize_str)
-    df["classificacao"] = df["classificacao"].apply(normalize_str)
-    df["natureza_operacao"] = df["natureza_operacao"].apply(normalize_str)
+    df["tipo_nota"] = normalize_str_series(df["tipo_nota"])
+    df["classificacao"] = normalize_str_series(df["classificacao"])
+    df["natureza_operacao"] = normalize_str_series(df["natureza_operacao"])
 
     # Valores monetários
-    df["valor_total"] = df["valor_total"].apply(parse_brl)
-
-    return df
+    df["valor_total"], valor_vazio, valor_invalido = parse_brl_series(df["valor_total"])
+
+    if not qualidade:
+        return df, None
+
+    devol = df["natureza_operacao"].str.contains(NATUREZA_DEVOLUCAO, regex=False)
+    saida = df["tipo_nota"] == TIPO_SAIDA
+    entrada = df["tipo_nota"] == TIPO_ENTRADA
+    compras = entrada & (df["classificacao"] == CLASSIF_REVENDA)
+    problemas = {
+        ("valor_vazio", "valor_total"): valor_vazio,
+        ("valor_invalido", "valor_total"): valor_invalido,
+        ("valor_negativo", "valor_total"): df["valor_total"] < 0,
+        ("data_invalida", "data_emissao"): df["data"].isna(),
+        ("tipo_nota_desconhecido", "tipo_nota"): ~(saida | entrada),
+        ("fora_das_regras", "tipo_nota"): ~((saida & ~devol) | compras | devol),
+    }
+    # Amostras exibem o valor como veio na planilha (antes do parse/normalização)
+    return df, _relatorio_qualidade(df, padronizar_colunas(original), problemas, nao_mapeadas, n_amostras)
 
 
 # ============================================================
 # Consolidação realizada (pura)
 # ============================================================
-def realizado_por_mes(df: pd.DataFrame, ano: int = 2025) -> Dict[int, Dict[str, float]]:
+def contribuicoes(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Consolida valores realizados por mês (por yyyymm) para o ano informado.
+    Contribuição de cada nota (DataFrame já preparado) para FAT e COMPRAS:
+      - FAT: SAIDA que não é devolução de compra
+      - COMPRAS: ENTRADA de revenda, menos devoluções de compra
+    Colunas: data, yyyymm, FAT, COMPRAS (mesmo índice de df). Base de
+    realizado_por_mes e realizado_por_dia (um único groupby em cada).
+    """
+    mask_devol = df["natureza_operacao"].str.contains(NATUREZA_DEVOLUCAO, na=False, regex=False)
+    mask_saida = df["tipo_nota"] == TIPO_SAIDA
+    mask_compras = (df["tipo_nota"] == TIPO_ENTRADA) & (df["classificacao"] == CLASSIF_REVENDA)
+    valor = df["valor_total"].to_numpy(dtype=float)
+    return pd.DataFrame({
+        "data": df["data"].to_numpy(),
+        "yyyymm": df["yyyymm"].to_numpy(),
+        "FAT": np.where(mask_saida & ~mask_devol, valor, 0.0),
+        "COMPRAS": np.where(mask_compras, valor, 0.0) - np.where(mask_devol, valor, 0.0),
+    }, index=df.index)
+
+
+def realizado_por_mes(
+    df: pd.DataFrame,
+    ano: int = 2025,
+    meses: Optional[List[int]] = None,
+    preparado: bool = False,
+) -> Dict[int, Dict[str, float]]:
+    """
+    Consolida valores realizados por mês (por yyyymm) para o ano informado
+    ou, se 'meses' for passado, para essa lista arbitrária de yyyymm
+    (horizontes que atravessam a virada do ano).
     Regras:
       - FAT = soma de SAIDA (exclui devolução de compra)
       - COMPRAS = soma de ENTRADA com CLASSIFICACAO='MERCADORIA PARA REVENDA'
                   menos as 'DEVOLUCAO DE COMPRA' (sempre abatendo compras)
       - LAT = FAT - COMPRAS
+    'preparado=True' evita repetir prepare_dataframe quando df já foi normalizado.
     Retorna: {yyyymm: {"FAT": float, "COMPRAS": float, "LAT": float}, ...}
     """
-    df = prepare_dataframe(df)
-    if df.empty:
-        return {ano * 100 + m: {"FAT": 0.0, "COMPRAS": 0.0, "LAT": 0.0} for m in range(1, 13)}
+    months = [int(m) for m in meses] if meses is not None else [ano * 100 + m for m in range(1, 13)]
 
-    df = df[(df["yyyymm"].notna()) & ((df["yyyymm"] // 100) == ano)].copy()
-
-    months = [ano * 100 + m for m in range(1, 13)]
-
-    # Máscaras
-    mask_devol = df["natureza_operacao"].str.contains("DEVOLUCAO DE COMPRA", na=False)
-    mask_saida = df["tipo_nota"] == "SAIDA"
-    mask_entrada = df["tipo_nota"] == "ENTRADA"
-    mask_compras = mask_entrada & (df["classificacao"] == "MERCADORIA PARA REVENDA")
-
-    # FAT: SAIDA excluindo devolução de compra
-    fat_series = (
-        df[mask_saida & ~mask_devol]
-        .groupby("yyyymm")["valor_total"]
-        .sum()
-        .reindex(months, fill_value=0.0)
-    )
+    df = df if preparado else prepare_dataframe(df)
+    if df.empty:
+        return {m: {"FAT": 0.0, "COMPRAS": 0.0, "LAT": 0.0} for m in months}
 
-    # COMPRAS: ENTRADA (mercadoria p/ revenda) - devoluções de compra
-    compras_series = (
-        df[mask_compras]
-        .groupby("yyyymm")["valor_total"]
-        .sum()
-        .reindex(months, fill_value=0.0)
-    )
-    devol_series = (
-        df[mask_devol]
-        .groupby("yyyymm")["valor_total"]
-        .sum()
-        .reindex(months, fill_value=0.0)
-    )
-    compras_series = compras_series - devol_series
+    df = df[(df["yyyymm"].notna()) & (df["yyyymm"].isin(months))]
+    contrib = contribuicoes(df)
+    agg = contrib.groupby("yyyymm")[["FAT", "COMPRAS"]].sum().reindex(months, fill_value=0.0)
+    fat_series = agg["FAT"]
+    compras_series = agg["COMPRAS"]
     lat_series = fat_series - compras_series
 
     # Monta dict final
@@ -212,53 +368,217 @@ def realizado_por_mes(df: pd.DataFrame, ano: int = 2025) -> Dict[int, Dict[str,
     return out
 
 
+def dias_do_mes(yyyymm: int) -> int:
+    ano, mes = divmod(int(yyyymm), 100)
+    return calendar.monthrange(ano, mes)[1]
+
+
+def realizado_por_dia(df: pd.DataFrame, yyyymm: int, preparado: bool = False) -> pd.DataFrame:
+    """
+    Série diária do mês (index 'dia' = 1..último dia): FAT, COMPRAS, LAT do dia
+    e os acumulados FAT_ACUM/COMPRAS_ACUM/LAT_ACUM. Um groupby por dia + cumsum.
+    'preparado=True' evita repetir prepare_dataframe quando df já foi normalizado.
+    """
+    df = df if preparado else prepare_dataframe(df)
+    n_dias = dias_do_mes(yyyymm)
+    dias = pd.RangeIndex(1, n_dias + 1, name="dia")
+    if df.empty:
+        out = pd.DataFrame(0.0, index=dias, columns=["FAT", "COMPRAS"])
+    else:
+        contrib = contribuicoes(df[df["yyyymm"] == int(yyyymm)])
+        out = (
+            contrib.groupby(contrib["data"].dt.day)[["FAT", "COMPRAS"]].sum()
+            .reindex(dias, fill_value=0.0)
+        )
+    out["LAT"] = out["FAT"] - out["COMPRAS"]
+    for c in ("FAT", "COMPRAS", "LAT"):
+        out[f"{c}_ACUM"] = out[c].cumsum()
+    return out
+
+
 # ============================================================
-# IRPJ / CSLL trimestrais (puro)
+# ICMS por nota (realizado)
 # ============================================================
-def irpj_csll_trimestre(lat_por_mes: Dict[int, float]) -> Dict[int, Tuple[float, float]]:
+COLUNAS_ICMS = ("icms_base", "icms_valor", "icms_aliquota", "reducao_bc")
+COLUNAS_ICMS_MES = ["yyyymm", "cst_icms", "NOTAS", "NOTAS_COM_ICMS", "FAT", "FAT_COM_ICMS",
+                    "ICMS_BASE", "ICMS_VALOR", "ALIQUOTA_EFETIVA"]
+
+
+def _fracao(valores: np.ndarray) -> np.ndarray:
+    """Alíquota/redução vêm em percentual na planilha (convenção da NF-e): '12,00' = 12%, '1,00' = 1%."""
+    return valores / 100.0
+
+
+def _cst_series(serie: pd.Series) -> pd.Series:
+    """CST como texto: '0'/'0.0' (lidos como número) -> '00'; vazio -> ''."""
+    cst = serie.astype("string").str.strip().str.replace(r"\.0+$", "", regex=True).fillna("")
+    return cst.mask(cst.str.fullmatch(r"\d").fillna(False), "0" + cst)
+
+
+def icms_por_mes(
+    df: pd.DataFrame,
+    meses: Optional[Sequence[int]] = None,
+    preparado: bool = False,
+) -> pd.DataFrame:
     """
-    Calcula IRPJ/CSLL por trimestre civil a partir de um dict {yyyymm: LAT}.
-    Regras:
-      Base_mês = 32% * LAT_mês
-      IRPJ_tri = 15% * ΣBase + adicional de 10% sobre o que exceder 60.000
-      CSLL_tri = 9% * ΣBase
-      Lançar apenas em Mar/Jun/Set/Dez; nos outros meses do trimestre, não retorna chave.
-    Retorna: {yyyymm_fechamento: (IRPJ, CSLL), ...}
-    """
-    if not lat_por_mes:
-        return {}
-
-    # Agrupa por ano
-    anos = sorted({m // 100 for m in lat_por_mes.keys()})
-    resultado: Dict[int, Tuple[float, float]] = {}
-
-    for ano in anos:
-        # Trimestres
-        trimestres = {
-            1: [1, 2, 3],
-            2: [4, 5, 6],
-            3: [7, 8, 9],
-            4: [10, 11, 12],
-        }
-        for meses in trimestres.values():
-            meses_yyyymm = [ano * 100 + m for m in meses]
-            base_total = sum(0.32 * float(lat_por_mes.get(m, 0.0)) for m in meses_yyyymm)
+    ICMS das notas de FAT (SAIDA que não é devolução de compra) por yyyymm e CST,
+    a partir de icms_valor/icms_base/icms_aliquota/reducao_bc (mesmo parse BRL de
+    valor_total), num único groupby. Por nota:
+      - valor: icms_valor; sem valor informado, base * icms_aliquota
+      - base: icms_base; sem base informada, FAT * (1 - reducao_bc)
+    Notas sem valor nem alíquota ficam fora de NOTAS_COM_ICMS/FAT_COM_ICMS.
+    ALIQUOTA_EFETIVA = ICMS_VALOR / FAT_COM_ICMS (NaN sem notas com ICMS).
+    """
+    df = df if preparado else prepare_dataframe(df)
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_ICMS_MES)
 
-            # Base não negativa para tributos
-            base_pos = max(0.0, base_total)
-            if base_pos == 0.0:
-                continue
+    fat_nota = contribuicoes(df)["FAT"]
+    sel = (fat_nota != 0) & df["yyyymm"].notna()
+    if meses is not None:
+        sel &= df["yyyymm"].isin([int(m) for m in meses])
+    df = df[sel]
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_ICMS_MES)
+    fat = fat_nota[sel].to_numpy(dtype=float)
+
+    campos: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    for col in COLUNAS_ICMS:
+        if col in df.columns:
+            valores, vazio, _ = parse_brl_series(df[col])
+            campos[col] = (valores.to_numpy(dtype=float), ~vazio.to_numpy(dtype=bool))
+        else:
+            campos[col] = (np.zeros(len(df)), np.zeros(len(df), dtype=bool))
+    valor, tem_valor = campos["icms_valor"]
+    base, tem_base = campos["icms_base"]
+    aliquota, tem_aliquota = campos["icms_aliquota"]
+    reducao = _fracao(campos["reducao_bc"][0])
+
+    com_icms = tem_valor | tem_aliquota
+    base = np.where(tem_base, base, fat * (1.0 - reducao))
+    valor = np.where(tem_valor, valor, base * _fracao(aliquota))
+    cst = _cst_series(df["cst_icms"]) if "cst_icms" in df.columns else pd.Series("", index=df.index)
+
+    tab = pd.DataFrame({
+        "yyyymm": df["yyyymm"].to_numpy(dtype=np.int64),
+        "cst_icms": cst.to_numpy(dtype=object),
+        "NOTAS": 1,
+        "NOTAS_COM_ICMS": com_icms.astype(np.int64),
+        "FAT": fat,
+        "FAT_COM_ICMS": np.where(com_icms, fat, 0.0),
+        "ICMS_BASE": np.where(com_icms, base, 0.0),
+        "ICMS_VALOR": np.where(com_icms, valor, 0.0),
+    })
+    return combinar_icms(tab)
+
+
+def combinar_icms(*tabelas: pd.DataFrame) -> pd.DataFrame:
+    """
+    Soma tabelas no formato de icms_por_mes (ex.: arquivo base + notas anexadas)
+    por yyyymm e CST e recalcula ALIQUOTA_EFETIVA.
+    """
+    tabs = [t.drop(columns="ALIQUOTA_EFETIVA", errors="ignore") for t in tabelas if not t.empty]
+    if not tabs:
+        return pd.DataFrame(columns=COLUNAS_ICMS_MES)
+    out = pd.concat(tabs, ignore_index=True).groupby(["yyyymm", "cst_icms"], as_index=False, sort=True).sum()
+    fat_com = out["FAT_COM_ICMS"].to_numpy(dtype=float)
+    out["ALIQUOTA_EFETIVA"] = np.divide(
+        out["ICMS_VALOR"].to_numpy(dtype=float), fat_com,
+        out=np.full(len(out), np.nan), where=fat_com != 0,
+    )
+    return out
 
-            irpj = 0.15 * base_pos
-            excedente = max(0.0, base_pos - 60000.0)
-            irpj += 0.10 * excedente
 
-            csll = 0.09 * base_pos
+def aliquota_efetiva_icms(
+    tabela: pd.DataFrame,
+    meses: Optional[Sequence[int]] = None,
+    padrao: float = ICMS_ALIQUOTA_PADRAO,
+) -> float:
+    """
+    Alíquota efetiva (ICMS / FAT das notas com ICMS) de uma tabela de icms_por_mes,
+    opcionalmente restrita a 'meses'. Usada para projetar os meses futuros;
+    sem notas com ICMS informado (ou FAT ≤ 0) devolve 'padrao'.
+    """
+    if meses is not None:
+        tabela = tabela[tabela["yyyymm"].isin([int(m) for m in meses])]
+    fat = float(tabela["FAT_COM_ICMS"].sum()) if not tabela.empty else 0.0
+    if fat <= 0:
+        return float(padrao)
+    return float(tabela["ICMS_VALOR"].sum()) / fat
 
-            mes_fechamento = meses_yyyymm[-1]  # Mar/Jun/Set/Dez
-            resultado[mes_fechamento] = (irpj, csll)
 
-    return resultado
+# ============================================================
+# IRPJ / CSLL trimestrais (vetorizado)
+# ============================================================
+def matriz_trimestres(yyyymm: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Matriz one-hot mês -> trimestre civil (n_meses, n_trimestres) e o índice do
+    trimestre de cada mês. 'valores @ matriz' soma por trimestre em qualquer
+    número de dimensões à esquerda (planos, empresas, regimes...).
+    """
+    ymm = np.asarray(yyyymm, dtype=np.int64)
+    chave_tri = (ymm // 100) * 10 + (ymm % 100 - 1) // 3 + 1
+    _, inv = np.unique(chave_tri, return_inverse=True)
+    por_tri = (inv[:, None] == np.arange(inv.max() + 1)[None, :]).astype(float)
+    return por_tri, inv
+
+
+def irpj_csll_vetorizado(yyyymm: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Versão vetorizada de irpj_csll_trimestre para um horizonte arbitrário.
+    Recebe yyyymm (n_meses,) e LAT (n_meses,) ou (n_planos, n_meses) e devolve
+    arrays (IRPJ, CSLL) no mesmo formato de LAT, preenchidos apenas nos meses de
+    fechamento (Mar/Jun/Set/Dez) presentes na entrada. Os trimestres são agrupados
+    por ano civil, então horizontes que cruzam dezembro funcionam sem laços por ano.
+    """
+    ymm = np.asarray(yyyymm, dtype=np.int64)
+    lat_arr = np.asarray(lat, dtype=float)
+    if ymm.size == 0:
+        return np.zeros_like(lat_arr), np.zeros_like(lat_arr)
+
+    por_tri, inv = matriz_trimestres(ymm)
+    base_tri = (PRESUNCAO_LUCRO * lat_arr) @ por_tri
+
+    base_pos = np.maximum(base_tri, 0.0)
+    irpj_tri = ALIQUOTA_IRPJ * base_pos + ALIQUOTA_ADICIONAL_IRPJ * np.maximum(base_pos - LIMITE_ADICIONAL_TRI, 0.0)
+    csll_tri = ALIQUOTA_CSLL * base_pos
+
+    fechamento = (ymm % 100 % 3) == 0
+    irpj = np.where(fechamento, irpj_tri[..., inv], 0.0)
+    csll = np.where(fechamento, csll_tri[..., inv], 0.0)
+    return irpj, csll
+
+
+def tabela_horizonte(
+    lat_por_mes: Dict[int, float],
+    margem: float = 0.20,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> pd.DataFrame:
+    """
+    Tributos e cenário de uma margem para todo o horizonte, em uma única passada vetorizada.
+    Colunas: yyyymm, LAT, FAT, COMPRAS, ICMS, PIS, COFINS, IRPJ, CSLL, LL.
+    ICMS = aliquota_icms * FAT (ex.: aliquota_efetiva_icms do realizado).
+    """
+    ymm = np.array(sorted(lat_por_mes), dtype=np.int64)
+    lat = np.array([float(lat_por_mes[m]) for m in ymm], dtype=float)
+
+    fat = lat / margem if margem > 0 else np.zeros_like(lat)
+    lat_pos = np.maximum(lat, 0.0)
+    irpj, csll = irpj_csll_vetorizado(ymm, lat)
+
+    out = pd.DataFrame({
+        "yyyymm": ymm,
+        "LAT": lat,
+        "FAT": fat,
+        "COMPRAS": fat - lat,
+        "ICMS": aliquota_icms * fat,
+        "PIS": ALIQUOTA_PIS * lat_pos,
+        "COFINS": ALIQUOTA_COFINS * lat_pos,
+        "IRPJ": irpj,
+        "CSLL": csll,
+    })
+    out["LL"] = out["LAT"] - out[["PIS", "COFINS", "ICMS", "IRPJ", "CSLL"]].sum(axis=1)
+    return out
 
 
 # ============================================================
@@ -277,43 +597,223 @@ def mes_vigente(df: pd.DataFrame) -> int:
     return int(vals.max())
 
 
-def meses_simulaveis(vigente_yyyymm: int, sim_vigente: bool) -> List[int]:
+# ============================================================
+# Motor de cenários (meses × margens, puro e vetorizado)
+# ============================================================
+def grade_margens(inicio: float = 0.05, fim: float = 0.30, passo: float = 0.005) -> np.ndarray:
+    """Margens de 'inicio' a 'fim' (inclusive) no passo dado, sempre contendo as MARGENS padrão."""
+    n = int(round((fim - inicio) / passo)) + 1
+    grade = np.round(inicio + passo * np.arange(n), 6)
+    return np.union1d(grade, np.asarray(MARGENS, dtype=float))
+
+
+@dataclass
+class GradeCenarios:
     """
-    Lista meses simuláveis a partir do mês 'vigente'.
-    - Se sim_vigente=True: inclui o próprio mês vigente.
-    - Caso contrário: inicia no mês seguinte.
-    Sempre até dezembro do mesmo ano.
+    Resultado de matriz_cenarios. Matrizes com shape (n_meses, n_margens);
+    LAT/PIS/COFINS e realizados com shape (n_meses,).
+    FAT_EMITIR/COMPRA_EMITIR valem NaN em meses anteriores ao vigente.
     """
-    if not vigente_yyyymm:
-        # fallback: ano corrente
-        today = datetime.today()
-        vigente_yyyymm = today.year * 100 + today.month
+    meses: np.ndarray
+    margens: np.ndarray
+    LAT: np.ndarray
+    PIS: np.ndarray
+    COFINS: np.ndarray
+    FAT: np.ndarray
+    COMPRAS: np.ndarray
+    ICMS: np.ndarray
+    FAT_EMITIR: np.ndarray
+    COMPRA_EMITIR: np.ndarray
+
+    def _idx_margem(self, r: float) -> int:
+        """Coluna da margem r na grade; KeyError se r não pertence à grade (sem aproximar)."""
+        j = np.flatnonzero(np.isclose(self.margens, float(r), rtol=0.0, atol=1e-9))
+        if j.size == 0:
+            raise KeyError(f"Margem {r!r} fora da grade de cenários.")
+        return int(j[0])
+
+    def _idx_mes(self, yyyymm: int) -> int:
+        i = np.flatnonzero(self.meses == int(yyyymm))
+        if i.size == 0:
+            raise KeyError(f"Mês {yyyymm!r} fora da grade de cenários.")
+        return int(i[0])
+
+    def cenarios_mes(self, yyyymm: int, margens: Sequence[float] = MARGENS) -> Dict[float, Dict[str, float]]:
+        """
+        Linha de um mês no formato dos cards:
+          {chave_margem(r): {"FAT", "COMPRAS", "ICMS", "FAT_EMITIR", "COMPRA_EMITIR"}}
+        (20.0, 12.5, ...). KeyError para mês ou margem fora da grade.
+        """
+        i = self._idx_mes(yyyymm)
+        out: Dict[float, Dict[str, float]] = {}
+        for r in margens:
+            j = self._idx_margem(r)
+            out[chave_margem(r)] = {
+                "FAT": float(self.FAT[i, j]),
+                "COMPRAS": float(self.COMPRAS[i, j]),
+                "ICMS": float(self.ICMS[i, j]),
+                "FAT_EMITIR": float(self.FAT_EMITIR[i, j]),
+                "COMPRA_EMITIR": float(self.COMPRA_EMITIR[i, j]),
+            }
+        return out
+
+    def tabela(self, campo: str) -> pd.DataFrame:
+        """Matriz de um campo como DataFrame (index = yyyymm, colunas = margem em %)."""
+        return pd.DataFrame(
+            getattr(self, campo),
+            index=pd.Index(self.meses, name="yyyymm"),
+            columns=pd.Index(np.round(self.margens * 100, 2), name="margem_%"),
+        )
+
+
+def matriz_cenarios(
+    meses: Sequence[int],
+    lat: Sequence[float],
+    margens: Sequence[float] = MARGENS,
+    fat_real: Optional[Sequence[float]] = None,
+    compras_real: Optional[Sequence[float]] = None,
+    vigente_yyyymm: Optional[int] = None,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> GradeCenarios:
+    """
+    Calcula toda a grade (meses × margens) numa única operação de arrays:
+      FAT = LAT / r ; COMPRAS = FAT - LAT ; ICMS = aliquota_icms * FAT (padrão 5%)
+      A emitir = max(0, total - realizado)  (NaN antes do mês vigente)
+      PIS = 0,65% * LAT⁺ ; COFINS = 3% * LAT⁺  (por mês, independem da margem)
+    """
+    ymm = np.asarray(meses, dtype=np.int64)
+    lat_arr = np.asarray(lat, dtype=float)
+    rs = np.asarray([r for r in margens if r > 0], dtype=float)
+    zeros = np.zeros_like(lat_arr)
+    fat_r = np.asarray(fat_real, dtype=float) if fat_real is not None else zeros
+    comp_r = np.asarray(compras_real, dtype=float) if compras_real is not None else zeros
+
+    fat = lat_arr[:, None] / rs[None, :]
+    compras = fat - lat_arr[:, None]
+    fat_emitir = np.maximum(fat - fat_r[:, None], 0.0)
+    compra_emitir = np.maximum(compras - comp_r[:, None], 0.0)
+    if vigente_yyyymm is not None:
+        passado = (ymm < int(vigente_yyyymm))[:, None]
+        fat_emitir = np.where(passado, np.nan, fat_emitir)
+        compra_emitir = np.where(passado, np.nan, compra_emitir)
+
+    lat_pos = np.maximum(lat_arr, 0.0)
+    return GradeCenarios(
+        meses=ymm,
+        margens=rs,
+        LAT=lat_arr,
+        PIS=ALIQUOTA_PIS * lat_pos,
+        COFINS=ALIQUOTA_COFINS * lat_pos,
+        FAT=fat,
+        COMPRAS=compras,
+        ICMS=aliquota_icms * fat,
+        FAT_EMITIR=fat_emitir,
+        COMPRA_EMITIR=compra_emitir,
+    )
 
-    ano = vigente_yyyymm // 100
-    mes = vigente_yyyymm % 100
-    start = mes if sim_vigente else mes + 1
-    start = min(max(1, start), 12)
 
-    return [ano * 100 + m for m in range(start, 13)]
+def cenarios_por_margem(LAT: float) -> Dict[float, Dict[str, float]]:
+    """
+    Para um LAT mensal, retorna cenários de FAT/COMPRAS/ICMS nas margens padrão.
+    (Mantido para compatibilidade; delega ao motor matriz_cenarios.)
+    """
+    grade = matriz_cenarios([0], [max(0.0, float(LAT))], MARGENS)
+    return {
+        pct: {k: c[k] for k in ("FAT", "COMPRAS", "ICMS")}
+        for pct, c in grade.cenarios_mes(0, MARGENS).items()
+    }
 
 
 # ============================================================
-# Cenários por margem (puro — opcional; útil para testes)
+# Solver analítico: folga do adicional e metas de Lucro Líquido (puro)
 # ============================================================
-def cenarios_por_margem(LAT: float) -> Dict[int, Dict[str, float]]:
+# Por trimestre, com LAT_tri = L ≥ 0 e margem r uniforme:
+#   LL(L) = a_r * L - 0,032 * max(0, L - 187.500)
+#   a_r   = 1 - 0,0365 (PIS+COFINS) - t/r (ICMS, t = alíquota sobre o FAT; padrão 5%) - 0,24 * 0,32 (IRPJ 15% + CSLL 9% sobre a base)
+# onde 187.500 = 60.000 / 0,32 é o LAT a partir do qual incide o adicional (10% * 0,32 = 0,032).
+# Todos os coeficientes saem das alíquotas do núcleo.
+LAT_LIMITE_ADICIONAL_TRI = LIMITE_ADICIONAL_TRI / PRESUNCAO_LUCRO
+_COEF_PIS_COFINS = ALIQUOTA_PIS + ALIQUOTA_COFINS
+_COEF_IRPJ_CSLL = (ALIQUOTA_IRPJ + ALIQUOTA_CSLL) * PRESUNCAO_LUCRO
+_COEF_ADICIONAL = ALIQUOTA_ADICIONAL_IRPJ * PRESUNCAO_LUCRO
+
+
+def _coef_ll(margens: np.ndarray, aliquota_icms: float = ICMS_ALIQUOTA_PADRAO) -> np.ndarray:
+    return 1.0 - _COEF_PIS_COFINS - aliquota_icms / margens - _COEF_IRPJ_CSLL
+
+
+def ll_trimestre(
+    lat_tri: np.ndarray,
+    margens: Sequence[float] = MARGENS,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> np.ndarray:
+    """Lucro Líquido do trimestre para LAT_tri (q,) em cada margem → (q, k). LAT negativo não gera tributos."""
+    L = np.asarray(lat_tri, dtype=float)[:, None]
+    rs = np.asarray(margens, dtype=float)[None, :]
+    L_pos = np.maximum(L, 0.0)
+    excedente = np.maximum(L_pos - LAT_LIMITE_ADICIONAL_TRI, 0.0)
+    return L - _COEF_PIS_COFINS * L_pos - aliquota_icms * L / rs - _COEF_IRPJ_CSLL * L_pos - _COEF_ADICIONAL * excedente
+
+
+def solver_trimestres(
+    meses: Sequence[int],
+    lat: Sequence[float],
+    editaveis: Sequence[bool],
+    margens: Sequence[float] = MARGENS,
+    alvo_ll: Optional[float] = None,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> pd.DataFrame:
     """
-    Para um LAT mensal, retorna cenários de FAT/COMPRAS/ICMS nas margens padrão.
-    (Mantido aqui para compatibilidade; a versão de exibição fica em ui_helpers.cenarios_fat_compra)
+    Resolve, em forma fechada e vetorizada (trimestres restantes × margens):
+      - Folga LAT: quanto LAT o trimestre ainda comporta antes de a base passar de 60.000
+        (adicional de IRPJ); negativa quando o limite já foi excedido.
+      - FAT máx. sem adicional: folga / r.
+      - Com 'alvo_ll' (Lucro Líquido desejado por trimestre): LAT total necessário,
+        LAT adicional sobre o atual e FAT/COMPRAS a emitir para cobri-lo em cada margem.
+        NaN quando a margem não permite atingir o alvo (inclinação de LL ≤ 0).
+    Trimestres restantes = os que têm ao menos um mês editável.
     """
-    out: Dict[int, Dict[str, float]] = {}
-    lat = max(0.0, float(LAT))
-    for r in MARGENS:
-        if r <= 0:
-            continue
-        fat = lat / r
-        compras = fat - lat
-        icms = 0.05 * fat
-        out[int(r * 100)] = {"FAT": fat, "COMPRAS": compras, "ICMS": icms}
+    ymm = np.asarray(meses, dtype=np.int64)
+    lat_arr = np.asarray(lat, dtype=float)
+    edit = np.asarray(editaveis, dtype=bool)
+    rs = np.asarray([r for r in margens if r > 0], dtype=float)
+
+    chave_tri = (ymm // 100) * 10 + (ymm % 100 - 1) // 3 + 1
+    tris, inv = np.unique(chave_tri, return_inverse=True)
+    lat_tri = np.bincount(inv, weights=lat_arr, minlength=len(tris))
+    restantes = np.bincount(inv, weights=edit.astype(float), minlength=len(tris)) > 0
+    tris, lat_tri = tris[restantes], lat_tri[restantes]
+
+    folga = LAT_LIMITE_ADICIONAL_TRI - lat_tri                    # (q,)
+    folga_pos = np.maximum(folga, 0.0)
+
+    q, k = len(tris), len(rs)
+    out = pd.DataFrame({
+        "trimestre": np.repeat(tris, k),
+        "margem": np.tile(rs, q),
+        "LAT_TRI": np.repeat(lat_tri, k),
+        "FOLGA_LAT": np.repeat(folga, k),
+        "FAT_MAX_SEM_ADICIONAL": (folga_pos[:, None] / rs[None, :]).ravel(),
+    })
+
+    if alvo_ll is not None:
+        a = _coef_ll(rs, aliquota_icms)                           # (k,)
+        a2 = a - _COEF_ADICIONAL
+        ll_no_limite = a * LAT_LIMITE_ADICIONAL_TRI
+        with np.errstate(divide="ignore", invalid="ignore"):
+            L_alvo = np.where(
+                alvo_ll <= ll_no_limite,
+                alvo_ll / a,
+                LAT_LIMITE_ADICIONAL_TRI + (alvo_ll - ll_no_limite) / a2,
+            )
+        atingivel = np.where(alvo_ll <= ll_no_limite, a > 0, a2 > 0)
+        L_alvo = np.where(atingivel, np.maximum(L_alvo, 0.0), np.nan)
+        delta = L_alvo[None, :] - lat_tri[:, None]                # (q, k)
+        fat_emitir = np.maximum(delta, 0.0) / rs[None, :]
+        out["LAT_ALVO"] = np.tile(L_alvo, q)
+        out["LAT_ADICIONAL"] = delta.ravel()
+        out["FAT_EMITIR"] = fat_emitir.ravel()
+        out["COMPRA_EMITIR"] = (fat_emitir - np.maximum(delta, 0.0)).ravel()
     return out
 
 
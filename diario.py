@@ -0,0 +1,127 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calc import dias_do_mes, prepare_dataframe, realizado_por_dia
+from agregados_store import fingerprints_por_mes, hash_notas
+
+# ============================================================
+# Ritmo diário do mês vigente e projeção de fechamento
+# ============================================================
+CAMPOS_DIARIOS = ("FAT", "COMPRAS")
+
+
+class AcompanhamentoDiario:
+    """
+    Totais diários (FAT/COMPRAS) de um único mês, mantidos incrementalmente.
+    - adicionar(): normaliza só as notas novas e soma a série diária delas
+      (calc.realizado_por_dia) aos totais;
+      lotes já aplicados (ex.: file_id do upload) são ignorados.
+    - fingerprint: mesma impressão digital aditiva do AgregadoStore para o mês,
+      permitindo detectar quando a base mudou e é preciso reconstruir.
+    """
+
+    def __init__(self, yyyymm: int) -> None:
+        self.yyyymm = int(yyyymm)
+        self.n_dias = dias_do_mes(self.yyyymm)
+        self._valores = np.zeros((self.n_dias, len(CAMPOS_DIARIOS)), dtype=float)
+        self.fingerprint: Tuple[int, int] = (0, 0)
+        self.lotes: Set[Hashable] = set()
+        self.ultimo_dia = 0     # último dia com alguma nota
+
+    @classmethod
+    def de_notas(cls, df: pd.DataFrame, yyyymm: int) -> "AcompanhamentoDiario":
+        acomp = cls(yyyymm)
+        acomp.adicionar(df)
+        return acomp
+
+    def adicionar(self, df: pd.DataFrame, lote: Optional[Hashable] = None) -> bool:
+        """Soma notas novas do mês aos totais diários. Retorna False se o lote já foi aplicado."""
+        if lote is not None:
+            if lote in self.lotes:
+                return False
+            self.lotes.add(lote)
+        if df is None or df.empty:
+            return True
+
+        # Impressão digital primeiro (barata) para filtrar as linhas do mês
+        ymm, hashes = hash_notas(df)
+        do_mes = ymm == self.yyyymm
+        if not do_mes.any():
+            return True
+        fp_d, n_d = fingerprints_por_mes(ymm[do_mes], hashes[do_mes])[self.yyyymm]
+        fp, n = self.fingerprint
+        self.fingerprint = ((fp + fp_d) % (1 << 64), n + n_d)
+
+        preparado = prepare_dataframe(df[do_mes])
+        diario = realizado_por_dia(preparado, self.yyyymm, preparado=True)
+        self._valores += diario[list(CAMPOS_DIARIOS)].to_numpy(dtype=float)
+        self.ultimo_dia = max(self.ultimo_dia, int(preparado["data"].dt.day.max()))
+        return True
+
+    def serie(self) -> pd.DataFrame:
+        """Mesmo formato de calc.realizado_por_dia (diário + acumulados)."""
+        out = pd.DataFrame(self._valores.copy(), index=pd.RangeIndex(1, self.n_dias + 1, name="dia"), columns=list(CAMPOS_DIARIOS))
+        out["LAT"] = out["FAT"] - out["COMPRAS"]
+        for c in ("FAT", "COMPRAS", "LAT"):
+            out[f"{c}_ACUM"] = out[c].cumsum()
+        return out
+
+    def projecao(self, ate_dia: Optional[int] = None, dias_uteis: bool = False) -> Dict[str, float]:
+        """Projeção de fechamento do mês pelo ritmo até 'ate_dia' (padrão: último dia com notas)."""
+        return projetar_fim_do_mes(self.serie(), self.yyyymm, ate_dia or self.ultimo_dia, dias_uteis)
+
+
+def projetar_fim_do_mes(serie: pd.DataFrame, yyyymm: int, ate_dia: int, dias_uteis: bool = False) -> Dict[str, float]:
+    """
+    Run rate: acumulado até 'ate_dia' / fração do mês decorrida.
+    Com dias_uteis=True a fração conta só dias úteis (seg–sex).
+    Retorna {"FAT", "COMPRAS", "LAT"} projetados, os acumulados ("*_ATE_AGORA")
+    e a fração decorrida ("FRACAO").
+    """
+    n_dias = len(serie)
+    ate = int(min(max(ate_dia, 0), n_dias))
+    if ate == 0:
+        zeros = {c: 0.0 for c in ("FAT", "COMPRAS", "LAT")}
+        return {**zeros, **{f"{c}_ATE_AGORA": 0.0 for c in zeros}, "FRACAO": 0.0}
+    if dias_uteis:
+        ano, mes = divmod(int(yyyymm), 100)
+        inicio = np.datetime64(f"{ano:04d}-{mes:02d}-01")
+        decorridos = np.busday_count(inicio, inicio + np.timedelta64(ate, "D"))
+        total = np.busday_count(inicio, inicio + np.timedelta64(n_dias, "D"))
+        fracao = decorridos / total if decorridos > 0 else ate / n_dias
+    else:
+        fracao = ate / n_dias
+    acum = serie.loc[ate, ["FAT_ACUM", "COMPRAS_ACUM", "LAT_ACUM"]].to_numpy(dtype=float)
+    proj = acum / fracao
+    return {
+        "FAT": float(proj[0]),
+        "COMPRAS": float(proj[1]),
+        "LAT": float(proj[2]),
+        "FAT_ATE_AGORA": float(acum[0]),
+        "COMPRAS_ATE_AGORA": float(acum[1]),
+        "LAT_ATE_AGORA": float(acum[2]),
+        "FRACAO": float(fracao),
+    }
+
+
+def comparar_com_cenario(projecao: Dict[str, float], lat_plano: float, margem: float) -> Dict[str, float]:
+    """
+    Confronta a projeção com o cenário da margem escolhida para o mesmo LAT do plano:
+      FAT_cenario = LAT_plano / r ; COMPRAS_cenario = FAT_cenario - LAT_plano
+    Diferenças positivas = projeção acima do cenário. MARGEM_PROJETADA = LAT/FAT projetados.
+    """
+    fat_cen = lat_plano / margem if margem > 0 else 0.0
+    compras_cen = fat_cen - lat_plano
+    fat_proj = projecao["FAT"]
+    return {
+        "FAT_CENARIO": fat_cen,
+        "COMPRAS_CENARIO": compras_cen,
+        "LAT_PLANO": float(lat_plano),
+        "DIF_FAT": fat_proj - fat_cen,
+        "DIF_COMPRAS": projecao["COMPRAS"] - compras_cen,
+        "DIF_LAT": projecao["LAT"] - lat_plano,
+        "MARGEM_PROJETADA": projecao["LAT"] / fat_proj if fat_proj else float("nan"),
+    }
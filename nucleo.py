@@ -0,0 +1,290 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+
+import math
+import re
+import unicodedata
+
+# ============================================================
+# Núcleo tributário sem dependências (só biblioteca padrão)
+# ============================================================
+# Importa em poucos milissegundos: workers, CLI e testes rápidos usam este
+# módulo direto. calc.py (pandas/numpy) reexporta tudo daqui e acrescenta a
+# ingestão e as versões vetorizadas; esses nomes também podem ser pedidos a
+# este módulo e são carregados sob demanda (ver __getattr__ no fim).
+
+# ============================================================
+# Constantes (puras)
+# ============================================================
+# Margens padrão utilizadas em cenários (5% a 30%)
+MARGENS: List[float] = [0.05, 0.10, 0.15, 0.20, 0.25, 0.30]
+
+# Mapeamento de nomes de colunas comuns -> nomes padronizados
+COL_MAP: Dict[str, str] = {
+    "cfop": "cfop",
+    "data emissão": "data_emissao",
+    "data emissao": "data_emissao",
+    "data": "data_emissao",
+    "emitente cnpj/cpf": "emitente",
+    "destinatário cnpj/cpf": "destinatario",
+    "destinatario cnpj/cpf": "destinatario",
+    "chassi": "chassi",
+    "placa": "placa",
+    "produto": "produto",
+    "valor total": "valor_total",
+    "valor_total": "valor_total",
+    "renavam": "renavam",
+    "km": "km",
+    "ano modelo": "ano_modelo",
+    "ano fabricação": "ano_fabricacao",
+    "cor": "cor",
+    "icms alíquota": "icms_aliquota",
+    "icms aliquota": "icms_aliquota",
+    "icms valor": "icms_valor",
+    "icms base": "icms_base",
+    "cst icms": "cst_icms",
+    "redução bc": "reducao_bc",
+    "reducao bc": "reducao_bc",
+    "modalidade bc": "modalidade_bc",
+    "natureza operação": "natureza_operacao",
+    "natureza operacao": "natureza_operacao",
+    "chave xml": "chave_xml",
+    "xml path": "xml_path",
+    "item": "item",
+    "número nf": "numero_nf",
+    "numero nf": "numero_nf",
+    "tipo nota": "tipo_nota",
+    "classificação": "classificacao",
+    "classificacao": "classificacao",
+    "combustível": "combustivel",
+    "combustivel": "combustivel",
+    "motor": "motor",
+    "modelo": "modelo",
+    "potência": "potencia",
+    "potencia": "potencia",
+}
+
+# Regras de classificação das notas (valores já normalizados por normalize_str)
+TIPO_SAIDA = "SAIDA"
+TIPO_ENTRADA = "ENTRADA"
+CLASSIF_REVENDA = "MERCADORIA PARA REVENDA"
+NATUREZA_DEVOLUCAO = "DEVOLUCAO DE COMPRA"
+
+# Alíquota de ICMS sobre o FAT quando a planilha não traz o ICMS por nota
+ICMS_ALIQUOTA_PADRAO = 0.05
+
+# Lucro Presumido (fonte única das alíquotas; calc, plano e regimes derivam daqui)
+PRESUNCAO_LUCRO = 0.32           # base de IRPJ/CSLL = 32% do LAT
+ALIQUOTA_IRPJ = 0.15
+ALIQUOTA_ADICIONAL_IRPJ = 0.10   # sobre a base trimestral acima de LIMITE_ADICIONAL_TRI
+LIMITE_ADICIONAL_TRI = 60000.0
+ALIQUOTA_CSLL = 0.09
+ALIQUOTA_PIS = 0.0065
+ALIQUOTA_COFINS = 0.03
+
+# ============================================================
+# Utilidades de parsing/normalização (puras)
+# ============================================================
+def parse_brl(valor: object) -> float:
+    """
+    Parse seguro de BRL:
+    - Aceita float/int diretamente
+    - Remove 'R$' e espaços
+    - Remove pontos de milhar e converte vírgula para ponto quando ambos existem
+    - Fallback com regex se necessário
+    """
+    if valor is None:
+        return 0.0
+    if isinstance(valor, (int, float)):
+        v = float(valor)
+        return 0.0 if math.isnan(v) else v
+
+    s = str(valor).strip()
+    if s == "" or s.upper() == "NAN":
+        return 0.0
+
+    s = s.replace("R$", "").replace(" ", "").replace("\u00a0", "")
+    try:
+        if "," in s:
+            # Formato BR: '.' milhar, ',' decimal
+            s = s.replace(".", "").replace(",", ".")
+            return float(s)
+        # Caso só ponto (.) como decimal
+        return float(s)
+    except Exception:
+        m = re.search(r"-?\d+(?:[.,]\d+)?", s)
+        if not m:
+            return 0.0
+        frag = m.group(0).replace(".", "").replace(",", ".")
+        try:
+            return float(frag)
+        except Exception:
+            return 0.0
+
+
+def normalize_str(text: object) -> str:
+    """Remove acentos, converte para MAIÚSCULAS e strip. Retorna '' para NaN/None."""
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return ""
+    s = str(text)
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    return s.upper().strip()
+
+
+# ============================================================
+# IRPJ / CSLL trimestrais (puro)
+# ============================================================
+def irpj_csll_trimestre(lat_por_mes: Dict[int, float]) -> Dict[int, Tuple[float, float]]:
+    """
+    Calcula IRPJ/CSLL por trimestre civil a partir de um dict {yyyymm: LAT}.
+    Regras:
+      Base_mês = 32% * LAT_mês
+      IRPJ_tri = 15% * ΣBase + adicional de 10% sobre o que exceder 60.000
+      CSLL_tri = 9% * ΣBase
+      Lançar apenas em Mar/Jun/Set/Dez; nos outros meses do trimestre, não retorna chave.
+    Retorna: {yyyymm_fechamento: (IRPJ, CSLL), ...}
+    """
+    if not lat_por_mes:
+        return {}
+
+    # Agrupa por ano
+    anos = sorted({m // 100 for m in lat_por_mes.keys()})
+    resultado: Dict[int, Tuple[float, float]] = {}
+
+    for ano in anos:
+        # Trimestres
+        trimestres = {
+            1: [1, 2, 3],
+            2: [4, 5, 6],
+            3: [7, 8, 9],
+            4: [10, 11, 12],
+        }
+        for meses in trimestres.values():
+            meses_yyyymm = [ano * 100 + m for m in meses]
+            base_total = sum(PRESUNCAO_LUCRO * float(lat_por_mes.get(m, 0.0)) for m in meses_yyyymm)
+
+            # Base não negativa para tributos
+            base_pos = max(0.0, base_total)
+            if base_pos == 0.0:
+                continue
+
+            irpj = ALIQUOTA_IRPJ * base_pos
+            excedente = max(0.0, base_pos - LIMITE_ADICIONAL_TRI)
+            irpj += ALIQUOTA_ADICIONAL_IRPJ * excedente
+
+            csll = ALIQUOTA_CSLL * base_pos
+
+            mes_fechamento = meses_yyyymm[-1]  # Mar/Jun/Set/Dez
+            resultado[mes_fechamento] = (irpj, csll)
+
+    return resultado
+
+
+# ============================================================
+# PIS / COFINS e cenários por margem (puros)
+# ============================================================
+def pis_cofins(LAT_mes: float) -> Tuple[float, float]:
+    """
+    PIS = 0,65% * LAT_mês
+    COFINS = 3% * LAT_mês
+    """
+    lat = max(0.0, float(LAT_mes))
+    return (ALIQUOTA_PIS * lat, ALIQUOTA_COFINS * lat)
+
+
+def chave_margem(r: float) -> float:
+    """
+    Margem em % usada como chave de cenários (0,20 -> 20.0; 0,125 -> 12.5):
+    sem colisão em grades de 0,5%. Como 20.0 == 20, dicts continuam aceitando d[20].
+    """
+    return round(float(r) * 100, 4)
+
+
+def cenarios_fat_compra(
+    LAT_mes: float,
+    margens: Sequence[float] = MARGENS,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> Dict[float, Dict[str, float]]:
+    """
+    Para um LAT mensal, calcula cenários por margem r em {5%, 10%, ..., 30%}:
+
+      FAT = LAT / r
+      COMPRAS = FAT - LAT
+      ICMS = aliquota_icms * FAT  (exibição; padrão 5%)
+
+    Retorna dict indexado pela margem em % (chave_margem):
+        {
+          5: {"FAT": ..., "COMPRAS": ..., "ICMS": ...},
+          10: {...},
+          ...
+        }
+    Mesmos valores de calc.matriz_cenarios para um único mês.
+    """
+    lat = max(0.0, float(LAT_mes))
+    out: Dict[int, Dict[str, float]] = {}
+    for r in margens:
+        if r <= 0:
+            continue
+        fat = lat / r
+        out[chave_margem(r)] = {"FAT": fat, "COMPRAS": fat - lat, "ICMS": aliquota_icms * fat}
+    return out
+
+
+# ============================================================
+# Auxiliares de período (puras)
+# ============================================================
+def horizonte_meses(inicio_yyyymm: int, n_meses: int) -> List[int]:
+    """Lista n_meses yyyymm consecutivos a partir de inicio_yyyymm (atravessa dezembro)."""
+    ano, mes = divmod(int(inicio_yyyymm), 100)
+    idx0 = ano * 12 + (mes - 1)
+    return [(i // 12) * 100 + (i % 12) + 1 for i in range(idx0, idx0 + max(0, int(n_meses)))]
+
+
+def meses_simulaveis(vigente_yyyymm: int, sim_vigente: bool, fim_yyyymm: Optional[int] = None) -> List[int]:
+    """
+    Lista meses simuláveis a partir do mês 'vigente'.
+    - Se sim_vigente=True: inclui o próprio mês vigente.
+    - Caso contrário: inicia no mês seguinte.
+    Vai até 'fim_yyyymm' (inclusive), podendo cruzar anos; por padrão, dezembro do mesmo ano.
+    """
+    if not vigente_yyyymm:
+        # fallback: ano corrente
+        today = datetime.today()
+        vigente_yyyymm = today.year * 100 + today.month
+
+    ano = vigente_yyyymm // 100
+    mes = vigente_yyyymm % 100
+
+    if fim_yyyymm is None:
+        start = mes if sim_vigente else mes + 1
+        start = min(max(1, start), 12)
+        return [ano * 100 + m for m in range(start, 13)]
+
+    inicio = vigente_yyyymm if sim_vigente else horizonte_meses(vigente_yyyymm, 2)[-1]
+    fim_ano, fim_mes = divmod(int(fim_yyyymm), 100)
+    n = (fim_ano * 12 + fim_mes) - ((inicio // 100) * 12 + inicio % 100) + 1
+    return horizonte_meses(inicio, n)
+
+
+# ============================================================
+# Ingestão (pandas) carregada sob demanda
+# ============================================================
+_CARGA_TARDIA = frozenset({
+    "padronizar_colunas",
+    "prepare_dataframe",
+    "preparar_com_qualidade",
+    "realizado_por_mes",
+    "icms_por_mes",
+    "irpj_csll_vetorizado",
+    "matriz_cenarios",
+    "tabela_horizonte",
+})
+
+
+def __getattr__(nome: str):
+    """Nomes que dependem de pandas/numpy só importam calc quando acessados."""
+    if nome in _CARGA_TARDIA:
+        import calc
+        return getattr(calc, nome)
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
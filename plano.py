@@ -0,0 +1,306 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calc import (
+    ALIQUOTA_COFINS,
+    ALIQUOTA_PIS,
+    ICMS_ALIQUOTA_PADRAO,
+    MARGENS,
+    GradeCenarios,
+    chave_margem,
+    irpj_csll_trimestre,
+    irpj_csll_vetorizado,
+    matriz_cenarios,
+)
+
+# ============================================================
+# Modelo incremental do planejamento LAT
+# ============================================================
+# Campos acumulados nos totais correntes (margem de referência para FAT/COMPRAS/ICMS)
+CAMPOS_TOTAIS: Tuple[str, ...] = ("LAT", "FAT", "COMPRAS", "ICMS", "PIS", "COFINS", "IRPJ", "CSLL")
+
+
+def trimestre_de(yyyymm: int) -> int:
+    """Chave do trimestre civil de um yyyymm: AAAA*10 + T (T = 1..4)."""
+    ano, mes = divmod(int(yyyymm), 100)
+    return ano * 10 + (mes - 1) // 3 + 1
+
+
+def meses_do_trimestre(chave_tri: int) -> List[int]:
+    """Lista os três yyyymm de um trimestre (chave AAAA*10 + T)."""
+    ano, tri = divmod(int(chave_tri), 10)
+    inicio = (tri - 1) * 3 + 1
+    return [ano * 100 + m for m in range(inicio, inicio + 3)]
+
+
+class PlanoIncremental:
+    """
+    Planejamento LAT com rastreamento de dependências por mês/trimestre.
+
+    Uma edição no mês m invalida apenas:
+      - os derivados do próprio mês (FAT/COMPRAS/ICMS por margem, PIS/COFINS);
+      - o IRPJ/CSLL do trimestre de m;
+      - a contribuição de m (e do trimestre) nos totais correntes.
+    Os demais meses/trimestres são reaproveitados do cache.
+    """
+
+    def __init__(
+        self,
+        realizado: Dict[int, Dict[str, float]],
+        vigente_yyyymm: int,
+        sim_vigente: bool,
+        meses: Iterable[int],
+        margens: Iterable[float] = MARGENS,
+        margem_ref: float = 0.20,
+        aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+    ) -> None:
+        self.realizado = realizado
+        self.vigente_yyyymm = int(vigente_yyyymm)
+        self.sim_vigente = bool(sim_vigente)
+        self.meses: List[int] = sorted(int(m) for m in meses)
+        self.margens: Tuple[float, ...] = tuple(r for r in margens if r > 0)
+        self.margem_ref = float(margem_ref)
+        self.aliquota_icms = float(aliquota_icms)
+
+        self._plano: Dict[int, float] = {m: 0.0 for m in self.meses}
+        self._cache_mes: Dict[int, Dict[str, object]] = {}
+        self._cache_tri: Dict[int, Tuple[float, float]] = {}
+        self._tabela: Optional[pd.DataFrame] = None
+        self._totais: Dict[str, float] = {c: 0.0 for c in CAMPOS_TOTAIS}
+        self.recalculos = 0  # nº de meses/trimestres recomputados (diagnóstico)
+
+        for tri in sorted({trimestre_de(m) for m in self.meses}):
+            self._somar_trimestre(tri, +1)
+        for m in self.meses:
+            self._somar_mes(m, +1)
+
+    # ---------------------------
+    # Entradas
+    # ---------------------------
+    def _real(self, yyyymm: int, col: str) -> float:
+        return float(self.realizado.get(yyyymm, {}).get(col, 0.0))
+
+    def travado(self, yyyymm: int) -> bool:
+        """Meses anteriores ao vigente (e o vigente sem simulação) não aceitam plano."""
+        return yyyymm < self.vigente_yyyymm or (yyyymm == self.vigente_yyyymm and not self.sim_vigente)
+
+    def lat_total(self, yyyymm: int) -> float:
+        """LAT efetivo do mês: realizado (passado), realizado+simulado (vigente) ou simulado (futuro)."""
+        if yyyymm < self.vigente_yyyymm:
+            return self._real(yyyymm, "LAT")
+        if yyyymm == self.vigente_yyyymm:
+            return self._real(yyyymm, "LAT") + (self._plano.get(yyyymm, 0.0) if self.sim_vigente else 0.0)
+        return self._plano.get(yyyymm, 0.0)
+
+    def set_lat(self, yyyymm: int, valor: float) -> bool:
+        """
+        Atualiza o LAT simulado de um mês. Retorna True se algo foi invalidado.
+        Valores idênticos ao atual não disparam recomputação.
+        """
+        yyyymm = int(yyyymm)
+        valor = float(valor)
+        if yyyymm not in self._plano or self._plano[yyyymm] == valor:
+            return False
+        antes = self.lat_total(yyyymm)
+        self._plano[yyyymm] = valor
+        if self.lat_total(yyyymm) == antes:
+            # Mês travado: o plano não afeta nenhum derivado
+            return False
+
+        tri = trimestre_de(yyyymm)
+        self._somar_mes(yyyymm, -1)
+        self._somar_trimestre(tri, -1)
+        self._cache_mes.pop(yyyymm, None)
+        self._cache_tri.pop(tri, None)
+        self._tabela = None
+        self._somar_mes(yyyymm, +1)
+        self._somar_trimestre(tri, +1)
+        return True
+
+    def atualizar_plano(self, plano: Dict[int, float]) -> List[int]:
+        """Sincroniza com um dict {yyyymm: LAT}; retorna os meses efetivamente invalidados."""
+        return [m for m, v in plano.items() if self.set_lat(m, v)]
+
+    # ---------------------------
+    # Derivados (com cache)
+    # ---------------------------
+    def derivados(self, yyyymm: int) -> Dict[str, object]:
+        """
+        Derivados do mês:
+          {"LAT", "PIS", "COFINS", "CENARIOS": {pct: {"FAT", "COMPRAS", "ICMS"}}}
+        """
+        yyyymm = int(yyyymm)
+        cached = self._cache_mes.get(yyyymm)
+        if cached is not None:
+            return cached
+
+        lat = self.lat_total(yyyymm)
+        grade = matriz_cenarios([yyyymm], [lat], self.margens, aliquota_icms=self.aliquota_icms)
+        cenarios = {
+            pct: {k: c[k] for k in ("FAT", "COMPRAS", "ICMS")}
+            for pct, c in grade.cenarios_mes(yyyymm, self.margens).items()
+        }
+        out: Dict[str, object] = {
+            "LAT": lat,
+            "PIS": float(grade.PIS[0]),
+            "COFINS": float(grade.COFINS[0]),
+            "CENARIOS": cenarios,
+        }
+        self._cache_mes[yyyymm] = out
+        self.recalculos += 1
+        return out
+
+    def grade(self, margens: Iterable[float]) -> GradeCenarios:
+        """
+        Grade (meses × margens) do horizonte inteiro numa chamada de matriz_cenarios,
+        com o mesmo LAT efetivo, vigente e alíquota de ICMS dos derivados: a tela
+        (grade) e tabela()/totais() (derivados) não divergem. O "a emitir" do
+        vigente desconta o FAT/COMPRAS já realizado.
+        """
+        vigente = [m == self.vigente_yyyymm for m in self.meses]
+        return matriz_cenarios(
+            self.meses,
+            [self.lat_total(m) for m in self.meses],
+            margens,
+            fat_real=[self._real(m, "FAT") if v else 0.0 for m, v in zip(self.meses, vigente)],
+            compras_real=[self._real(m, "COMPRAS") if v else 0.0 for m, v in zip(self.meses, vigente)],
+            vigente_yyyymm=self.vigente_yyyymm,
+            aliquota_icms=self.aliquota_icms,
+        )
+
+    def tributos_trimestre(self, chave_tri: int) -> Tuple[float, float]:
+        """(IRPJ, CSLL) do trimestre (chave AAAA*10 + T), calculado só quando invalidado."""
+        cached = self._cache_tri.get(chave_tri)
+        if cached is not None:
+            return cached
+        lat_tri = {m: self.lat_total(m) for m in meses_do_trimestre(chave_tri)}
+        trib = irpj_csll_trimestre(lat_tri)
+        out = trib.get(meses_do_trimestre(chave_tri)[-1], (0.0, 0.0))
+        self._cache_tri[chave_tri] = out
+        self.recalculos += 1
+        return out
+
+    def irpj_csll(self, yyyymm: int) -> Tuple[float, float]:
+        """IRPJ/CSLL lançados no mês (apenas Mar/Jun/Set/Dez; demais meses = 0)."""
+        if int(yyyymm) % 100 not in (3, 6, 9, 12):
+            return (0.0, 0.0)
+        return self.tributos_trimestre(trimestre_de(yyyymm))
+
+    def lat_por_mes(self) -> Dict[int, float]:
+        """Dict {yyyymm: LAT total} de todo o horizonte."""
+        return {m: float(self.derivados(m)["LAT"]) for m in self.meses}
+
+    def tabela(self) -> pd.DataFrame:
+        """
+        Mesmo formato de tabela_horizonte na margem de referência, montado dos
+        derivados em cache: sem edição desde a última chamada, devolve o mesmo frame.
+        """
+        if self._tabela is not None:
+            return self._tabela
+        vazio = {"FAT": 0.0, "COMPRAS": 0.0, "ICMS": 0.0}
+        linhas = []
+        for m in self.meses:
+            d = self.derivados(m)
+            ref = d["CENARIOS"].get(chave_margem(self.margem_ref), vazio)
+            irpj, csll = self.irpj_csll(m)
+            linhas.append({
+                "yyyymm": m, "LAT": float(d["LAT"]),
+                "FAT": float(ref["FAT"]), "COMPRAS": float(ref["COMPRAS"]), "ICMS": float(ref["ICMS"]),
+                "PIS": float(d["PIS"]), "COFINS": float(d["COFINS"]), "IRPJ": irpj, "CSLL": csll,
+            })
+        out = pd.DataFrame(linhas, columns=["yyyymm", "LAT", "FAT", "COMPRAS", "ICMS", "PIS", "COFINS", "IRPJ", "CSLL"])
+        out["LL"] = out["LAT"] - out[["PIS", "COFINS", "ICMS", "IRPJ", "CSLL"]].sum(axis=1)
+        self._tabela = out
+        return out
+
+    # ---------------------------
+    # Totais correntes (mantidos por delta)
+    # ---------------------------
+    def totais(self) -> Dict[str, float]:
+        return dict(self._totais)
+
+    def _somar_mes(self, yyyymm: int, sinal: int) -> None:
+        d = self.derivados(yyyymm)
+        ref = d["CENARIOS"].get(chave_margem(self.margem_ref), {"FAT": 0.0, "COMPRAS": 0.0, "ICMS": 0.0})
+        self._totais["LAT"] += sinal * float(d["LAT"])
+        self._totais["PIS"] += sinal * float(d["PIS"])
+        self._totais["COFINS"] += sinal * float(d["COFINS"])
+        for c in ("FAT", "COMPRAS", "ICMS"):
+            self._totais[c] += sinal * float(ref[c])
+
+    def _somar_trimestre(self, chave_tri: int, sinal: int) -> None:
+        irpj, csll = self.tributos_trimestre(chave_tri)
+        self._totais["IRPJ"] += sinal * irpj
+        self._totais["CSLL"] += sinal * csll
+
+
+# ============================================================
+# Comparação de N planos (uma passada vetorizada)
+# ============================================================
+def matriz_planos(planos: Sequence[Dict[int, float]], meses: Sequence[int]) -> np.ndarray:
+    """Empilha N planos {yyyymm: LAT} numa matriz (N, n_meses); meses ausentes = 0."""
+    return np.array([[float(p.get(m, 0.0)) for m in meses] for p in planos], dtype=float).reshape(len(planos), len(meses))
+
+
+def compor_lat_efetivo(
+    planos: np.ndarray,
+    lat_real: np.ndarray,
+    meses: Sequence[int],
+    vigente_yyyymm: int,
+    sim_vigente: bool,
+) -> np.ndarray:
+    """
+    Aplica a mesma regra de PlanoIncremental.lat_total à matriz (N, n_meses):
+    realizado antes do vigente, realizado+simulado no vigente (se simulado) e
+    simulado nos meses futuros.
+    """
+    ymm = np.asarray(meses, dtype=np.int64)
+    real = np.asarray(lat_real, dtype=float)[None, :]
+    passado = ymm < vigente_yyyymm
+    vigente = ymm == vigente_yyyymm
+    out = np.where(passado, real, planos)
+    return np.where(vigente, real + (planos if sim_vigente else 0.0), out)
+
+
+def avaliar_planos(
+    nomes: Sequence[str],
+    meses: Sequence[int],
+    lat: np.ndarray,
+    margens: Iterable[float] = MARGENS,
+    aliquota_icms: float = ICMS_ALIQUOTA_PADRAO,
+) -> pd.DataFrame:
+    """
+    Avalia N planos de uma vez a partir da matriz LAT (N, n_meses).
+    Retorna uma linha por plano com LAT, PIS, COFINS, IRPJ, CSLL anuais e,
+    para cada margem r, o FAT total e o Lucro Líquido (ICMS = aliquota_icms * FAT).
+    """
+    lat = np.asarray(lat, dtype=float).reshape(len(nomes), len(meses))
+    lat_pos = np.maximum(lat, 0.0)
+    irpj, csll = irpj_csll_vetorizado(np.asarray(meses), lat)
+
+    lat_tot = lat.sum(axis=1)
+    pis = ALIQUOTA_PIS * lat_pos.sum(axis=1)
+    cofins = ALIQUOTA_COFINS * lat_pos.sum(axis=1)
+    irpj_tot = irpj.sum(axis=1)
+    csll_tot = csll.sum(axis=1)
+
+    rs = np.array([r for r in margens if r > 0], dtype=float)
+    fat = lat_tot[:, None] / rs[None, :]                  # (N, k)
+    ll = (lat_tot - pis - cofins - irpj_tot - csll_tot)[:, None] - aliquota_icms * fat
+
+    out = pd.DataFrame({
+        "Plano": list(nomes),
+        "LAT": lat_tot,
+        "PIS": pis,
+        "COFINS": cofins,
+        "IRPJ": irpj_tot,
+        "CSLL": csll_tot,
+    })
+    for j, r in enumerate(rs):
+        pct = f"{chave_margem(r):g}"
+        out[f"FAT ({pct}%)"] = fat[:, j]
+        out[f"Lucro Líquido ({pct}%)"] = ll[:, j]
+    return out
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+
+import json
+import sqlite3
+
+from sqlite_util import conectar
+
+# ============================================================
+# Persistência local de planos LAT (SQLite)
+# ============================================================
+CAMINHO_PADRAO = "planos.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS planos (
+    empresa   TEXT    NOT NULL,
+    nome      TEXT    NOT NULL,
+    versao    INTEGER NOT NULL,
+    inicio    INTEGER NOT NULL,
+    fim       INTEGER NOT NULL,
+    criado_em TEXT    NOT NULL,
+    descricao TEXT    NOT NULL DEFAULT '',
+    valores   TEXT    NOT NULL,
+    PRIMARY KEY (empresa, nome, versao)
+)
+"""
+
+
+def _intervalo(valores: Dict[int, float]) -> Tuple[int, int]:
+    """(primeiro, último) yyyymm do plano; (0, 0) para plano vazio."""
+    return (min(valores), max(valores)) if valores else (0, 0)
+
+
+def _migrar_chave_ano(con: sqlite3.Connection) -> None:
+    """
+    Bancos antigos guardavam os planos sob (empresa, ano do início do horizonte) e
+    eles sumiam quando o horizonte virava o ano. Passa para a chave (empresa, nome):
+    as versões de um mesmo nome em anos diferentes são renumeradas em ordem de ano.
+    """
+    colunas = {r[1] for r in con.execute("PRAGMA table_info(planos)")}
+    if "ano" not in colunas:
+        return
+    rows = con.execute(
+        "SELECT empresa, nome, criado_em, descricao, valores FROM planos ORDER BY empresa, nome, ano, versao"
+    ).fetchall()
+    con.execute("DROP TABLE planos")
+    con.execute(_SCHEMA)
+    versoes: Dict[Tuple[str, str], int] = {}
+    novas = []
+    for empresa, nome, criado_em, descricao, valores in rows:
+        versao = versoes[(empresa, nome)] = versoes.get((empresa, nome), 0) + 1
+        inicio, fim = _intervalo({int(k): v for k, v in json.loads(valores).items()})
+        novas.append((empresa, nome, versao, inicio, fim, criado_em, descricao, valores))
+    con.executemany("INSERT INTO planos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", novas)
+
+
+class PlanoStore:
+    """
+    Armazena planos LAT nomeados e versionados por empresa.
+    Cada 'salvar' cria uma nova versão (as anteriores são preservadas).
+    Os valores são gravados como JSON {yyyymm: LAT}; o intervalo de meses
+    (inicio/fim) fica em colunas para listar os planos de um horizonte.
+    """
+
+    def __init__(self, caminho: str = CAMINHO_PADRAO) -> None:
+        self.caminho = caminho
+        with conectar(self.caminho) as con:
+            _migrar_chave_ano(con)
+            con.execute(_SCHEMA)
+
+    def salvar(self, empresa: str, nome: str, plano: Dict[int, float], descricao: str = "") -> int:
+        """Grava uma nova versão do plano e retorna o número da versão criada."""
+        nome = nome.strip()
+        if not nome:
+            raise ValueError("Nome do plano não pode ser vazio.")
+        inicio, fim = _intervalo({int(k): v for k, v in plano.items()})
+        valores = json.dumps({str(int(k)): float(v) for k, v in plano.items()})
+        with conectar(self.caminho) as con:
+            row = con.execute(
+                "SELECT COALESCE(MAX(versao), 0) FROM planos WHERE empresa=? AND nome=?",
+                (empresa, nome),
+            ).fetchone()
+            versao = int(row[0]) + 1
+            con.execute(
+                "INSERT INTO planos (empresa, nome, versao, inicio, fim, criado_em, descricao, valores) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (empresa, nome, versao, inicio, fim, datetime.now().isoformat(timespec="seconds"), descricao, valores),
+            )
+        return versao
+
+    def carregar(self, empresa: str, nome: str, versao: Optional[int] = None) -> Dict[int, float]:
+        """Retorna {yyyymm: LAT} da versão pedida (ou da mais recente). KeyError se não existir."""
+        sql = "SELECT valores FROM planos WHERE empresa=? AND nome=?"
+        params: tuple = (empresa, nome)
+        if versao is None:
+            sql += " ORDER BY versao DESC LIMIT 1"
+        else:
+            sql += " AND versao=?"
+            params += (int(versao),)
+        with conectar(self.caminho) as con:
+            row = con.execute(sql, params).fetchone()
+        if row is None:
+            raise KeyError(f"Plano não encontrado: {empresa}/{nome} v{versao or 'última'}")
+        return {int(k): float(v) for k, v in json.loads(row[0]).items()}
+
+    def listar(self, empresa: Optional[str] = None, meses: Optional[Sequence[int]] = None) -> List[Dict[str, object]]:
+        """
+        Lista versões (sem os valores), mais recentes primeiro. Com 'meses', só os
+        planos que cobrem algum mês desse intervalo (ex.: o horizonte do app).
+        """
+        sql = "SELECT empresa, nome, versao, inicio, fim, criado_em, descricao FROM planos WHERE 1=1"
+        params: tuple = ()
+        if empresa is not None:
+            sql += " AND empresa=?"
+            params += (empresa,)
+        if meses:
+            sql += " AND fim >= ? AND inicio <= ?"
+            params += (int(min(meses)), int(max(meses)))
+        sql += " ORDER BY nome, versao DESC"
+        with conectar(self.caminho) as con:
+            rows = con.execute(sql, params).fetchall()
+        cols = ("empresa", "nome", "versao", "inicio", "fim", "criado_em", "descricao")
+        return [dict(zip(cols, r)) for r in rows]
+
+    def excluir(self, empresa: str, nome: str, versao: Optional[int] = None) -> int:
+        """Remove uma versão (ou todas, se versao=None). Retorna nº de linhas removidas."""
+        sql = "DELETE FROM planos WHERE empresa=? AND nome=?"
+        params: tuple = (empresa, nome)
+        if versao is not None:
+            sql += " AND versao=?"
+            params += (int(versao),)
+        with conectar(self.caminho) as con:
+            return con.execute(sql, params).rowcount
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# ============================================================
+# Previsão sazonal + tendência (vetorizada por empresa)
+# ============================================================
+# Modelo por série (empresa):
+#   y_t = a + b * t + s_mes(t) + e_t      (s com soma zero nos 12 meses)
+# Ajuste por mínimos quadrados ponderados resolvido para todas as empresas de
+# uma vez (equações normais empilhadas (E, p, p) invertidas em lote).
+# Séries curtas não sustentam todos os termos: sazonalidade só entra com
+# MIN_MESES_SAZONAL meses observados e tendência com MIN_MESES_TENDENCIA; abaixo
+# disso os coeficientes são anulados por penalização (ridge) forte. Com menos de
+# um ano de histórico a inclinação confunde-se com a sazonalidade (ex.: 4 meses de
+# alta temporada), por isso a tendência exige 12 meses.
+# A tendência é amortecida na projeção: h passos à frente (contados do último mês
+# observado de cada empresa) somam b·φ(1-φ^h)/(1-φ).
+MIN_MESES_SAZONAL = 24
+MIN_MESES_TENDENCIA = 12
+AMORTECIMENTO_PADRAO = 0.9
+
+_PEN_FORTE = 1e10
+_PEN_FRACA = 1e-8
+
+
+def _indice_mes(yyyymm: np.ndarray) -> np.ndarray:
+    ymm = np.asarray(yyyymm, dtype=np.int64)
+    return (ymm // 100) * 12 + (ymm % 100 - 1)
+
+
+def _sazonais(yyyymm: np.ndarray) -> np.ndarray:
+    """Codificação de efeitos (11 colunas): +1 no próprio mês, -1 em dezembro."""
+    mes = np.asarray(yyyymm, dtype=np.int64) % 100
+    col = np.arange(1, 12)
+    return (mes[:, None] == col[None, :]).astype(float) - (mes == 12)[:, None].astype(float)
+
+
+@dataclass
+class Previsao:
+    """
+    Resultado de prever_series: matrizes (n_empresas, n_meses_futuros).
+    inferior/superior = banda de previsão no nível pedido.
+    """
+    empresas: List[str]
+    meses: np.ndarray
+    media: np.ndarray
+    inferior: np.ndarray
+    superior: np.ndarray
+    sigma: np.ndarray            # desvio residual por empresa
+    n_observados: np.ndarray     # meses usados no ajuste por empresa
+
+    def tabela(self, empresa: Optional[str] = None) -> pd.DataFrame:
+        """Formato longo (empresa, yyyymm, previsto, inferior, superior); filtra uma empresa se pedido."""
+        n_emp, n_mes = self.media.shape
+        out = pd.DataFrame({
+            "empresa": np.repeat(self.empresas, n_mes),
+            "yyyymm": np.tile(self.meses, n_emp),
+            "previsto": self.media.ravel(),
+            "inferior": self.inferior.ravel(),
+            "superior": self.superior.ravel(),
+        })
+        return out[out["empresa"] == empresa].reset_index(drop=True) if empresa is not None else out
+
+    def por_mes(self, empresa: str) -> Dict[int, float]:
+        """{yyyymm: previsto} de uma empresa (para preencher planos)."""
+        i = self.empresas.index(empresa)
+        return {int(m): float(v) for m, v in zip(self.meses, self.media[i])}
+
+
+def prever_series(
+    meses_hist: Sequence[int],
+    valores: np.ndarray,
+    meses_futuros: Sequence[int],
+    observado: Optional[np.ndarray] = None,
+    empresas: Optional[Sequence[str]] = None,
+    nivel: float = 0.95,
+    amortecimento: float = AMORTECIMENTO_PADRAO,
+) -> Previsao:
+    """
+    Ajusta o modelo a N séries mensais de uma vez e projeta 'meses_futuros'.
+    valores: (n_empresas, n_meses_hist) ou (n_meses_hist,); 'observado' (mesmo
+    shape, bool) marca os meses válidos — padrão: valores finitos.
+    """
+    ymm_h = np.asarray(meses_hist, dtype=np.int64)
+    ymm_f = np.asarray(meses_futuros, dtype=np.int64)
+    Y = np.atleast_2d(np.asarray(valores, dtype=float))
+    W = (np.isfinite(Y) if observado is None else np.atleast_2d(np.asarray(observado, dtype=bool)) & np.isfinite(Y)).astype(float)
+    Y = np.where(W > 0, Y, 0.0)
+    n_emp = Y.shape[0]
+    nomes = list(empresas) if empresas is not None else [str(i) for i in range(n_emp)]
+
+    # Desenho comum a todas as empresas: [1, t, 11 sazonais]; t centrado no histórico
+    t_h = _indice_mes(ymm_h).astype(float)
+    centro = t_h.mean() if t_h.size else 0.0
+    X = np.column_stack([np.ones_like(t_h), t_h - centro, _sazonais(ymm_h)]) if t_h.size else np.zeros((0, 13))
+
+    # Projeção com tendência amortecida a partir do último mês observado de cada
+    # empresa (histórico que para antes do fim da janela comum não estica a tendência)
+    t_ult = np.where(W > 0, t_h[None, :], -np.inf).max(axis=1, initial=-np.inf) if t_h.size else np.zeros(n_emp)
+    t_ult = np.where(np.isfinite(t_ult), t_ult, t_h.max() if t_h.size else 0.0)[:, None]
+    h = np.maximum(_indice_mes(ymm_f)[None, :] - t_ult, 0.0)
+    phi = float(amortecimento)
+    passos = h if phi >= 1.0 else phi * (1.0 - phi ** h) / (1.0 - phi)
+    # Desenho futuro por empresa: (n_empresas, n_meses_futuros, p)
+    Xf = np.concatenate([
+        np.ones((n_emp, ymm_f.size, 1)),
+        (t_ult + passos - centro)[:, :, None],
+        np.broadcast_to(_sazonais(ymm_f), (n_emp, ymm_f.size, 11)),
+    ], axis=2)
+
+    # Penalização por empresa conforme o histórico disponível
+    n_obs = W.sum(axis=1)
+    p = X.shape[1]
+    pen = np.full((n_emp, p), _PEN_FRACA)
+    pen[:, 1] = np.where(n_obs >= MIN_MESES_TENDENCIA, _PEN_FRACA, _PEN_FORTE)
+    pen[:, 2:] = np.where(n_obs >= MIN_MESES_SAZONAL, _PEN_FRACA, _PEN_FORTE)[:, None]
+
+    XtWX = np.einsum("tp,et,tq->epq", X, W, X) + pen[:, :, None] * np.eye(p)[None]
+    XtWy = np.einsum("tp,et->ep", X, W * Y)
+    inv = np.linalg.inv(XtWX)
+    beta = np.einsum("epq,eq->ep", inv, XtWy)
+
+    # Desvio residual e banda de previsão: sigma * sqrt(1 + x0' (X'WX)^-1 x0)
+    residuo = (Y - beta @ X.T) * W
+    p_efetivo = 1 + (n_obs >= MIN_MESES_TENDENCIA) + 11 * (n_obs >= MIN_MESES_SAZONAL)
+    sigma = np.sqrt((residuo ** 2).sum(axis=1) / np.maximum(n_obs - p_efetivo, 1.0))
+    alavanca = np.einsum("ehp,epq,ehq->eh", Xf, inv, Xf)
+    z = NormalDist().inv_cdf(0.5 + nivel / 2.0)
+    media = np.einsum("ehp,ep->eh", Xf, beta)
+    meia = z * sigma[:, None] * np.sqrt(1.0 + np.maximum(alavanca, 0.0))
+    return Previsao(nomes, ymm_f, media, media - meia, media + meia, sigma, n_obs.astype(int))
+
+
+def prever_carteira(
+    store,
+    ate_yyyymm: int,
+    meses_futuros: Sequence[int],
+    campo: str = "LAT",
+    empresas: Optional[Sequence[str]] = None,
+    **kwargs,
+) -> Previsao:
+    """
+    Previsão em lote para as empresas de um AgregadoStore (padrão: todas), usando
+    todo o histórico armazenado anterior a 'ate_yyyymm' (mês vigente = parcial,
+    fica fora). Meses ausentes no armazenamento não entram no ajuste.
+    """
+    por_empresa = store.meses_por_empresa(empresas)
+    empresas = list(por_empresa)
+    meses_arm = sorted({m for ms in por_empresa.values() for m in ms if m < int(ate_yyyymm)})
+    if not meses_arm:
+        vazio = np.zeros((len(empresas), len(meses_futuros)))
+        return Previsao(empresas, np.asarray(meses_futuros, dtype=np.int64), vazio, vazio, vazio,
+                        np.zeros(len(empresas)), np.zeros(len(empresas), dtype=int))
+    ini, fim = _indice_mes(np.array([meses_arm[0], meses_arm[-1]]))
+    meses_hist = np.arange(int(ini), int(fim) + 1)
+    meses_hist = (meses_hist // 12) * 100 + meses_hist % 12 + 1
+    _, mat = store.matriz(meses_hist.tolist(), empresas)
+    observado = np.array([np.isin(meses_hist, por_empresa[e]) for e in empresas], dtype=bool).reshape(len(empresas), -1)
+    return prever_series(meses_hist, mat[campo], meses_futuros, observado, empresas, **kwargs)
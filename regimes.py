@@ -0,0 +1,197 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Sequence
+from dataclasses import dataclass, fields
+
+import numpy as np
+import pandas as pd
+
+from calc import (
+    ALIQUOTA_ADICIONAL_IRPJ,
+    ALIQUOTA_COFINS,
+    ALIQUOTA_CSLL,
+    ALIQUOTA_IRPJ,
+    ALIQUOTA_PIS,
+    ICMS_ALIQUOTA_PADRAO,
+    LIMITE_ADICIONAL_TRI,
+    PRESUNCAO_LUCRO,
+    matriz_trimestres,
+)
+
+# ============================================================
+# Regimes tributários (tabela de alíquotas)
+# ============================================================
+# Cada regime é só uma linha de parâmetros; o motor empilha a tabela em arrays
+# e avalia regimes × empresas × meses numa única passada. Para incluir um
+# regime novo basta criar um Regime (ou registrar em REGIMES).
+#
+# Base de IRPJ/CSLL por mês: presuncao * (LAT - deduz_despesas * DESPESAS)
+# Por trimestre civil, com base B⁺ = max(0, ΣB):
+#   IRPJ = irpj * B⁺ + adicional * max(0, B⁺ - limite_adicional_tri)
+#   CSLL = csll * max(0, Σ base CSLL)
+# PIS/COFINS sobre LAT⁺ (revenda: receita menos custo de aquisição / créditos)
+# ICMS sobre o FAT.
+
+
+@dataclass(frozen=True)
+class Regime:
+    nome: str
+    presuncao_irpj: float = PRESUNCAO_LUCRO
+    presuncao_csll: float = PRESUNCAO_LUCRO
+    deduz_despesas: float = 0.0   # 1.0 = lucro contábil (LAT - despesas)
+    irpj: float = ALIQUOTA_IRPJ
+    adicional: float = ALIQUOTA_ADICIONAL_IRPJ
+    limite_adicional_tri: float = LIMITE_ADICIONAL_TRI
+    csll: float = ALIQUOTA_CSLL
+    pis: float = ALIQUOTA_PIS
+    cofins: float = ALIQUOTA_COFINS
+    icms: float = ICMS_ALIQUOTA_PADRAO
+
+
+# Lucro Presumido exatamente como o app calcula hoje
+LUCRO_PRESUMIDO = Regime("Lucro Presumido")
+
+# Lucro Real trimestral: IRPJ/CSLL sobre o lucro (LAT - despesas operacionais),
+# PIS/COFINS não cumulativos (1,65% / 7,6%) com crédito das compras para revenda
+LUCRO_REAL = Regime(
+    "Lucro Real",
+    presuncao_irpj=1.0,
+    presuncao_csll=1.0,
+    deduz_despesas=1.0,
+    pis=0.0165,
+    cofins=0.076,
+)
+
+REGIMES: Dict[str, Regime] = {r.nome: r for r in (LUCRO_PRESUMIDO, LUCRO_REAL)}
+
+CAMPOS_RESULTADO = ("PIS", "COFINS", "ICMS", "IRPJ", "CSLL", "CARGA", "LL")
+
+
+def get_regime(nome: str) -> Regime:
+    """Regime pelo nome (chaves de REGIMES)."""
+    try:
+        return REGIMES[nome]
+    except KeyError:
+        raise ValueError(f"Regime desconhecido: {nome!r}. Opções: {', '.join(REGIMES)}") from None
+
+
+def tabela_regimes(regimes: Iterable[Regime]) -> pd.DataFrame:
+    """Tabela de parâmetros (uma linha por regime) para exibição/exportação."""
+    return pd.DataFrame([{f.name: getattr(r, f.name) for f in fields(Regime)} for r in regimes])
+
+
+# ============================================================
+# Avaliação em lote (regimes × empresas × meses)
+# ============================================================
+@dataclass
+class ResultadoRegimes:
+    """
+    Resultado de avaliar_regimes. Cada campo de 'valores' tem shape
+    (n_regimes, n_empresas, n_meses); IRPJ/CSLL lançados nos meses de
+    fechamento do trimestre (Mar/Jun/Set/Dez), como em irpj_csll_vetorizado.
+    """
+    regimes: List[str]
+    empresas: List[str]
+    meses: np.ndarray
+    LAT: np.ndarray               # (n_empresas, n_meses)
+    valores: Dict[str, np.ndarray]
+
+    def totais(self) -> pd.DataFrame:
+        """Uma linha por (empresa, regime) com os totais do período e o ranking."""
+        n_reg, n_emp = len(self.regimes), len(self.empresas)
+        tot = {c: v.sum(axis=2) for c, v in self.valores.items()}          # (R, E)
+        # Ranking por carga total (1 = menor carga) dentro de cada empresa
+        ordem = np.argsort(tot["CARGA"], axis=0, kind="stable")
+        posicao = np.empty_like(ordem)
+        np.put_along_axis(posicao, ordem, np.arange(n_reg)[:, None].repeat(n_emp, axis=1), axis=0)
+        melhor = tot["CARGA"].min(axis=0)
+
+        out = pd.DataFrame({
+            "_ordem": np.tile(np.arange(n_emp), n_reg),
+            "empresa": np.tile(self.empresas, n_reg),
+            "regime": np.repeat(self.regimes, n_emp),
+            "LAT": np.tile(self.LAT.sum(axis=1), n_reg),
+            **{c: tot[c].ravel() for c in CAMPOS_RESULTADO},
+            "posicao": posicao.ravel() + 1,
+            "excesso_vs_melhor": (tot["CARGA"] - melhor[None, :]).ravel(),
+        })
+        out = out.sort_values(["_ordem", "posicao"], kind="stable")
+        return out.drop(columns="_ordem").reset_index(drop=True)
+
+    def ranking(self) -> pd.DataFrame:
+        """Melhor regime por empresa e a economia frente ao segundo colocado."""
+        tot = self.totais()
+        primeiro = tot[tot["posicao"] == 1].set_index("empresa")
+        segundo = tot[tot["posicao"] == 2].set_index("empresa")
+        out = pd.DataFrame({
+            "melhor_regime": primeiro["regime"],
+            "carga": primeiro["CARGA"],
+            "LL": primeiro["LL"],
+        })
+        if not segundo.empty:
+            out["segundo_regime"] = segundo["regime"]
+            out["economia"] = segundo["CARGA"] - primeiro["CARGA"]
+        return out.reindex(self.empresas).reset_index()
+
+
+def avaliar_regimes(
+    meses: Sequence[int],
+    lat: np.ndarray,
+    fat: np.ndarray,
+    despesas: Optional[np.ndarray] = None,
+    regimes: Optional[Iterable[Regime]] = None,
+    empresas: Optional[Sequence[str]] = None,
+) -> ResultadoRegimes:
+    """
+    Avalia todos os regimes para todas as empresas e meses de uma vez.
+    lat/fat/despesas: (n_empresas, n_meses) ou (n_meses,) para uma empresa.
+    despesas (opcional) = 0 se omitido; só muda a base dos regimes que deduzem
+    despesas, mas sai do LL de todos (LL = LAT - despesas - carga).
+    regimes: padrão = todos os de REGIMES.
+    """
+    regs = list(regimes) if regimes is not None else list(REGIMES.values())
+    ymm = np.asarray(meses, dtype=np.int64)
+    lat_arr = np.atleast_2d(np.asarray(lat, dtype=float))
+    fat_arr = np.atleast_2d(np.asarray(fat, dtype=float)).reshape(lat_arr.shape)
+    desp = (
+        np.zeros_like(lat_arr) if despesas is None
+        else np.broadcast_to(np.asarray(despesas, dtype=float), lat_arr.shape)
+    )
+    nomes_emp = list(empresas) if empresas is not None else [str(i) for i in range(lat_arr.shape[0])]
+
+    # Tabela de alíquotas -> arrays (n_regimes, 1, 1) para broadcast
+    p = {f.name: np.array([getattr(r, f.name) for r in regs], dtype=float)[:, None, None]
+         for f in fields(Regime) if f.name != "nome"}
+
+    shape = (len(regs), *lat_arr.shape)
+    if ymm.size == 0 or not regs:
+        vazio = {c: np.zeros(shape) for c in CAMPOS_RESULTADO}
+        return ResultadoRegimes([r.nome for r in regs], nomes_emp, ymm, lat_arr, vazio)
+
+    lat_pos = np.maximum(lat_arr, 0.0)[None]
+    pis = p["pis"] * lat_pos
+    cofins = p["cofins"] * lat_pos
+    icms = p["icms"] * fat_arr[None]
+
+    # IRPJ/CSLL: base mensal -> soma trimestral (matriz one-hot) -> de volta ao mês de fechamento
+    lucro = lat_arr[None] - p["deduz_despesas"] * desp[None]                # (R, E, M)
+    por_tri, inv = matriz_trimestres(ymm)
+    base_irpj = np.maximum((p["presuncao_irpj"] * lucro) @ por_tri, 0.0)    # (R, E, T)
+    base_csll = np.maximum((p["presuncao_csll"] * lucro) @ por_tri, 0.0)
+    irpj_tri = p["irpj"] * base_irpj + p["adicional"] * np.maximum(base_irpj - p["limite_adicional_tri"], 0.0)
+    csll_tri = p["csll"] * base_csll
+
+    fechamento = (ymm % 100 % 3) == 0
+    irpj = np.where(fechamento, irpj_tri[..., inv], 0.0)
+    csll = np.where(fechamento, csll_tri[..., inv], 0.0)
+
+    carga = pis + cofins + icms + irpj + csll
+    valores = {
+        "PIS": pis,
+        "COFINS": cofins,
+        "ICMS": icms,
+        "IRPJ": irpj,
+        "CSLL": csll,
+        "CARGA": carga,
+        "LL": (lat_arr - desp)[None] - carga,
+    }
+    return ResultadoRegimes([r.nome for r in regs], nomes_emp, ymm, lat_arr, valores)
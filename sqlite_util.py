@@ -0,0 +1,18 @@
+from __future__ import annotations
+from typing import Iterator
+from contextlib import contextmanager
+
+import sqlite3
+
+# ============================================================
+# Conexão SQLite compartilhada pelos armazenamentos locais
+# ============================================================
+@contextmanager
+def conectar(caminho: str) -> Iterator[sqlite3.Connection]:
+    """Conexão curta: commit ao sair sem erro, rollback em exceção, sempre fechada."""
+    con = sqlite3.connect(caminho)
+    try:
+        with con:  # commit/rollback automático
+            yield con
+    finally:
+        con.close()
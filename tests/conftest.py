@@ -0,0 +1,27 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLUNAS_NOTAS = ["Data Emissão", "Tipo Nota", "Valor Total", "Classificação", "Natureza Operação", "Chave XML"]
+
+
+@pytest.fixture
+def notas():
+    """
+    Fábrica de planilhas de notas com as colunas da planilha real, uma tupla por nota:
+      (data, tipo, valor[, classificação[, natureza[, chave_xml]]])
+    Classificação vazia e natureza "Venda" por padrão; a Chave XML só entra se informada.
+    """
+    def fabricar(linhas) -> pd.DataFrame:
+        padrao = ("", "", "", "", "Venda", None)
+        completas = [tuple(l) + padrao[len(l):] for l in linhas]
+        df = pd.DataFrame(completas, columns=COLUNAS_NOTAS)
+        if df["Chave XML"].isna().all():
+            return df.drop(columns="Chave XML")
+        return df[["Chave XML", *COLUNAS_NOTAS[:5]]]
+
+    return fabricar
@@ -0,0 +1,149 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agregados_store import AgregadoStore
+from calc import realizado_por_mes
+
+MESES = [202501, 202502, 202503]
+
+
+# (data, tipo, valor, classificação, natureza, chave XML)
+BASE = [
+    ("05/01/2025", "Saída", "100.000,00", "Venda", "Venda", "A1"),
+    ("06/01/2025", "Entrada", "80.000,00", "Mercadoria para revenda", "Compra", "A2"),
+    ("03/02/2025", "Saída", "50.000,00", "Venda", "Venda", "B1"),
+    ("10/03/2025", "Saída", "70.000,00", "Venda", "Venda", "C1"),
+]
+
+
+def _assert_igual(store, df):
+    esperado = realizado_por_mes(df, meses=MESES)
+    obtido = store.realizado("emp", MESES)
+    for m in MESES:
+        for col in ("FAT", "COMPRAS", "LAT"):
+            assert obtido[m][col] == pytest.approx(esperado[m][col])
+
+
+def test_atualizar_reprocessa_so_meses_alterados(notas, tmp_path):
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    df = notas(BASE)
+    assert store.atualizar("emp", df) == MESES
+    assert store.atualizar("emp", df.sample(frac=1, random_state=1)) == []  # ordem não importa
+
+    alterado = notas(BASE[:3] + [("10/03/2025", "Saída", "75.000,00", "Venda", "Venda", "C1")])
+    assert store.atualizar("emp", alterado) == [202503]
+    _assert_igual(store, alterado)
+
+    # Mês que some do arquivo é removido
+    assert store.atualizar("emp", notas(BASE[:3])) == [202503]
+    assert store.realizado("emp", [202503])[202503]["FAT"] == 0.0
+
+
+def test_mes_vigente_e_o_ultimo_mes_com_faturamento(notas, tmp_path):
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    assert store.mes_vigente("emp") == 0
+    # Abril só tem compras: não vira o mês vigente
+    store.atualizar("emp", notas(BASE + [("02/04/2025", "Entrada", "9.000,00", "Mercadoria para revenda", "Compra", "D1")]))
+    assert store.mes_vigente("emp") == 202503
+    assert store.mes_vigente("outra") == 0
+
+
+def test_anexar_delta_equivale_a_reprocessar_tudo(notas, tmp_path):
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    store.atualizar("emp", notas(BASE))
+    delta = notas([
+        ("11/03/2025", "Entrada", "30.000,00", "Mercadoria para revenda", "Compra", "C2"),
+        ("12/03/2025", "Saída", "5.000,00", "Devolução", "Devolução de compra", "C3"),
+    ])
+    assert store.anexar_delta("emp", delta) == [202503]
+
+    completo = pd.concat([notas(BASE), delta], ignore_index=True)
+    _assert_igual(store, completo)
+    # Impressões digitais aditivas: a versão completa não dispara reprocessamento
+    assert store.atualizar("emp", completo) == []
+
+
+def test_anexar_delta_ignora_notas_ja_armazenadas(notas, tmp_path):
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    store.atualizar("emp", notas(BASE))
+    delta = notas([("11/03/2025", "Entrada", "30.000,00", "Mercadoria para revenda", "Compra", "C2")])
+    assert store.anexar_delta("emp", delta) == [202503]
+    antes = store.realizado("emp", MESES)
+    fps = store.fingerprints("emp")
+
+    # Mesmo lote reenviado (outro arquivo, mesmo conteúdo): nada muda
+    assert store.notas_novas("emp", delta).tolist() == [False]
+    assert store.anexar_delta("emp", delta) == []
+    # Lote que repete uma nota da base e traz uma nova: só a nova entra
+    nova = ("12/03/2025", "Saída", "1.000,00", "Venda", "Venda", "C3")
+    sobreposto = notas([BASE[3], nova, BASE[3]])
+    assert store.notas_novas("emp", sobreposto).tolist() == [False, True, False]
+    assert store.anexar_delta("emp", sobreposto) == [202503]
+    assert store.realizado("emp", MESES)[202503]["FAT"] == pytest.approx(antes[202503]["FAT"] + 1_000)
+    assert store.fingerprints("emp")[202501] == fps[202501]
+
+    # A versão completa equivalente continua sem reprocessamento
+    completo = pd.concat([notas(BASE), delta, notas([nova])], ignore_index=True)
+    _assert_igual(store, completo)
+    assert store.atualizar("emp", completo) == []
+
+
+def test_atualizar_reaproveita_frame_preparado(notas, tmp_path):
+    from calc import prepare_dataframe
+
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    df = notas(BASE)
+    assert store.atualizar("emp", df, preparado=prepare_dataframe(df)) == MESES
+    _assert_igual(store, df)
+    delta = notas([("11/03/2025", "Entrada", "30.000,00", "Mercadoria para revenda", "Compra", "C2")])
+    assert store.anexar_delta("emp", delta, preparado=prepare_dataframe(delta)) == [202503]
+    _assert_igual(store, pd.concat([df, delta], ignore_index=True))
+
+
+def _totais(rel):
+    return rel.totais().sort_values(["problema", "coluna"]).reset_index(drop=True)
+
+
+def test_ingerir_reprocessa_so_meses_alterados_e_equivale_a_recalcular(notas, tmp_path):
+    from agregados_store import anexar, ingerir
+    from calc import icms_por_mes, preparar_com_qualidade
+
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    base = BASE + [("xx", "Saída", "abc", "Venda", "Venda", "Z1")]
+    primeira = ingerir(store, "emp", notas(base))
+    assert primeira.meses_reprocessados == MESES
+
+    # Nova versão: março muda e ganha uma nota com tipo desconhecido; jan/fev intactos
+    nova = base[:3] + [
+        ("10/03/2025", "Saída", "75.000,00", "Venda", "Venda", "C1"),
+        ("12/03/2025", "Foo", "1,00", "", "x", "C9"),
+        base[4],
+    ]
+    df = notas(nova)
+    segunda = ingerir(store, "emp", df, anterior=primeira)
+    assert segunda.meses_reprocessados == [202503]
+    _assert_igual(store, df)
+
+    prep, rel = preparar_com_qualidade(df)
+    pd.testing.assert_frame_equal(_totais(segunda.qualidade), _totais(rel))
+    assert sorted(segunda.qualidade.amostras["linha"]) == sorted(rel.amostras["linha"])
+    assert segunda.qualidade.total_linhas == len(df)
+    esperado_icms = icms_por_mes(prep, preparado=True)
+    assert segunda.icms.reset_index(drop=True).equals(esperado_icms.reset_index(drop=True))
+
+    # Mesma versão de novo: nada a reprocessar
+    assert ingerir(store, "emp", df, anterior=segunda).meses_reprocessados == []
+
+    # Delta: só as notas inéditas entram; fingerprints seguem a do arquivo concatenado
+    delta = notas([BASE[0], ("11/03/2025", "Entrada", "30.000,00", "Mercadoria para revenda", "Compra", "C2")])
+    terceira, anexadas = anexar(store, "emp", segunda, delta)
+    assert len(anexadas) == 1 and terceira.meses_reprocessados == [202503]
+    assert terceira.fingerprints == store.fingerprints("emp")
+    completo = pd.concat([df, anexadas], ignore_index=True)
+    _assert_igual(store, completo)
+    pd.testing.assert_frame_equal(_totais(terceira.qualidade), _totais(preparar_com_qualidade(completo)[1]))
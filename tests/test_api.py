@@ -0,0 +1,150 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+from starlette.testclient import TestClient
+
+from agregados_store import AgregadoStore
+from api import MIME_ARROW, criar_app
+from calc import realizado_por_mes
+from plano import avaliar_planos
+from plano_store import PlanoStore
+
+
+@pytest.fixture
+def planilha(notas):
+    return notas([
+        ("10/01/2025", "Saída", "100.000,00"),
+        ("15/02/2025", "Saída", "80.000,00"),
+        ("20/02/2025", "Entrada", "50.000,00", "Mercadoria para Revenda", "Compra"),
+        ("03/03/2025", "Saída", "30.000,00"),
+    ])
+
+
+@pytest.fixture
+def cliente(planilha, tmp_path):
+    caminho = tmp_path / "notas.csv"
+    planilha.to_csv(caminho, index=False)
+    planos = PlanoStore(str(tmp_path / "planos.sqlite"))
+    planos.salvar("loja", "Base", {202504: 40_000.0, 202505: 40_000.0})
+    app = criar_app(AgregadoStore(str(tmp_path / "agg.sqlite")), planos, notas={"loja": str(caminho)})
+    with TestClient(app) as c:
+        yield c
+
+
+def test_realizado_e_recarga(cliente, planilha, tmp_path):
+    assert cliente.get("/saude").json()["empresas"] == ["loja"]
+    r = cliente.get("/realizado", params={"empresa": "loja", "inicio": 202501, "meses": 4}).json()
+    esperado = realizado_por_mes(planilha, meses=[202501, 202502, 202503, 202504])
+    assert r["yyyymm"] == [202501, 202502, 202503, 202504]
+    assert r["FAT"] == pytest.approx([esperado[m]["FAT"] for m in r["yyyymm"]])
+    assert r["LAT"] == pytest.approx([esperado[m]["LAT"] for m in r["yyyymm"]])
+
+    # Nova versão da planilha: só o mês alterado é reprocessado e o cache é renovado
+    novo = planilha.copy()
+    novo.loc[3, "Valor Total"] = "45.000,00"
+    caminho = tmp_path / "notas_v2.csv"
+    novo.to_csv(caminho, index=False)
+    resp = cliente.post("/empresas/loja/notas", json={"caminho": str(caminho)}).json()
+    assert resp["meses_reprocessados"] == [202503]
+    r = cliente.get("/realizado", params={"empresa": "loja"}).json()
+    assert r["FAT"][-1] == pytest.approx(45_000.0)
+
+    assert cliente.get("/realizado", params={"empresa": "nenhuma"}).status_code == 404
+    # .xls seria lido com o openpyxl (só lê .xlsx): recusado como erro de entrada
+    xls = tmp_path / "notas.xls"
+    xls.write_bytes(b"\xd0\xcf\x11\xe0")
+    resp = cliente.post("/empresas/loja/notas", json={"caminho": str(xls)})
+    assert resp.status_code == 400 and ".xlsx" in resp.json()["erro"]
+
+
+def test_avaliar_planos_em_lote_json_e_arrow(cliente, planilha):
+    meses = [202501, 202502, 202503, 202504, 202505, 202506]
+    planos = [
+        {"nome": "A", "lat": [0, 0, 0, 50_000, 60_000, 70_000]},
+        {"nome": "B", "lat": [0, 0, 0, 40_000, 40_000, 0]},
+    ]
+    r = cliente.post("/planos/avaliar", json={"meses": meses, "planos": planos}).json()
+    lat = np.array([p["lat"] for p in planos], dtype=float)
+    esperado = avaliar_planos(["A", "B"], meses, lat)
+    assert r["Plano"] == ["A", "B"]
+    assert r["IRPJ"] == pytest.approx(esperado["IRPJ"].tolist())
+    assert r["Lucro Líquido (20%)"] == pytest.approx(esperado["Lucro Líquido (20%)"].tolist())
+
+    # Com empresa: meses até o vigente (Mar/2025) usam o realizado; plano salvo = plano B
+    corpo = {"meses": meses, "empresa": "loja", "planos": [planos[0], {"salvo": "Base"}]}
+    r = cliente.post("/planos/avaliar", json=corpo).json()
+    real = realizado_por_mes(planilha, meses=meses)
+    lat_real = sum(real[m]["LAT"] for m in meses[:3])
+    assert r["Plano"] == ["A", "Base"]
+    assert r["LAT"] == pytest.approx([lat_real + 180_000, lat_real + 80_000])
+
+    pa = pytest.importorskip("pyarrow")
+    resp = cliente.post("/planos/avaliar", params={"formato": "arrow"}, json=corpo)
+    assert resp.headers["content-type"] == MIME_ARROW
+    tabela = pa.ipc.open_stream(resp.content).read_all().to_pandas()
+    assert tabela["Plano"].tolist() == ["A", "Base"]
+
+    erro = cliente.post("/planos/avaliar", json={"meses": meses, "planos": [{"lat": [1, 2]}]})
+    assert erro.status_code == 400 and "lat" in erro.json()["erro"]
+    assert cliente.post("/planos/avaliar", json={**corpo, "planos": [{"salvo": "X"}]}).status_code == 404
+
+
+def test_cenarios_lote_grade_planos_meses_margens(cliente):
+    corpo = {
+        "inicio": 202503, "n_meses": 2, "margens": [0.1, 0.2], "empresa": "loja",
+        "planos": [{"nome": "A", "lat": [10_000, 20_000]}, {"nome": "B", "lat": [0, 40_000]}],
+    }
+    r = pd.DataFrame(cliente.post("/cenarios/lote", json=corpo).json())
+    assert len(r) == 2 * 2 * 2
+    b_abr_20 = r[(r["plano"] == "B") & (r["yyyymm"] == 202504) & (r["margem"] == 0.2)].iloc[0]
+    assert b_abr_20["FAT"] == pytest.approx(200_000.0)
+    assert b_abr_20["FAT_EMITIR"] == pytest.approx(200_000.0)
+    # Alíquota efetiva de ICMS informada pelo cliente (padrão 5%)
+    assert b_abr_20["ICMS"] == pytest.approx(0.05 * 200_000.0)
+    r = pd.DataFrame(cliente.post("/cenarios/lote", json={**corpo, "aliquota_icms": 0.009}).json())
+    assert r["ICMS"].to_numpy() == pytest.approx(0.009 * r["FAT"].to_numpy())
+    assert cliente.post("/cenarios/lote", json={**corpo, "aliquota_icms": 5}).status_code == 400
+
+
+def test_entrada_malformada_vira_400_e_bug_nao(cliente, monkeypatch):
+    base = {"meses": [202504, 202505]}
+    for corpo in (
+        {**base, "planos": [[1, 2]]},                          # item não é objeto
+        {**base, "planos": ["A"]},
+        {**base, "planos": [{"lat": ["x", 2]}]},               # LAT não numérico
+        {**base, "planos": [{"lat": 5}]},
+        {"meses": ["abr"], "planos": [{"lat": [1]}]},
+        {"meses": [202513], "planos": [{"lat": [1]}]},         # mês fora de 01..12
+        {"inicio": 202500, "planos": [{"lat": [1] * 12}]},
+        {**base, "margens": "0.2", "planos": [{"lat": [1, 2]}]},
+        {**base, "aliquota_icms": None, "planos": [{"lat": [1, 2]}]},
+    ):
+        resp = cliente.post("/planos/avaliar", json=corpo)
+        assert resp.status_code == 400, corpo
+        assert resp.json()["erro"]
+    assert cliente.get("/realizado", params={"empresa": "loja", "inicio": "jan"}).status_code == 400
+    assert cliente.get("/realizado", params={"empresa": "loja", "inicio": 202514}).status_code == 400
+
+    # ValueError interno (bug do servidor) não é mascarado como erro do cliente
+    def quebrado(*args, **kwargs):
+        raise ValueError("bug")
+
+    monkeypatch.setattr("api.avaliar_planos", quebrado)
+    with pytest.raises(ValueError, match="bug"):
+        cliente.post("/planos/avaliar", json={**base, "planos": [{"lat": [1, 2]}]})
+
+    # KeyError interno também não vira 404: só NaoEncontrado (empresa/plano) vira
+    def chave_ausente(*args, **kwargs):
+        raise KeyError("coluna")
+
+    monkeypatch.setattr("api.avaliar_planos", chave_ausente)
+    with pytest.raises(KeyError, match="coluna"):
+        cliente.post("/planos/avaliar", json={**base, "planos": [{"lat": [1, 2]}]})
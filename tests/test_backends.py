@@ -0,0 +1,68 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import get_backend
+
+
+def _notas_sujas() -> pd.DataFrame:
+    # Valores em texto BR, numéricos, lixo e vazios; acentos/caixa variados; notas sem natureza;
+    # datas com formatos misturados (dia primeiro, ISO, com hora) na mesma coluna
+    return pd.DataFrame({
+        "Data Emissão": ["05/01/2025", "20/01/2025", "03/02/2025", "28/02/2025", "15/03/2025",
+                         "15/03/2025", "31/12/2024", "xx/yy", "10/01/2026", "11/02/2025",
+                         "2025-01-12", "2025-02-03 14:30:00", "2025-03-07T09:15:00", "07/03/2025 18:45",
+                         "4/2/2025 08:00:00", " 2024-12-30 "],
+        "Valor Total": ["R$ 1.234,56", "1000", "R$ 500.000,00", "abc 12,5 def", "",
+                        "nan", "999", "100", "200", "750,25",
+                        "R$\u00a02.000,00", "300", "4.500,10", "120", "80", "60"],
+        "Tipo Nota": ["Saída", "Entrada", "Saída", "Entrada", "SAIDA",
+                      " entrada ", "Saída", "Saída", "Saída", "Saída",
+                      "Saída", "Entrada", "Saída", "Saída", "Saída", "Saída"],
+        "Classificação": ["Venda", "Mercadoria para revenda", "Venda", "MERCADORIA PARA REVENDA", "Venda",
+                          "Mercadoria para revenda", "Venda", "Venda", "Venda", "Devolução",
+                          "Venda", "Mercadoria para revenda", "Venda", "Venda", "Venda", "Venda"],
+        "Natureza Operação": ["Venda", "Compra", None, "Compra", "Venda",
+                              "Compra", "Venda", "Venda", "Venda", "Devolução de compra",
+                              "Venda", "Compra", "Venda", "Venda", "Venda", "Venda"],
+    })
+
+
+@pytest.mark.parametrize("nome", ["duckdb", "polars"])
+@pytest.mark.parametrize("formato", ["dataframe", "parquet", "csv"])
+def test_backend_lazy_igual_ao_pandas(nome, formato, tmp_path):
+    pytest.importorskip(nome)
+    df = _notas_sujas()
+    meses = [202412, 202501, 202502, 202503, 202601]
+    esperado = get_backend("pandas").realizado_por_mes(df, meses=meses)
+
+    if formato == "dataframe":
+        fonte = df
+    elif formato == "parquet":
+        fonte = str(tmp_path / "notas.parquet")
+        df.to_parquet(fonte)
+    else:
+        fonte = str(tmp_path / "notas.csv")
+        df.to_csv(fonte, index=False)
+
+    obtido = get_backend(nome).realizado_por_mes(fonte, meses=meses)
+    assert obtido.keys() == esperado.keys()
+    # Nenhuma data em formato aceito fica de fora da referência pandas
+    assert sum(v["FAT"] for v in esperado.values()) == pytest.approx(
+        1_234.56 + 500_000 + 999 + 200 + 2_000 + 4_500.10 + 120 + 80 + 60
+    )
+    for m in meses:
+        for col in ("FAT", "COMPRAS", "LAT"):
+            assert obtido[m][col] == pytest.approx(esperado[m][col]), (m, col)
+
+    # Lista de meses vazia: mesmo resultado vazio do pandas, sem erro de SQL
+    assert get_backend(nome).realizado_por_mes(fonte, meses=[]) == get_backend("pandas").realizado_por_mes(df, meses=[]) == {}
+
+
+def test_backend_desconhecido():
+    with pytest.raises(ValueError):
+        get_backend("spark")
@@ -59,3 +59,255 @@ def test_irpj_csll_trimestre_aplica_adicional_quando_excede_60k():
 
     assert irpj == pytest.approx(expected_irpj)
     assert csll == pytest.approx(expected_csll)
+
+
+def test_horizonte_atravessa_virada_do_ano():
+    from calc import horizonte_meses, meses_simulaveis
+
+    assert horizonte_meses(202511, 4) == [202511, 202512, 202601, 202602]
+    assert len(horizonte_meses(202501, 36)) == 36 and horizonte_meses(202501, 36)[-1] == 202712
+    # Sem fim explícito, mantém o comportamento até dezembro
+    assert meses_simulaveis(202511, False) == [202512]
+    assert meses_simulaveis(202511, False, fim_yyyymm=202603) == [202512, 202601, 202602, 202603]
+
+
+def test_irpj_csll_vetorizado_igual_ao_escalar_em_24_meses():
+    import numpy as np
+    from calc import horizonte_meses, irpj_csll_vetorizado
+
+    ymm = horizonte_meses(202501, 24)
+    lat = np.linspace(-50_000, 250_000, 24)
+    irpj, csll = irpj_csll_vetorizado(np.array(ymm), lat)
+    trib = irpj_csll_trimestre(dict(zip(ymm, lat)))
+    for i, m in enumerate(ymm):
+        esperado = trib.get(m, (0.0, 0.0))
+        assert irpj[i] == pytest.approx(esperado[0])
+        assert csll[i] == pytest.approx(esperado[1])
+
+
+def test_matriz_cenarios_grade_fina_e_a_emitir():
+    import numpy as np
+    from calc import grade_margens, matriz_cenarios
+
+    margens = grade_margens(passo=0.005)
+    assert len(margens) == 51 and 0.20 in margens
+    grade = matriz_cenarios(
+        [202507, 202508, 202509],
+        [50_000.0, 100_000.0, 389_800.0],
+        margens,
+        fat_real=[0.0, 300_000.0, 0.0],
+        compras_real=[0.0, 250_000.0, 0.0],
+        vigente_yyyymm=202508,
+    )
+    assert grade.FAT.shape == (3, 51)
+    assert np.isnan(grade.FAT_EMITIR[0]).all()  # mês passado: sem "a emitir"
+
+    vig = grade.cenarios_mes(202508)[20]
+    assert vig["FAT"] == pytest.approx(500_000)
+    assert vig["FAT_EMITIR"] == pytest.approx(200_000)
+    assert vig["COMPRA_EMITIR"] == pytest.approx(150_000)
+    # Mesma conta do helper escalar
+    assert grade.cenarios_mes(202509)[20]["ICMS"] == pytest.approx(cenarios_fat_compra(389_800)[20]["ICMS"])
+
+    # Grade de 0,5%: 12,5% tem chave própria; margem fora da grade não é aproximada
+    linha = grade.cenarios_mes(202509, [0.12, 0.125, 0.13])
+    assert sorted(linha) == [12.0, 12.5, 13.0]
+    assert linha[12.5]["FAT"] == pytest.approx(389_800 / 0.125)
+    with pytest.raises(KeyError):
+        grade.cenarios_mes(202509, [0.1234])
+    with pytest.raises(KeyError):
+        grade.cenarios_mes(202601)
+
+
+def test_solver_trimestres_inverte_lucro_liquido_e_folga():
+    import numpy as np
+    from calc import LAT_LIMITE_ADICIONAL_TRI, ll_trimestre, solver_trimestres
+
+    meses = [202507, 202508, 202509, 202510, 202511, 202512]
+    lat = [100_000.0, 50_000.0, 0.0, 0.0, 0.0, 0.0]
+    editaveis = [False, False, True, True, True, True]
+    df = solver_trimestres(meses, lat, editaveis, alvo_ll=150_000.0)
+
+    # Folga: LAT até a base trimestral (32%) atingir 60.000
+    t3 = df[df["trimestre"] == 20253].iloc[0]
+    assert t3["FOLGA_LAT"] == pytest.approx(LAT_LIMITE_ADICIONAL_TRI - 150_000.0)
+    trib = irpj_csll_trimestre({202507: 100_000.0, 202508: 50_000.0, 202509: t3["FOLGA_LAT"]})
+    assert trib[202509][0] == pytest.approx(0.15 * 60_000.0)  # exatamente no limite, sem adicional
+
+    # Meta de LL: o LAT encontrado reproduz a meta em cada margem atingível
+    ok = df["LAT_ALVO"].notna()
+    assert not ok[df["margem"] == 0.05].any()  # 5%: ICMS consome todo o LAT
+    for _, linha in df[ok].iterrows():
+        ll = ll_trimestre(np.array([linha["LAT_ALVO"]]), [linha["margem"]])[0, 0]
+        assert ll == pytest.approx(150_000.0)
+        assert linha["FAT_EMITIR"] == pytest.approx(max(linha["LAT_ADICIONAL"], 0.0) / linha["margem"])
+
+    # Coeficientes do solver = mesmas alíquotas da tabela do horizonte (fonte única no núcleo)
+    from calc import tabela_horizonte
+    for lat_tri in (90_000.0, 600_000.0):
+        tab = tabela_horizonte({202510: lat_tri / 3, 202511: lat_tri / 3, 202512: lat_tri / 3}, margem=0.25)
+        assert ll_trimestre(np.array([lat_tri]), [0.25])[0, 0] == pytest.approx(tab["LL"].sum())
+
+
+def test_parse_brl_series_igual_ao_escalar_e_relatorio_de_qualidade():
+    from calc import parse_brl, parse_brl_series, preparar_com_qualidade
+
+    entradas = ["1.234,56", "R$ 10,00", "(5,5)", "-3", "abc 12,5 def", "abc", "", None, 7.25, "1,5e3", " 12 ", "nan", 3]
+    valores, vazio, invalido = parse_brl_series(pd.Series(entradas, dtype=object))
+    assert valores.tolist() == pytest.approx([parse_brl(x) for x in entradas])
+    assert vazio.tolist() == [False, False, False, False, False, False, True, True, False, False, False, True, False]
+    assert invalido.tolist()[5] and not invalido.tolist()[0]
+
+    df = pd.DataFrame({
+        "Data Emissão": ["01/02/2025", "xx", "05/03/2025", None],
+        "Tipo Nota": ["Saída", "Entrada", "Foo", "Saída"],
+        "Valor Total": ["1.000,50", "abc", "-5", ""],
+        "Classificação": ["", "Mercadoria para Revenda", "", ""],
+        "Natureza Operação": ["Venda", "Compra", "x", "Venda"],
+        "Coluna Estranha": [1, 2, 3, 4],
+    })
+    prep, rel = preparar_com_qualidade(df)
+    totais = rel.totais().set_index("problema")["linhas"]
+    assert not rel.ok
+    assert rel.colunas_nao_mapeadas == ["Coluna Estranha"]
+    assert totais["valor_vazio"] == 1 and totais["valor_invalido"] == 1
+    assert totais["valor_negativo"] == 1 and totais["data_invalida"] == 2
+    assert totais["tipo_nota_desconhecido"] == 1 and totais["fora_das_regras"] == 1
+    # Resumo por mês: a nota com tipo desconhecido cai em 202503
+    linha = rel.resumo[(rel.resumo["problema"] == "tipo_nota_desconhecido")]
+    assert linha["yyyymm"].tolist() == [202503]
+    assert "abc" in rel.amostras["valor_original"].tolist()
+    # Mesmo DataFrame preparado que o caminho sem relatório
+    from calc import prepare_dataframe
+    pd.testing.assert_frame_equal(prep, prepare_dataframe(df))
+
+    # Índice com rótulos repetidos: amostras por posição, sem duplicar linhas
+    _, rel_dup = preparar_com_qualidade(df.set_axis([0, 0, 1, 1]))
+    invalidos = rel_dup.amostras[rel_dup.amostras["problema"] == "valor_invalido"]
+    assert invalidos["valor_original"].tolist() == ["abc"]
+
+    # Delta anexado: combinar() == relatório do arquivo concatenado
+    _, rel_a = preparar_com_qualidade(df.iloc[:2])
+    _, rel_b = preparar_com_qualidade(df.iloc[2:].reset_index(drop=True))
+    combinado = rel_a.combinar(rel_b)
+    assert combinado.total_linhas == rel.total_linhas
+    pd.testing.assert_frame_equal(combinado.totais().sort_values(["problema", "coluna"]).reset_index(drop=True),
+                                  rel.totais().sort_values(["problema", "coluna"]).reset_index(drop=True))
+    assert sorted(combinado.amostras["linha"]) == sorted(rel.amostras["linha"])
+
+
+def test_brl_series_igual_ao_brl_escalar():
+    import numpy as np
+    from ui_helpers import brl, brl_series
+
+    rng = np.random.default_rng(7)
+    valores = np.concatenate([
+        rng.normal(0, 1e6, 2000).round(2),
+        [0.0, -0.0, 0.004, -0.004, 5, 12, 123, 999.995, 1000, 999999.99, -1234567.891, np.nan],
+        # Acima do limite de centavos em int64 (~9,2e16) e não finitos
+        [9.3e16, -9.3e16, 1e20, np.inf, -np.inf],
+    ])
+    assert list(brl_series(valores)) == [brl(v) for v in valores]
+    # Empates de meio centavo sobre o float binário (ex.: PIS = 0,0065 * LAT inteiro)
+    empates = np.concatenate([[61.725, 0.125, 2.675, 1.005, -0.015], 0.0065 * np.arange(1_000, 200_000, 7.0)])
+    assert list(brl_series(empates)) == [brl(v) for v in empates]
+
+    s = pd.Series([1234.5, None, "abc", "12"], index=[5, 6, 7, 8], name="LAT")
+    out = brl_series(s)
+    assert out.index.tolist() == [5, 6, 7, 8] and out.name == "LAT"
+    assert out.tolist() == ["R$ 1.234,50", "—", "—", "R$ 12,00"]
+    assert len(brl_series([])) == 0
+
+
+def test_estilo_brl_exibe_textos_de_brl_sem_mudar_os_dados():
+    import numpy as np
+    from ui_helpers import brl, estilo_brl
+
+    df = pd.DataFrame({"LAT": [1234.5, np.nan, -0.015, 1e20], "n": [1, 2, 3, 4], "nome": list("abcd")})
+    estilo = estilo_brl(df, ["LAT", "n"])
+    linhas = [l.split("|") for l in estilo.to_string(delimiter="|").splitlines()[1:]]
+    assert [l[1] for l in linhas] == [brl(v) for v in df["LAT"]]
+    assert [l[2] for l in linhas] == [brl(v) for v in df["n"]]
+    assert [l[3] for l in linhas] == list("abcd")
+    assert estilo.data["LAT"].dtype == float   # ordenação continua numérica
+
+
+def test_icms_por_mes_e_aliquota_efetiva():
+    import numpy as np
+    from calc import aliquota_efetiva_icms, icms_por_mes, matriz_cenarios, tabela_horizonte
+
+    df = pd.DataFrame({
+        "Data Emissão": ["05/01/2025", "06/01/2025", "07/01/2025", "08/01/2025", "03/02/2025"],
+        "Tipo Nota": ["Saída", "Saída", "Saída", "Entrada", "Saída"],
+        "Valor Total": ["1.000,00", "2.000,00", "500,00", "4.000,00", "1.000,00"],
+        "Classificação": ["", "", "", "Mercadoria para Revenda", ""],
+        "Natureza Operação": ["Venda"] * 5,
+        "CST ICMS": [0, "20", None, "00", 40.0],
+        "ICMS Valor": ["120,00", None, None, "999,00", "0,00"],
+        "ICMS Alíquota": [None, "12,00", None, "18,00", None],
+        "Redução BC": [None, "50,00", None, None, None],
+    })
+    tab = icms_por_mes(df)
+    assert tab[["yyyymm", "cst_icms"]].values.tolist() == [[202501, ""], [202501, "00"], [202501, "20"], [202502, "40"]]
+    t = tab.set_index(["yyyymm", "cst_icms"])
+    # Sem valor informado: base = FAT com redução de 50%, ICMS = base * 12%
+    assert t.loc[(202501, "20"), "ICMS_BASE"] == pytest.approx(1_000.0)
+    assert t.loc[(202501, "20"), "ICMS_VALOR"] == pytest.approx(120.0)
+    # Nota sem ICMS não entra na base da alíquota; entrada fica fora
+    assert t.loc[(202501, ""), "NOTAS_COM_ICMS"] == 0 and t.loc[(202501, ""), "FAT_COM_ICMS"] == 0.0
+    assert tab["FAT"].sum() == pytest.approx(4_500.0)
+
+    assert aliquota_efetiva_icms(tab, [202501]) == pytest.approx(240.0 / 3_000.0)
+    assert aliquota_efetiva_icms(tab) == pytest.approx(240.0 / 4_000.0)
+    assert aliquota_efetiva_icms(tab, [202503]) == 0.05
+    assert aliquota_efetiva_icms(icms_por_mes(df.drop(columns=["ICMS Valor", "ICMS Alíquota"]))) == 0.05
+
+    # Percentuais ≤ 1% continuam percentuais (1% e 0,5%, não 100% e 50%)
+    baixas = pd.DataFrame({
+        "Data Emissão": ["05/04/2025"] * 3,
+        "Tipo Nota": ["Saída"] * 3,
+        "Valor Total": ["1.000,00"] * 3,
+        "Classificação": [""] * 3,
+        "Natureza Operação": ["Venda"] * 3,
+        "ICMS Alíquota": ["1,00", "0,50", "12,00"],
+        "Redução BC": ["1,00", None, None],
+    })
+    tab_baixas = icms_por_mes(baixas)
+    assert tab_baixas["ICMS_BASE"].sum() == pytest.approx(990.0 + 1_000.0 + 1_000.0)
+    assert tab_baixas["ICMS_VALOR"].sum() == pytest.approx(9.90 + 5.0 + 120.0)
+    assert aliquota_efetiva_icms(tab_baixas) == pytest.approx(134.9 / 3_000.0)
+
+    # Base + delta: combinar_icms == tabela do arquivo concatenado
+    from calc import combinar_icms
+    juntas = combinar_icms(tab, tab_baixas, icms_por_mes(df.iloc[:0]))
+    pd.testing.assert_frame_equal(juntas, icms_por_mes(pd.concat([df, baixas], ignore_index=True)))
+
+    # Alíquota efetiva propagada às projeções
+    aliq = 0.06
+    grade = matriz_cenarios([202503], [100_000.0], aliquota_icms=aliq)
+    assert grade.cenarios_mes(202503)[20]["ICMS"] == pytest.approx(cenarios_fat_compra(100_000.0, aliquota_icms=aliq)[20]["ICMS"])
+    hor = tabela_horizonte({202503: 100_000.0}, margem=0.20, aliquota_icms=aliq)
+    np.testing.assert_allclose(hor["ICMS"], [aliq * 500_000.0])
+
+
+def test_relatorio_substituir_meses_equivale_a_revalidar_tudo():
+    from calc import preparar_com_qualidade
+
+    df = pd.DataFrame({
+        "Data Emissão": ["01/02/2025", "02/02/2025", "05/03/2025", "xx"],
+        "Tipo Nota": ["Foo", "Saída", "Foo", "Saída"],
+        "Valor Total": ["1,00", "abc", "2,00", "3,00"],
+        "Natureza Operação": ["Venda"] * 4,
+    })
+    _, antigo = preparar_com_qualidade(df)
+    # Março corrigido; fevereiro e a linha sem data continuam como estavam
+    novo_df = df.assign(**{"Tipo Nota": ["Foo", "Saída", "Saída", "Saída"]})
+    refeitas = novo_df["Data Emissão"].isin(["05/03/2025", "xx"])
+    _, parcial = preparar_com_qualidade(novo_df[refeitas])
+    combinado = antigo.substituir_meses(parcial, [0, 202503], len(novo_df))
+    _, esperado = preparar_com_qualidade(novo_df)
+
+    ordenar = lambda r: r.totais().sort_values(["problema", "coluna"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(ordenar(combinado), ordenar(esperado))
+    assert sorted(combinado.amostras["linha"]) == sorted(esperado.amostras["linha"])
+    assert combinado.total_linhas == 4
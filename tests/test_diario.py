@@ -0,0 +1,80 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calc import realizado_por_dia, realizado_por_mes
+from diario import AcompanhamentoDiario, comparar_com_cenario, projetar_fim_do_mes
+
+
+def _mes_de_exemplo(notas):
+    return notas([
+        ("03/06/2025", "Saída", "1.000,00"),
+        ("03/06/2025", "Entrada", "400,00", "Mercadoria para Revenda"),
+        ("10/06/2025", "Saída", "2.500,00"),
+        ("12/06/2025", "Entrada", "600,00", "Mercadoria para Revenda"),
+        ("15/05/2025", "Saída", "9.999,00"),
+    ])
+
+
+def test_realizado_por_dia_fecha_com_o_mensal(notas):
+    df = _mes_de_exemplo(notas)
+    serie = realizado_por_dia(df, 202506)
+    assert list(serie.index) == list(range(1, 31))
+    assert serie.loc[3, "FAT"] == 1_000.0 and serie.loc[3, "COMPRAS"] == 400.0
+    assert serie.loc[11, "FAT_ACUM"] == 3_500.0
+    fim = serie.iloc[-1]
+    mensal = realizado_por_mes(df, meses=[202506])[202506]
+    for c in ("FAT", "COMPRAS", "LAT"):
+        assert fim[f"{c}_ACUM"] == pytest.approx(mensal[c])
+    # Mês sem notas: série de zeros com o calendário completo
+    vazio = realizado_por_dia(df, 202502)
+    assert len(vazio) == 28 and vazio.to_numpy().sum() == 0.0
+
+
+def test_incremental_igual_a_reconstrucao_e_fingerprint_do_store(notas, tmp_path):
+    from agregados_store import AgregadoStore
+
+    df = _mes_de_exemplo(notas)
+    acomp = AcompanhamentoDiario(202506)
+    assert acomp.adicionar(df.iloc[:3], lote="a")
+    assert acomp.adicionar(df.iloc[3:], lote="b")
+    assert not acomp.adicionar(df.iloc[3:], lote="b")     # lote repetido é ignorado
+    assert acomp.ultimo_dia == 12
+
+    cheio = AcompanhamentoDiario.de_notas(df, 202506)
+    pd.testing.assert_frame_equal(acomp.serie(), cheio.serie())
+    pd.testing.assert_frame_equal(acomp.serie(), realizado_por_dia(df, 202506))
+
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    store.atualizar("x", df)
+    assert acomp.fingerprint == store.fingerprints("x")[202506]
+
+
+def test_projecao_calendario_e_dias_uteis(notas):
+    df = _mes_de_exemplo(notas)
+    serie = realizado_por_dia(df, 202506)
+    # 12 de 30 dias corridos
+    p = projetar_fim_do_mes(serie, 202506, 12)
+    assert p["FRACAO"] == pytest.approx(12 / 30)
+    assert p["FAT"] == pytest.approx(3_500.0 * 30 / 12)
+    assert p["LAT_ATE_AGORA"] == pytest.approx(2_500.0)
+    # Junho/2025: 21 dias úteis no mês, 9 até o dia 12 (inclusive)
+    p = projetar_fim_do_mes(serie, 202506, 12, dias_uteis=True)
+    assert p["FRACAO"] == pytest.approx(9 / 21)
+    assert p["COMPRAS"] == pytest.approx(1_000.0 * 21 / 9)
+    assert projetar_fim_do_mes(serie, 202506, 0)["FAT"] == 0.0
+
+
+def test_comparar_com_cenario():
+    proj = {"FAT": 120_000.0, "COMPRAS": 90_000.0, "LAT": 30_000.0}
+    cmp_ = comparar_com_cenario(proj, lat_plano=25_000.0, margem=0.25)
+    assert cmp_["FAT_CENARIO"] == pytest.approx(100_000.0)
+    assert cmp_["COMPRAS_CENARIO"] == pytest.approx(75_000.0)
+    assert cmp_["DIF_FAT"] == pytest.approx(20_000.0)
+    assert cmp_["DIF_LAT"] == pytest.approx(5_000.0)
+    assert cmp_["MARGEM_PROJETADA"] == pytest.approx(0.25)
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import nucleo
+
+# Orçamento de import do núcleo (processo novo, cache de bytecode já aquecido)
+LIMITE_IMPORT_S = 0.05
+
+_SCRIPT_IMPORT = """
+import json, sys, time
+t0 = time.perf_counter()
+import {modulo}
+dt = time.perf_counter() - t0
+pesados = [m for m in ("pandas", "numpy", "streamlit", "calc") if m in sys.modules]
+print(json.dumps({{"segundos": dt, "pesados": pesados}}))
+"""
+
+
+def _medir_import(modulo: str) -> dict:
+    # Primeira execução aquece o __pycache__; mede a melhor de algumas
+    medidas = []
+    for _ in range(3):
+        out = subprocess.run(
+            [sys.executable, "-c", _SCRIPT_IMPORT.format(modulo=modulo)],
+            cwd=RAIZ, capture_output=True, text=True, check=True,
+        )
+        medidas.append(json.loads(out.stdout))
+    return min(medidas, key=lambda m: m["segundos"])
+
+
+@pytest.mark.parametrize("modulo", ["nucleo", "ui_helpers"])
+def test_import_do_nucleo_e_leve_e_rapido(modulo):
+    medida = _medir_import(modulo)
+    assert medida["pesados"] == []
+    assert medida["segundos"] < LIMITE_IMPORT_S
+
+
+def test_nucleo_igual_ao_caminho_vetorizado_e_carga_tardia():
+    import calc
+
+    # calc reexporta as mesmas funções do núcleo
+    assert calc.irpj_csll_trimestre is nucleo.irpj_csll_trimestre
+    assert calc.meses_simulaveis is nucleo.meses_simulaveis
+
+    grade = calc.matriz_cenarios([0], [389_800.0], nucleo.MARGENS)
+    esperado = grade.cenarios_mes(0, nucleo.MARGENS)
+    for pct, c in nucleo.cenarios_fat_compra(389_800.0).items():
+        for k in ("FAT", "COMPRAS", "ICMS"):
+            assert c[k] == esperado[pct][k]
+
+    # Nomes de ingestão são resolvidos em calc sob demanda
+    assert nucleo.prepare_dataframe is calc.prepare_dataframe
+    with pytest.raises(AttributeError):
+        nucleo.nao_existe
@@ -0,0 +1,113 @@
+import os
+import sys
+import pandas as pd
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calc import irpj_csll_trimestre, tabela_horizonte
+from plano import PlanoIncremental, trimestre_de
+from ui_helpers import pis_cofins
+
+
+def _modelo(sim_vigente=True):
+    realizado = {202500 + m: {"FAT": 0.0, "COMPRAS": 0.0, "LAT": 10_000.0 if m <= 8 else 0.0} for m in range(1, 13)}
+    return PlanoIncremental(realizado, vigente_yyyymm=202508, sim_vigente=sim_vigente,
+                            meses=[202500 + m for m in range(1, 13)])
+
+
+def test_edicao_invalida_apenas_mes_e_trimestre():
+    modelo = _modelo()
+    antes = modelo.recalculos
+    assert modelo.set_lat(202511, 150_000.0)
+    # 1 mês + 1 trimestre recomputados
+    assert modelo.recalculos - antes == 2
+    # valor idêntico não recomputa
+    assert not modelo.set_lat(202511, 150_000.0)
+    assert modelo.recalculos - antes == 2
+    assert trimestre_de(202511) == 20254
+
+
+def test_totais_incrementais_batem_com_recalculo_completo():
+    modelo = _modelo()
+    modelo.atualizar_plano({202508: 5_000.0, 202509: 80_000.0, 202510: 200_000.0, 202512: -3_000.0})
+    modelo.set_lat(202510, 120_000.0)
+
+    lat = modelo.lat_por_mes()
+    assert lat[202508] == pytest.approx(15_000.0)  # vigente: realizado + simulado
+    trib = irpj_csll_trimestre(lat)
+    tot = modelo.totais()
+    assert tot["LAT"] == pytest.approx(sum(lat.values()))
+    assert tot["IRPJ"] == pytest.approx(sum(v[0] for v in trib.values()))
+    assert tot["CSLL"] == pytest.approx(sum(v[1] for v in trib.values()))
+    assert tot["PIS"] == pytest.approx(sum(pis_cofins(v)[0] for v in lat.values()))
+    assert tot["FAT"] == pytest.approx(sum(v / 0.20 for v in lat.values()))
+
+
+def test_tabela_vem_do_cache_e_bate_com_tabela_horizonte():
+    modelo = _modelo()
+    modelo.atualizar_plano({202509: 80_000.0, 202510: 200_000.0, 202512: -3_000.0})
+    tab = modelo.tabela()
+    ref = tabela_horizonte(modelo.lat_por_mes(), margem=0.20)
+    pd.testing.assert_frame_equal(tab, ref, check_dtype=False)
+    # Linha TOTAL das exportações do app: totais correntes == soma da tabela
+    assert modelo.totais() == pytest.approx(tab.drop(columns=["yyyymm", "LL"]).sum().to_dict())
+
+    # Sem edição: mesmo frame, nenhum derivado recomputado
+    antes = modelo.recalculos
+    assert modelo.tabela() is tab
+    assert modelo.recalculos == antes
+    # Edição num mês: só o mês e o trimestre dele são recomputados
+    modelo.set_lat(202511, 50_000.0)
+    assert modelo.tabela() is not tab
+    assert modelo.recalculos - antes == 2
+    assert modelo.tabela()["LAT"].sum() == pytest.approx(sum(modelo.lat_por_mes().values()))
+
+
+def test_mes_travado_ignora_plano():
+    modelo = _modelo(sim_vigente=False)
+    assert not modelo.set_lat(202508, 99_000.0)
+    assert modelo.lat_total(202508) == pytest.approx(10_000.0)
+
+
+def test_avaliar_planos_vetorizado_bate_com_modelo():
+    import numpy as np
+    from plano import avaliar_planos, compor_lat_efetivo, matriz_planos
+
+    meses = [202500 + m for m in range(1, 13)]
+    planos = [{202509: 80_000.0, 202510: 200_000.0}, {202508: 5_000.0, 202512: 300_000.0}]
+    lat_real = np.array([10_000.0 if m <= 8 else 0.0 for m in range(1, 13)])
+    lat = compor_lat_efetivo(matriz_planos(planos, meses), lat_real, meses, 202508, True)
+    df = avaliar_planos(["A", "B"], meses, lat)
+
+    for i, p in enumerate(planos):
+        modelo = _modelo()
+        modelo.atualizar_plano(p)
+        tot = modelo.totais()
+        linha = df.iloc[i]
+        assert linha["LAT"] == pytest.approx(tot["LAT"])
+        assert linha["IRPJ"] == pytest.approx(tot["IRPJ"])
+        assert linha["FAT (20%)"] == pytest.approx(tot["FAT"])
+        ll = tot["LAT"] - tot["PIS"] - tot["COFINS"] - tot["ICMS"] - tot["IRPJ"] - tot["CSLL"]
+        assert linha["Lucro Líquido (20%)"] == pytest.approx(ll)
+
+
+def test_derivados_batem_com_a_grade_do_modelo():
+    from calc import grade_margens
+
+    realizado = {202508: {"FAT": 40_000.0, "COMPRAS": 30_000.0, "LAT": 10_000.0}}
+    modelo = PlanoIncremental(realizado, vigente_yyyymm=202508, sim_vigente=True,
+                              meses=[202507, 202508, 202509, 202510], margens=grade_margens(0.01), aliquota_icms=0.12)
+    modelo.atualizar_plano({202508: 5_000.0, 202509: 80_000.0, 202510: -3_000.0})
+    grade = modelo.grade(modelo.margens)
+    for i, m in enumerate(modelo.meses):
+        d = modelo.derivados(m)
+        assert grade.LAT[i] == d["LAT"]
+        assert (grade.PIS[i], grade.COFINS[i]) == (d["PIS"], d["COFINS"])
+        for pct, c in grade.cenarios_mes(m, modelo.margens).items():
+            assert {k: c[k] for k in ("FAT", "COMPRAS", "ICMS")} == d["CENARIOS"][pct]
+    # "A emitir" do vigente desconta o realizado; passado fica NaN
+    j = list(grade.margens).index(0.20)
+    assert grade.FAT_EMITIR[1, j] == pytest.approx(15_000.0 / 0.20 - 40_000.0)
+    assert pd.isna(grade.FAT_EMITIR[0, j])
@@ -0,0 +1,60 @@
+import os
+import sys
+import sqlite3
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plano_store import PlanoStore
+
+
+def test_salvar_versiona_e_carrega_ultima(tmp_path):
+    store = PlanoStore(str(tmp_path / "planos.sqlite"))
+    assert store.salvar("emp", "base", {202509: 10_000.0}) == 1
+    assert store.salvar("emp", "base", {202509: 20_000.0}) == 2
+
+    assert store.carregar("emp", "base") == {202509: 20_000.0}
+    assert store.carregar("emp", "base", versao=1) == {202509: 10_000.0}
+    assert [p["versao"] for p in store.listar("emp")] == [2, 1]
+    # Isolamento por empresa
+    assert store.listar("outra") == []
+    with pytest.raises(KeyError):
+        store.carregar("outra", "base")
+
+
+def test_plano_continua_visivel_quando_o_horizonte_vira_o_ano(tmp_path):
+    store = PlanoStore(str(tmp_path / "planos.sqlite"))
+    store.salvar("emp", "base", {202510: 1.0, 202511: 2.0, 202512: 3.0, 202601: 4.0})
+    p, = store.listar("emp")
+    assert (p["inicio"], p["fim"]) == (202510, 202601)
+    # Horizonte que começa no ano seguinte ainda cobre jan/2026
+    assert [p["nome"] for p in store.listar("emp", [202601, 202602, 202603])] == ["base"]
+    assert store.listar("emp", [202602, 202603]) == []
+
+
+def test_migra_banco_com_chave_por_ano(tmp_path):
+    caminho = str(tmp_path / "planos.sqlite")
+    con = sqlite3.connect(caminho)
+    con.execute(
+        "CREATE TABLE planos (empresa TEXT NOT NULL, ano INTEGER NOT NULL, nome TEXT NOT NULL, versao INTEGER NOT NULL, "
+        "criado_em TEXT NOT NULL, descricao TEXT NOT NULL DEFAULT '', valores TEXT NOT NULL, "
+        "PRIMARY KEY (empresa, ano, nome, versao))"
+    )
+    con.executemany("INSERT INTO planos VALUES (?, ?, ?, ?, ?, '', ?)", [
+        ("emp", 2026, "base", 1, "2026-01-05T10:00:00", '{"202601": 3.0}'),
+        ("emp", 2025, "base", 1, "2025-01-05T10:00:00", '{"202501": 1.0}'),
+        ("emp", 2025, "base", 2, "2025-02-05T10:00:00", '{"202501": 2.0, "202502": 2.0}'),
+    ])
+    con.commit()
+    con.close()
+
+    store = PlanoStore(caminho)
+    # Versões do mesmo nome em anos diferentes viram uma sequência só, em ordem de ano
+    assert store.carregar("emp", "base", versao=1) == {202501: 1.0}
+    assert store.carregar("emp", "base", versao=2) == {202501: 2.0, 202502: 2.0}
+    assert store.carregar("emp", "base") == {202601: 3.0}
+    assert [(p["versao"], p["inicio"], p["fim"]) for p in store.listar("emp")] == [
+        (3, 202601, 202601), (2, 202501, 202502), (1, 202501, 202501),
+    ]
+    assert PlanoStore(caminho).salvar("emp", "base", {202602: 5.0}) == 4   # migração não se repete
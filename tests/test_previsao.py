@@ -0,0 +1,80 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# Garantir import dos módulos locais
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calc import horizonte_meses
+from previsao import prever_carteira, prever_series
+
+
+def test_recupera_tendencia_e_sazonalidade_em_lote():
+    hist = horizonte_meses(202201, 36)
+    fut = horizonte_meses(202501, 12)
+    rng = np.random.default_rng(1)
+    t = np.arange(48)
+    saz = np.array([0, 10, -5, 3, 8, -12, 4, 6, -2, -9, 1, -4], dtype=float) * 1_000
+    saz -= saz.mean()
+    inclinacao = rng.uniform(-800, 800, 200)[:, None]
+    verdade = 100_000 + inclinacao * t[None, :] + saz[t % 12][None, :]
+    y = verdade[:, :36] + rng.normal(0, 500, (200, 36))
+
+    p = prever_series(hist, y, fut, amortecimento=1.0)
+    assert p.media.shape == (200, 12)
+    erro = np.abs(p.media - verdade[:, 36:])
+    assert erro.mean() < 400 and erro.max() < 2_500
+    assert np.all(p.inferior < p.media) and np.all(p.media < p.superior)
+    assert p.sigma.mean() == pytest.approx(500.0, rel=0.05)
+    # Banda abre com o horizonte (mais incerteza mais longe)
+    largura = p.superior - p.inferior
+    assert np.all(largura[:, -1] > largura[:, 0])
+
+
+def test_historico_curto_e_meses_faltantes():
+    hist = [202501, 202502, 202503]
+    # 2 meses observados: sem tendência -> média dos observados; 0 observados -> zero
+    y = np.array([[10.0, 30.0, np.nan], [np.nan, np.nan, np.nan]])
+    p = prever_series(hist, y, [202504, 202505])
+    np.testing.assert_allclose(p.media[0], [20.0, 20.0])
+    np.testing.assert_allclose(p.media[1], [0.0, 0.0])
+    assert p.n_observados.tolist() == [2, 0]
+
+    # Menos de um ano: sem tendência (6 meses em alta viram a média, não uma rampa)
+    p = prever_series(horizonte_meses(202401, 6), np.arange(6, dtype=float) * 100, [202407, 202412])
+    np.testing.assert_allclose(p.media[0], [250.0, 250.0], atol=1e-3)
+
+    # Tendência amortecida: projeção converge em vez de crescer sem limite
+    hist = horizonte_meses(202401, 12)
+    p = prever_series(hist, np.arange(12, dtype=float) * 100, horizonte_meses(202501, 36))
+    passos = np.diff(p.media[0])
+    assert passos[0] > 0 and passos[-1] < passos[0] * 0.05
+    assert p.media[0, -1] < 1_100 + 100 * 0.9 / 0.1 + 1e-6
+
+
+def test_tendencia_parte_do_ultimo_mes_observado_de_cada_empresa():
+    hist = horizonte_meses(202301, 24)
+    rampa = np.arange(24, dtype=float) * 100
+    y = np.vstack([rampa, np.where(np.arange(24) < 12, rampa, np.nan)])
+    p = prever_series(hist, y, [202501])
+    # 'a' observada até dez/2024: 1 passo amortecido; 'b' parou em dez/2023: 13 passos,
+    # amortecidos desde o seu último mês (não uma reta até dez/2024 e só então amortecida)
+    amortecido = lambda h: 100 * 0.9 * (1 - 0.9 ** h) / 0.1
+    np.testing.assert_allclose(p.media[:, 0], [2_300 + amortecido(1), 1_100 + amortecido(13)], atol=1e-3)
+
+
+def test_prever_carteira_usa_historico_armazenado(notas, tmp_path):
+    from agregados_store import AgregadoStore
+
+    store = AgregadoStore(str(tmp_path / "agg.sqlite"))
+    datas = [f"10/{m:02d}/2025" for m in range(1, 7)]
+    for empresa, base in (("a", 1_000.0), ("b", 5_000.0)):
+        store.atualizar(empresa, notas([(d, "Saída", base) for d in datas]))
+
+    # Junho é o vigente (parcial): fica fora do ajuste
+    p = prever_carteira(store, 202506, [202507, 202508], "FAT")
+    assert p.empresas == ["a", "b"]
+    assert p.n_observados.tolist() == [5, 5]
+    np.testing.assert_allclose(p.media, [[1_000, 1_000], [5_000, 5_000]], atol=1e-3)
+    assert p.por_mes("b") == pytest.approx({202507: 5_000.0, 202508: 5_000.0}, abs=1e-3)
@@ -1,10 +1,18 @@
 from __future__ import annotations
 import math
-from typing import Dict
+from typing import Iterable
+
+# Cenários por margem e PIS/COFINS vivem no núcleo sem dependências (reexportados)
+from nucleo import cenarios_fat_compra, pis_cofins  # noqa: F401
 
 # =========================
 # Formatação BRL (pura)
 # =========================
+def _brl_numero(v: float) -> str:
+    """Corpo de brl para um float já validado (não NaN)."""
+    return "R$ " + f"{v:_.2f}".replace(".", ",").replace("_", ".")
+
+
 def brl(value: float | int | None) -> str:
     """
     Formata número como BRL com vírgula decimal e separador de milhar.
@@ -18,9 +26,36 @@ def brl(value: float | int | None) -> str:
             return "—"
     except Exception:
         return "—"
+    return _brl_numero(v)
+
+
+def brl_series(valores):
+    """
+    brl para colunas inteiras (Series, array ou lista): a conversão numérica é
+    vetorizada e cada valor passa pelo mesmo formatador de brl (idêntico a brl
+    inclusive para ±inf e valores enormes). NaN/não numéricos viram '—'.
+    Uma Series de entrada devolve Series com o mesmo índice.
+    """
+    import numpy as np   # import tardio: ui_helpers segue leve
+    import pandas as pd
 
-    s = f"{v:,.2f}"  # 1,234,567.89
-    return f"R$ {s}".replace(",", "X").replace(".", ",").replace("X", ".")
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores, dtype=object)
+    v = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    out = np.array(["—" if x != x else _brl_numero(x) for x in v.tolist()], dtype=object)
+    return pd.Series(out, index=serie.index, name=serie.name) if isinstance(valores, pd.Series) else out
+
+
+def estilo_brl(df, colunas: Iterable[str]):
+    """
+    Styler que exibe as colunas como brl ('R$ 1.234,56') mantendo o dtype numérico:
+    o st.dataframe mostra o texto formatado e ordena pelos números. (Os formatos
+    de NumberColumn não têm BRL: printf sai 'R$ 1234567.89'.)
+    Os textos saem de brl_series, uma vez por coluna; cada célula só consulta o
+    texto já pronto do seu valor.
+    Uso: st.dataframe(estilo_brl(df, ["LAT", "PIS"]))
+    """
+    textos = {c: dict(zip(df[c].tolist(), brl_series(df[c]).tolist())) for c in colunas}
+    return df.style.format({c: (lambda v, t=t: t.get(v, "—")) for c, t in textos.items()})
 
 
 # =========================
@@ -39,47 +74,3 @@ def yyyymm_to_label(yyyymm: int | str) -> str:
         return f"{meses[mes]}/{ano}"
     except Exception:
         return "—"
-
-
-# =========================
-# Cenários por margem (puro)
-# =========================
-_DEFAULT_MARGENS = (0.05, 0.10, 0.15, 0.20, 0.25, 0.30)
-
-def cenarios_fat_compra(LAT_mes: float, margens: tuple[float, ...] = _DEFAULT_MARGENS) -> Dict[int, Dict[str, float]]:
-    """
-    Para um LAT mensal, calcula cenários por margem r em {5%, 10%, ..., 30%}:
-
-      FAT = LAT / r
-      COMPRAS = FAT - LAT
-      ICMS = 5% * FAT  (exibição)
-
-    Retorna dict indexado pela margem em % (int):
-        {
-          5: {"FAT": ..., "COMPRAS": ..., "ICMS": ...},
-          10: {...},
-          ...
-        }
-    """
-    LAT = max(0.0, float(LAT_mes))
-    out: Dict[int, Dict[str, float]] = {}
-    for r in margens:
-        if r <= 0:
-            continue
-        fat = LAT / r
-        compras = fat - LAT
-        icms = 0.05 * fat
-        out[int(r * 100)] = {"FAT": fat, "COMPRAS": compras, "ICMS": icms}
-    return out
-
-
-# =========================
-# PIS / COFINS sobre LAT (puro)
-# =========================
-def pis_cofins(LAT_mes: float) -> tuple[float, float]:
-    """
-    PIS = 0,65% * LAT_mês
-    COFINS = 3% * LAT_mês
-    """
-    lat = max(0.0, float(LAT_mes))
-    return (0.0065 * lat, 0.03 * lat)